@@ -6,38 +6,50 @@
 #  - Subcategory header at top as usual
 # ============================================================
 
-import gspread
+# Google clients (gspread, googleapiclient, google.auth), requests and http.server are
+# imported where they are first needed, so offline and local-data runs never load them.
 import pandas as pd
-import os, re, shutil, tempfile, requests
-from datetime import datetime
+import numpy as np
+import os, re, io, sys, json, time, shutil, tempfile
+import argparse, logging
+import copy, hashlib, hmac, ipaddress, random, struct
+import multiprocessing, queue, threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
 from typing import Optional, Tuple, List
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import (
-    SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image,
+    SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer,
     PageBreak, Flowable, KeepInFrame
 )
+from reportlab.platypus.doctemplate import ActionFlowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase import pdfmetrics, pdfdoc, pdfutils
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.enums import TA_LEFT
-import html
-from reportlab.lib import colors
-from reportlab.platypus import Paragraph
-from reportlab.lib.styles import ParagraphStyle
-import re, html
-from googleapiclient.http import MediaFileUpload
-from reportlab.pdfbase import pdfmetrics
+from PIL import Image as PILImage
+try:
+    import resource   # peak RSS; not available on Windows
+except ImportError:
+    resource = None
+
+log = logging.getLogger('catalog')
+
+def _requests():
+    import requests
+    return requests
 
 # ---------- helpers ----------
 def _mm(v): return v * mm
 PAGE_W_MM, PAGE_H_MM = 210, 297
+TABLE2_GAP_MM = 14            # space between the top and bottom table of a TABLE2 page
+TABLE2_SAFETY_PT = _mm(1.5)   # slack kept when deciding whether two TABLE2 tables share a page
 
 def _norm(fmt: Optional[str]) -> str:
     if not fmt: return '2'
@@ -49,32 +61,83 @@ def _norm(fmt: Optional[str]) -> str:
     if f == '4A': return '4'
     return '2'
 
+# partial-build selectors accepted by generate_professional_pdf(select=...) / dry_run_layout
+SELECTOR_KEYS = ('categories', 'subcategories', 'group_ids', 'skus')
+SHEET_NAMES = ('Master', 'Master_Resolved', 'Master_With_Images', 'Remark')
+
+# ---------- shape icons ----------
+# span-tagged values ("<span>Half Round 200mm") get a shape icon; checked in this order
+_SHAPE_ICON_FILES = (
+    ('flat', 'Flat.png'),
+    ('half round', 'Half Round.png'),
+    ('round', 'Round.png'),
+    ('triangle', 'Triangle.png'),
+    ('square', 'Square.png'),
+)
+_SPAN_SHAPE_RE = re.compile(
+    r'\s*<span>\s*(?:' + '|'.join(
+        r'(?=.*?(?P<%s>%s))' % (key.replace(' ', '_'), re.escape(key)) for key, _ in _SHAPE_ICON_FILES
+    ) + r')?',
+    re.IGNORECASE | re.DOTALL,
+)
+ICON_SIZE = 12
+
+def _load_shape_icons() -> dict:
+    """Icon atlas, loaded once at startup: shape key -> PNG next to this script (missing files skipped)."""
+    base = os.path.dirname(os.path.abspath(__file__))
+    icons = {}
+    for key, fn in _SHAPE_ICON_FILES:
+        p = os.path.join(base, fn)
+        if os.path.exists(p):
+            icons[key] = p
+    return icons
+
+SHAPE_ICONS = _load_shape_icons()
+_MISSING_SHAPE_ICONS = set()   # shape keys already reported as missing
+
+def shape_icon(shape: Optional[str]) -> Optional[str]:
+    """
+    Icon path for a shape key. A missing PNG is logged once per shape and gives None, so the
+    value renders exactly like a plain text value (no icon, no width reserved for one).
+    """
+    path = SHAPE_ICONS.get(shape)
+    if path is None and shape and shape not in _MISSING_SHAPE_ICONS:
+        _MISSING_SHAPE_ICONS.add(shape)
+        log.warning(f"⚠️ Shape icon {dict(_SHAPE_ICON_FILES)[shape]} not found next to the script; "
+                    f"'{shape}' values render as plain text")
+    return path
+
+def match_shape_span(text) -> Optional[Tuple[Optional[str], str]]:
+    """(shape key or None, text without the tag) for a '<span>' value; None if not span-tagged."""
+    m = _SPAN_SHAPE_RE.match(str(text or ''))
+    if not m:
+        return None
+    shape = m.lastgroup.replace('_', ' ') if m.lastgroup else None
+    return shape, str(text)[m.end():].strip()
+
+def draw_shape_icon(canv, shape: str, x: float, y: float, size: float = ICON_SIZE):
+    """Draw a shape icon; each icon is one Form XObject per document, defined on first use."""
+    name = 'ShapeIcon_' + shape.replace(' ', '_')
+    if not canv.hasForm(name):
+        canv.beginForm(name, 0, 0, 1, 1)
+        canv.drawImage(SHAPE_ICONS[shape], 0, 0, 1, 1, mask='auto')
+        canv.endForm()
+    canv.saveState()
+    canv.translate(x, y); canv.scale(size, size)
+    canv.doForm(name)
+    canv.restoreState()
+
 def detect_shape_from_span(text: str) -> str:
     if not text:
         return ""
-
-    raw = str(text).strip()
-
-    if not raw.lower().startswith("<span>"):
+    span = match_shape_span(text)
+    if span is None:
         return str(text).strip()
-
-    cleaned = raw[6:].strip()
-
-    icon_map = {
-        "flat": "/workspaces/testing2/Flat.png",
-        "half round": "/workspaces/testing2/Half Round.png",
-        "round": "/workspaces/testing2/Round.png",
-        "triangle": "/workspaces/testing2/Triangle.png",
-        "square": "/workspaces/testing2/Square.png",
-    }
-
-    low = cleaned.lower()
-    for key, path in icon_map.items():
-        if key in low:
-            # IMPORTANT: ReportLab uses <image>, not <img>.
-            icon_tag = f'<image file="{path}" width="12"/>'
-            return f"{icon_tag} {cleaned}"
-
+    shape, cleaned = span
+    icon = shape_icon(shape)
+    if icon:
+        # IMPORTANT: ReportLab uses <image>, not <img>.
+        return f'<image file="{icon}" width="{ICON_SIZE}"/> {cleaned}'
     return cleaned
 
 def preprocess_size_data(size_text):
@@ -107,6 +170,194 @@ def _s(v: Optional[object]) -> str:
         pass
     return str(v).strip()
 
+# ---------- image formats ----------
+_IMAGE_MAGIC = (
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'), (b'GIF89a', '.gif'),
+    (b'II*\x00', '.tif'), (b'MM\x00*', '.tif'),
+    (b'BM', '.bmp'),
+)
+
+def sniff_image_ext(head: bytes) -> str:
+    """File extension for the image whose first bytes are `head` ('.jpg' when unknown, as before)."""
+    for magic, ext in _IMAGE_MAGIC:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return '.webp'
+    return '.jpg'
+
+def probe_image_size(path: str) -> Optional[Tuple[int, int]]:
+    """Pixel size from the file header only (PNG IHDR / JPEG SOF; PIL's lazy open for the rest)."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(24)
+            if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+                return struct.unpack('>II', head[16:24])
+            if head.startswith(b'\xff\xd8'):
+                f.seek(0)
+                info = pdfutils.readJPEGInfo(f)
+                return info[0], info[1]
+        with PILImage.open(path) as im:
+            return im.size
+    except Exception:
+        return None
+
+# ---------- image resampling ----------
+IMAGE_DPI_PRESETS = {'print': 300, 'web': 150, 'draft': 72}
+
+def _dpi_value(dpi):
+    return IMAGE_DPI_PRESETS.get(dpi, dpi) if isinstance(dpi, str) else dpi
+
+def _resample_image_file(src: str, dst: str, target_px: Tuple[int, int]) -> int:
+    """Process-pool worker: resample src to target_px pixels into dst, return bytes written."""
+    with PILImage.open(src) as im:
+        fmt = (im.format or '').upper()
+        im.draft(im.mode, target_px)   # JPEG: let the decoder downscale in the DCT domain first
+        out = im.resize(target_px, PILImage.LANCZOS)
+        if fmt == 'JPEG':
+            if out.mode not in ('RGB', 'L', 'CMYK'):
+                out = out.convert('RGB')
+            out.save(dst, 'JPEG', quality=90, optimize=True)
+        else:
+            out.save(dst, 'PNG')
+    return os.path.getsize(dst)
+
+# ---------- text measurement ----------
+class DraftFont(pdfmetrics.Font):
+    """
+    Built-in (never embedded) Type1 glyphs carrying another registered font's metrics:
+    text measures and advances exactly like that font, so draft pages break identically.
+    """
+    def __init__(self, name: str, face_name: str, metrics_font_name: str):
+        super().__init__(name, face_name, 'WinAnsiEncoding')
+        self.metrics_font = pdfmetrics.getFont(metrics_font_name)
+        widths = list(self.widths)
+        for code in range(256):
+            try:
+                ch = bytes([code]).decode('cp1252')
+            except UnicodeDecodeError:
+                continue
+            widths[code] = self.metrics_font.stringWidth(ch, 1000)
+        self.widths = widths
+
+    def stringWidth(self, text, size, encoding='utf8'):
+        return self.metrics_font.stringWidth(text, size, encoding)
+
+    def addObjects(self, doc):
+        super().addObjects(doc)
+        # standard fonts get no /Widths from reportlab; ours must, or viewers use Helvetica's
+        pdf_font = doc.idToObject['BasicFonts'].dict[doc.fontMapping[self.fontName][1:]]
+        pdf_font.FirstChar = 0
+        pdf_font.LastChar = 255
+        pdf_font.Widths = pdfdoc.PDFArray(self.widths)
+
+_GLYPH_WIDTHS = {}        # font name -> float64 array of per-codepoint advance widths (1/1000 em)
+_T1_TABLE_SPAN = 0x3000   # Type1 fonts are tabulated up to here; rarer codepoints fall back
+
+def glyph_width_table(font_name: str) -> np.ndarray:
+    """Per-codepoint advance widths for a registered font, built once per font name."""
+    table = _GLYPH_WIDTHS.get(font_name)
+    if table is None:
+        font = pdfmetrics.getFont(font_name)
+        face = getattr(font, 'face', None)
+        if face is not None and hasattr(face, 'charWidths'):
+            # TTF (Avenir): widths straight from the hmtx-derived map, gaps get the default width
+            cw = face.charWidths
+            table = np.full(max(cw, default=0) + 1, float(face.defaultWidth))
+            table[np.fromiter(cw.keys(), dtype=np.int64, count=len(cw))] = \
+                np.fromiter(cw.values(), dtype=np.float64, count=len(cw))
+        else:
+            # Type1 (Helvetica fallbacks): let reportlab resolve encoding/substitution per glyph once
+            table = np.array([font.stringWidth(chr(cp), 1000) for cp in range(_T1_TABLE_SPAN)])
+        _GLYPH_WIDTHS[font_name] = table
+    return table
+
+_TTF_CACHE = {}   # (font name, sha1 of the file) -> TTFont parsed in this process (forked workers inherit it)
+
+def register_ttf(name: str, path: str) -> bool:
+    """
+    Register a TTF once per process and file content: later generators (service, watch,
+    benchmark) and forked workers reuse the parsed font instead of parsing it again.
+    """
+    try:
+        with open(path, 'rb') as f:
+            key = (name, hashlib.sha1(f.read()).hexdigest())
+        font = _TTF_CACHE.get(key)
+        if font is None:
+            font = _TTF_CACHE[key] = TTFont(name, path)
+            _GLYPH_WIDTHS.pop(name, None)   # a different file may have had this name before
+        if pdfmetrics._fonts.get(name) is not font:
+            pdfmetrics.registerFont(font)
+        return True
+    except Exception:
+        return False
+
+def register_bundled_fonts() -> dict:
+    """Avenir faces shipped next to this script: family -> registered."""
+    base_path = os.path.dirname(os.path.abspath(__file__))
+    return {fam: os.path.exists(p) and register_ttf(fam, p)
+            for fam, p in ((f, os.path.join(base_path, f + '.ttf')) for f in ('Avenir-Black', 'Avenir-Book'))}
+
+_width_lock = threading.Lock()
+_width_meters = []   # RunMetrics currently counting measurements (RunMetrics.counting_width_helpers)
+
+def _count_widths(n: int):
+    if _width_meters:
+        for m in list(_width_meters):
+            m.count('helper_width_calls', n)
+
+def string_width(text, font_name: str, font_size: float) -> float:
+    """pdfmetrics.stringWidth, counted for the builds in progress."""
+    _count_widths(1)
+    return pdfmetrics.stringWidth(text, font_name, font_size)
+
+def measure_strings(strings, font_name: str, font_size: float) -> np.ndarray:
+    """Widths of many strings in one vectorized pass; same values as pdfmetrics.stringWidth."""
+    strings = [str(s or "") for s in strings]
+    if not strings:
+        return np.zeros(0)
+    _count_widths(len(strings))
+    table = glyph_width_table(font_name)
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    cps = np.frombuffer(''.join(strings).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    outside = cps >= len(table)
+    glyphs = table[np.where(outside, 0, cps)]
+    ends = np.cumsum(lengths)
+    totals = np.concatenate(([0.0], np.cumsum(glyphs)))
+    widths = (totals[ends] - totals[ends - lengths]) * 0.001 * font_size
+    if outside.any():
+        # strings with codepoints beyond the table are measured the slow way
+        seg = np.repeat(np.arange(len(strings)), lengths)
+        for i in np.unique(seg[outside]):
+            widths[i] = pdfmetrics.stringWidth(strings[i], font_name, font_size)
+    return widths
+
+class LayoutCache:
+    """Memo of measured layouts, least recently used entries dropped beyond max_entries."""
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        layout = self._entries.get(key)
+        if layout is not None:
+            self._entries.move_to_end(key)
+        return layout
+
+    def put(self, key, layout):
+        self._entries[key] = layout
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
 # ---------- custom flowables ----------
 class ItemNameTrailingLine(Flowable):
     def __init__(self, text, fontName, fontSize, lineColor=colors.black, gap_mm=4):
@@ -118,7 +369,7 @@ class ItemNameTrailingLine(Flowable):
     def wrap(self, availWidth, availHeight):
         self.availWidth = availWidth
         clean = re.sub(r'\([^>]*\)', '', self.raw_text).strip().upper()
-        c = pdfmetrics.stringWidth; text = clean; ellipsis = "…"
+        c = string_width; text = clean; ellipsis = "…"
         while c(text, self.fontName, self.fontSize) + self.gap > availWidth and len(text) > 1:
             text = text[:-1]
         if text != clean:
@@ -137,23 +388,965 @@ class ItemNameTrailingLine(Flowable):
             canv.line(start_x, y + self.fontSize * 0.35, end_x, y + self.fontSize * 0.35)
 
 class SetSubcategoryForFooter(Flowable):
-    def __init__(self, subcategory_text: str):
-        super().__init__(); self.sub = (subcategory_text or '').upper()
+    def __init__(self, subcategory_text: str, category: str = None, fmt: str = None):
+        super().__init__(); self.sub = (subcategory_text or '').upper(); self.category = category
+        self.fmt = fmt
     def wrap(self, w, h): return (0, 0)
-    def draw(self): setattr(self.canv, "_current_subcategory", self.sub)
+    def draw(self):
+        setattr(self.canv, "_current_subcategory", self.sub)
+        setattr(self.canv, "_current_category", self.category)
+        setattr(self.canv, "_current_format", self.fmt)
+
+# ---------- streaming output ----------
+class _FlushedObject(pdfdoc.PDFObject):
+    """Stand-in left behind once an object's bytes are on disk (keeps name + image size only)."""
+    def __init__(self, name, obj):
+        self.__InternalName__ = name
+        self.width = getattr(obj, 'width', None)
+        self.height = getattr(obj, 'height', None)
+
+class _ReferenceTable(dict):
+    """idToObjectNumberAndVersion that, while `missing` is a set, records unknown names there."""
+    missing = None
+
+    def __missing__(self, name):
+        if self.missing is None:
+            raise KeyError(name)
+        self.missing.add(name)
+        return (0, 0)
+
+class _StreamingPDFFile(pdfdoc.PDFFile):
+    """PDFFile that writes straight to an open file handle instead of buffering."""
+    def __init__(self, fh, pdfVersion):
+        super().__init__(pdfVersion)
+        for s in self.strings: fh.write(s)
+        self.strings = []
+        self.write = fh.write
+
+class StreamingPDFDocument(pdfdoc.PDFDocument):
+    """
+    PDFDocument that serializes each finished page (content stream, images, page dict)
+    as soon as the canvas closes it. Only object offsets stay resident until save();
+    the page tree, catalog, info, outlines and font dictionaries are written last
+    because they keep changing while the document grows.
+    """
+    @classmethod
+    def adopt(cls, doc, filename):
+        doc.__class__ = cls
+        doc._out_target = filename
+        doc._out_fh = None
+        doc._out_file = None
+        doc._scanned = 0
+        doc._late = []          # object numbers of _is_late objects, written by the final flush
+        doc._unresolved = {}    # object number -> names (or unbound destinations) it is waiting for
+        doc.idToObjectNumberAndVersion = _ReferenceTable(doc.idToObjectNumberAndVersion)
+        return doc
+
+    def _stream_file(self):
+        if self._out_file is None:
+            target = self._out_target
+            if hasattr(getattr(target, 'write', None), '__call__'):
+                self._out_fh, self._owns_fh = target, False
+            else:
+                self._out_fh, self._owns_fh = open(target, 'wb'), True
+            self._out_file = _StreamingPDFFile(self._out_fh, self._pdfVersion)
+        return self._out_file
+
+    def _is_late(self, oid, obj):
+        return (oid == pdfdoc.BasicFonts or obj is self.Pages or obj is self.Catalog
+                or obj is self.info or obj is self.Outlines)
+
+    def _format_object(self, oid, obj):
+        """
+        (bytes, None), or (None, missing) when obj refers to objects not registered yet, or is
+        a link to a bookmark that is not placed yet (its Destination is still unbound).
+        """
+        dest = getattr(obj, 'Destination', None)
+        if isinstance(dest, pdfdoc.Destination) and (dest.fmt is None or dest.page is None):
+            return None, {dest}
+        refs = self.idToObjectNumberAndVersion
+        refs.missing = set()
+        try:
+            data = pdfdoc.PDFIndirectObject(oid, obj).format(self)
+            missing = refs.missing
+        finally:
+            refs.missing = None
+        return (None, missing) if missing else (data, None)
+
+    def _write_object(self, File, oid, obj, data):
+        self.idToOffset[oid] = File.add(data)
+        stub = _FlushedObject(oid, obj)
+        self.idToObject[oid] = stub
+        if isinstance(obj, pdfdoc.PDFPage):
+            pages = self.Pages.pages
+            for i in range(len(pages) - 1, -1, -1):
+                if pages[i] is obj:
+                    pages[i] = stub
+                    break
+
+    def flush_pages(self, final=False):
+        """Write every object registered so far that can no longer change."""
+        File = self.__accum__ = self._stream_file()
+        refs = self.idToObjectNumberAndVersion
+        pending = deque(self._late if final else ())
+        if final:
+            self._late = []
+        for num, missing in list(self._unresolved.items()):
+            if final or all((m.fmt is not None and m.page is not None) if isinstance(m, pdfdoc.Destination)
+                            else m in refs for m in missing):
+                del self._unresolved[num]
+                pending.append(num)
+        while True:
+            if pending:
+                num = pending.popleft()
+            elif self._scanned < self.objectcounter:
+                self._scanned += 1
+                num = self._scanned
+            else:
+                break
+            oid = self.numberToId[num]
+            obj = self.idToObject[oid]
+            if isinstance(obj, _FlushedObject):
+                continue
+            if not final and self._is_late(oid, obj):
+                self._late.append(num)
+                continue
+            if final:   # everything exists now: an unknown name raises like reportlab does
+                data = pdfdoc.PDFIndirectObject(oid, obj).format(self)
+            else:
+                data, missing = self._format_object(oid, obj)
+                if missing:   # forward reference: wait until those names are registered / bound
+                    self._unresolved[num] = missing
+                    continue
+            self._write_object(File, oid, obj, data)
+        del self.__accum__
+
+    def format(self):
+        self.encrypt.prepare(self)
+        cat = self.Catalog; info = self.info
+        self.Reference(cat); self.Reference(info)
+        encryptref = None
+        encryptinfo = self.encrypt.info()
+        if encryptinfo:
+            encryptref = self.Reference(encryptinfo)
+        self.flush_pages(final=True)
+        File = self._stream_file()
+        lno = len(self.numberToId)
+        xref = pdfdoc.PDFCrossReferenceTable()
+        xref.addsection(0, [self.numberToId[n] for n in range(1, lno + 1)])
+        xrefoffset = File.add(xref.format(self))
+        trailer = pdfdoc.PDFTrailer(
+            startxref=xrefoffset, Size=lno + 1,
+            Root=self.Reference(cat), Info=self.Reference(info),
+            Encrypt=encryptref, ID=self.ID(),
+        )
+        File.add(trailer.format(self))
+        return b''
+
+    def SaveToFile(self, filename, canvas):
+        if getattr(self, '_savedToFile', False):
+            raise RuntimeError("class %s instances can only be saved once" % self.__class__.__name__)
+        self._savedToFile = True
+        self.GetPDFData(canvas)
+        if self._owns_fh:
+            self._out_fh.close()
+        else:
+            self._out_fh.flush()
 
 class FooterCanvas(canvas.Canvas):
     def __init__(self, *args, **kwargs):
         self.generator = kwargs.pop('generator', None)
         self.raw_data = kwargs.pop('raw_data', None)
         self.doc_ref = kwargs.pop('doc_ref', None)
+        self.stream_pages = kwargs.pop('stream_pages', False)
+        self.sinks = kwargs.pop('sinks', ())
         super().__init__(*args, **kwargs)
+        if self.stream_pages:
+            StreamingPDFDocument.adopt(self._doc, self._filename)
+        self._image_draws = {}    # image XObject name -> (name, path, drawn (w, h) or None in a form, mask)
+        self._form_objects = {}   # form XObject name -> (name, PDFFormXObject) as first built
+        self._in_form = False
     def draw_footer_now(self):
         sub = getattr(self, "_current_subcategory", "")
         if self.generator and self.doc_ref:
             self.generator._draw_footer(self, self.doc_ref, self.raw_data, sub)
-    def showPage(self): self.draw_footer_now(); super().showPage()
-    def save(self): self.draw_footer_now(); super().save()
+    def drawImage(self, image, x, y, width=None, height=None, mask=None, *args, **kwargs):
+        res = super().drawImage(image, x, y, width, height, mask, *args, **kwargs)
+        if self.sinks and isinstance(image, str):
+            name = self._formsinuse[-1]
+            box = None if self._in_form else (width, height)   # form units are not page points
+            self._image_draws.setdefault(self._doc.getXObjectName(name), (name, image, box, mask))
+        return res
+    def beginForm(self, name, *args, **kwargs):
+        super().beginForm(name, *args, **kwargs); self._in_form = True
+    def endForm(self, **extra):
+        name = self._formData[0]
+        super().endForm(**extra); self._in_form = False
+        if self.sinks:
+            reg = self._doc.getXObjectName(name)
+            self._form_objects[reg] = (name, copy.copy(self._doc.idToObject[reg]))   # before any flush formats it
+    def showPage(self):
+        self.draw_footer_now(); super().showPage()
+        if self.generator:
+            self.generator.metrics.page_done(getattr(self, "_current_category", None),
+                                             getattr(self, "_current_format", None))
+        for sink in self.sinks:
+            sink.add_page(self._doc.Pages.pages[-1], self)
+        if self.stream_pages: self._doc.flush_pages()
+    def save(self):
+        self.draw_footer_now()
+        if self.sinks:
+            if len(self._code): self.showPage()   # Canvas.save would close it without the sinks
+            for sink in self.sinks:
+                sink.adopt_fonts(self._doc)
+        super().save()
+        for sink in self.sinks:
+            sink.save(self)
+
+# ---------- multi-target output ----------
+class _PageSink:
+    """
+    Extra output fed the primary canvas's finished pages. Content streams are shared as-is;
+    the sink keeps its own PDFDocument, page compression and image resolution, re-creating
+    each image XObject under the same name from generator.image_variant().
+    """
+    def __init__(self, path, generator, image_dpi=None, compress=True, stream=False):
+        self.path, self.generator = path, generator
+        self.image_dpi, self.compress, self.stream = image_dpi, compress, stream
+        self.doc = pdfdoc.PDFDocument(compression=compress)
+        if stream:
+            StreamingPDFDocument.adopt(self.doc, path)
+        self.pages = 0
+
+    @staticmethod
+    def _unregistered_copy(obj):
+        obj = copy.copy(obj)
+        obj.__dict__.pop('__InternalName__', None)   # registered in the primary document only
+        return obj
+
+    def add_page(self, page, canv):
+        page = self._unregistered_copy(page)
+        page.setCompression(self.compress)
+        self._add_xobjects(page.XObjects, canv)
+        self.doc.addPage(page)
+        self.pages += 1
+        if self.stream: self.doc.flush_pages()
+
+    def _add_xobjects(self, xobjects, canv):
+        for ref in (xobjects.dict.values() if xobjects else ()):
+            reg = ref.name
+            if reg in self.doc.idToObject:
+                continue
+            if reg in canv._form_objects:
+                name, form = canv._form_objects[reg]
+                form = self._unregistered_copy(form); form.compression = self.compress
+                self._add_xobjects(form.XObjects, canv)
+                self.doc.addForm(name, form)
+                continue
+            name, path, box, mask = canv._image_draws[reg]
+            if box is not None:
+                path = self.generator.image_variant(path, box[0], box[1], self.image_dpi)
+            img = pdfdoc.PDFImageXObject(name, path, mask=mask)
+            img.name = name
+            self.doc.addForm(name, img)
+            smask = getattr(img, '_smask', None)
+            if smask:   # as Canvas.drawImage does for soft masks
+                m_reg = self.doc.getXObjectName(smask.name)
+                img.smask = (pdfdoc.PDFObjectReference(m_reg) if m_reg in self.doc.idToObject
+                             else self.doc.Reference(smask, m_reg))
+                del img._smask
+
+    def adopt_fonts(self, primary):
+        """Register the primary's fonts under the same internal names (TTF subsets are shared)."""
+        for font_name in primary.fontMapping:
+            font = pdfmetrics.getFont(font_name)
+            if isinstance(font, TTFont):
+                font.state[self.doc] = font.state[primary]
+                self.doc.fontMapping[font_name] = primary.fontMapping[font_name]
+                self.doc.delayedFonts.append(font)
+            else:
+                font.addObjects(self.doc)
+        self.doc.info = copy.copy(primary.info)
+
+    def save(self, canv):
+        self.doc.SaveToFile(self.path, canv)
+
+    def outputs(self):
+        return [self.path]
+
+class _CategorySplitSink:
+    """One _PageSink per category, created as its first page arrives; the main cover is skipped."""
+    def __init__(self, path_template, generator, **sink_kwargs):
+        self.path_template, self.generator, self.sink_kwargs = path_template, generator, sink_kwargs
+        self.image_dpi = sink_kwargs.get('image_dpi')
+        self.parts = {}
+
+    def add_page(self, page, canv):
+        cat = getattr(canv, '_current_category', None)
+        if not cat:
+            return
+        if cat not in self.parts:
+            slug = re.sub(r'[^A-Za-z0-9]+', '_', cat).strip('_') or 'CATEGORY'
+            path = self.path_template.format(category=slug)
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.parts[cat] = _PageSink(path, self.generator, **self.sink_kwargs)
+        self.parts[cat].add_page(page, canv)
+
+    def adopt_fonts(self, primary):
+        for part in self.parts.values():
+            part.adopt_fonts(primary)
+
+    def save(self, canv):
+        for part in self.parts.values():
+            part.save(canv)
+
+    def outputs(self):
+        return [part.path for part in self.parts.values()]
+
+# ---------- output post-processing ----------
+def first_page_bytes(path: str) -> int:
+    """Bytes a progressive viewer must fetch before page 1 renders: the linearization
+    dictionary's /E offset when linearized, otherwise the whole file."""
+    with open(path, 'rb') as f:
+        head = f.read(2048)
+    m = re.search(rb'/Linearized\b.*?/E\s+(\d+)', head, re.S)
+    return int(m.group(1)) if m else os.path.getsize(path)
+
+def _strip_ascii85(pdf) -> int:
+    """Drop ReportLab's ASCII85 transport layer from every stream (lossless; ~20% of each stream)."""
+    import pikepdf
+    n = 0
+    for obj in pdf.objects:
+        if not isinstance(obj, pikepdf.Stream):
+            continue
+        filters = obj.get('/Filter')
+        filters = list(filters) if isinstance(filters, pikepdf.Array) else [filters]
+        if filters[0] != '/ASCII85Decode':
+            continue
+        parms = obj.get('/DecodeParms')
+        rest_parms = list(parms)[1:] if isinstance(parms, pikepdf.Array) else None
+        obj.Filter = pikepdf.Name.ASCII85Decode   # let qpdf undo just this layer
+        if parms is not None: del obj.DecodeParms
+        data, rest = obj.read_bytes(), filters[1:]
+        if not rest:
+            obj.write(data)
+        elif len(rest) == 1:
+            obj.write(data, filter=rest[0], decode_parms=rest_parms[0] if rest_parms else None)
+        else:
+            obj.write(data, filter=pikepdf.Array(rest),
+                      decode_parms=pikepdf.Array(rest_parms) if rest_parms else None)
+        n += 1
+    return n
+
+def optimize_pdf(path: str, linearize: bool = True, object_streams: bool = True,
+                 compress_level: int = None, link_mbps: float = 20.0) -> Optional[dict]:
+    """
+    Rewrite `path` in place for web delivery (needs pikepdf): ASCII85 layers removed,
+    optionally linearized (page 1 first, fast web view), objects packed into compressed
+    object/xref streams, and Flate streams recompressed at compress_level (0-9).
+    Returns before/after size, first-page bytes and the first-page time at link_mbps.
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        log.warning("❌ pikepdf is not installed (pip install pikepdf); PDF left unoptimized")
+        return None
+    t0 = time.perf_counter()
+    before, before_first = os.path.getsize(path), first_page_bytes(path)
+    tmp = path + '.opt'
+    if compress_level is not None:
+        pikepdf.settings.set_flate_compression_level(compress_level)
+    try:
+        with pikepdf.open(path) as pdf:
+            _strip_ascii85(pdf)
+            pdf.save(tmp, linearize=linearize, recompress_flate=compress_level is not None,
+                     object_stream_mode=(pikepdf.ObjectStreamMode.generate if object_streams
+                                         else pikepdf.ObjectStreamMode.preserve))
+    finally:
+        if compress_level is not None:
+            pikepdf.settings.set_flate_compression_level(-1)
+    os.replace(tmp, path)
+    after, after_first = os.path.getsize(path), first_page_bytes(path)
+    bps = link_mbps * 1e6 / 8
+    report = {'path': path, 'bytes_before': before, 'bytes_after': after,
+              'first_page_bytes_before': before_first, 'first_page_bytes_after': after_first,
+              'first_page_s_before': round(before_first / bps, 2),
+              'first_page_s_after': round(after_first / bps, 2),
+              'link_mbps': link_mbps, 'elapsed_s': round(time.perf_counter() - t0, 3)}
+    log.info(f"📦 Optimized {os.path.basename(path)}: {before/1048576:.1f} MB -> {after/1048576:.1f} MB, "
+             f"first page after {report['first_page_s_before']}s -> {report['first_page_s_after']}s "
+             f"at {link_mbps:g} Mbit/s ({report['elapsed_s']}s)", extra={'optimize': report})
+    return report
+
+# ---------- Google credentials ----------
+GOOGLE_SCOPES = ('https://www.googleapis.com/auth/spreadsheets',
+                 'https://www.googleapis.com/auth/drive')
+TOKEN_CACHE_DIR = os.getenv('CATALOG_TOKEN_CACHE') or os.path.join(os.path.expanduser('~'), '.cache', 'professional_catalog')
+TOKEN_MIN_TTL_S = 300   # a cached token closer than this to expiry is minted again
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)   # google-auth keeps expiry naive UTC
+
+def _token_cache_path(creds) -> str:
+    key = hashlib.sha1(f"{creds.service_account_email}|{' '.join(sorted(creds.scopes or ()))}".encode()).hexdigest()
+    return os.path.join(TOKEN_CACHE_DIR, f"token_{key[:16]}.json")
+
+def load_service_account_credentials(credentials_path: str, scopes=GOOGLE_SCOPES):
+    """
+    Service-account credentials, pre-loaded with the access token a previous invocation cached
+    if it is still valid for TOKEN_MIN_TTL_S: the first API call then needs no token exchange.
+    """
+    from google.oauth2.service_account import Credentials
+    creds = Credentials.from_service_account_file(credentials_path, scopes=list(scopes))
+    try:
+        with open(_token_cache_path(creds), encoding='utf-8') as f:
+            cached = json.load(f)
+        expiry = datetime.fromisoformat(cached['expiry'])
+        if (expiry - _utcnow()).total_seconds() > TOKEN_MIN_TTL_S:
+            creds.token, creds.expiry = cached['token'], expiry
+    except (OSError, ValueError, KeyError):
+        pass
+    return creds
+
+def store_token_cache(creds):
+    """Write creds' access token (owner-only file, replaced atomically) if it is new and still valid."""
+    token, expiry = getattr(creds, 'token', None), getattr(creds, 'expiry', None)
+    if not token or not expiry or (expiry - _utcnow()).total_seconds() <= TOKEN_MIN_TTL_S:
+        return
+    path = _token_cache_path(creds)
+    try:
+        with open(path, encoding='utf-8') as f:
+            if json.load(f).get('token') == token:
+                return
+    except (OSError, ValueError):
+        pass
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+        json.dump({'token': token, 'expiry': expiry.isoformat()}, f)
+    os.replace(tmp, path)
+
+# ---------- sharded sheet reads ----------
+class ShardedSheetReader:
+    """
+    Reads worksheets as row-range shards (A1:Z5001, A5002:Z10001, ...) on a bounded thread pool
+    (max_workers = concurrent Sheets requests, keep it within the read quota). Shards of all
+    opened sheets are queued interleaved, so row N of every sheet arrives at about the same
+    time; each sheet's records are yielded in row order, with the same header/padding/
+    numericise rules as gspread's get_all_records. A failing shard is retried on its own with
+    exponential backoff; open() returns once every shard is in, so a shard that still fails
+    fails its sheet (logged, read as empty) before any record is merged. Worksheets only need
+    title, row_count, col_count and get(a1_range) -> rows, so a local fake can stand in for
+    gspread.
+    """
+    def __init__(self, shard_rows: int = 5000, max_workers: int = 4, retries: int = 4, backoff_s: float = 1.0):
+        self.shard_rows, self.max_workers = shard_rows, max_workers
+        self.retries, self.backoff_s = retries, backoff_s
+        self.requests = 0
+
+    def _ranges(self, ws):
+        from gspread.utils import rowcol_to_a1
+        last_col = re.sub(r'\d+', '', rowcol_to_a1(1, max(1, ws.col_count)))
+        # the first shard carries the header row as well
+        bounds = [(1, min(ws.row_count, self.shard_rows + 1))]
+        while bounds[-1][1] < ws.row_count:
+            start = bounds[-1][1] + 1
+            bounds.append((start, min(ws.row_count, start + self.shard_rows - 1)))
+        return [(f"A{a}:{last_col}{b}", b - a + 1) for a, b in bounds]
+
+    def _fetch(self, ws, a1):
+        for attempt in range(self.retries + 1):
+            try:
+                self.requests += 1
+                return list(ws.get(a1))
+            except Exception as e:
+                if attempt == self.retries:
+                    raise RuntimeError(f"reading {ws.title}!{a1} failed: {e}") from e
+                time.sleep(self.backoff_s * 2 ** attempt)
+
+    def open(self, worksheets) -> dict:
+        """title -> iterator of records; all shard reads are queued at once and waited for."""
+        plans = {ws.title: self._ranges(ws) for ws in worksheets}
+        futures = {title: [] for title in plans}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for k in range(max(map(len, plans.values()), default=0)):
+                for ws in worksheets:
+                    if k < len(plans[ws.title]):
+                        futures[ws.title].append(pool.submit(self._fetch, ws, plans[ws.title][k][0]))
+        out = {}
+        for title, shards in futures.items():
+            failed = next((f.exception() for f in shards if f.exception() is not None), None)
+            if failed is not None:
+                log.error(f"❌ Error loading {title}: {failed}")
+                out[title] = iter(())
+            else:
+                out[title] = self._records(shards, [n for _, n in plans[title]])
+        return out
+
+    @staticmethod
+    def records(values):
+        """Records of one whole-sheet values read (header row first), same rules as open()."""
+        values = list(values)
+        while values and not any(values[-1]):   # trailing blank rows are never records
+            values.pop()
+        shard = Future()
+        shard.set_result(values)
+        return ShardedSheetReader._records([shard], [len(values)])
+
+    @staticmethod
+    def _records(futures, shard_lens):
+        from gspread.utils import numericise_all
+        header, blank_run = None, 0
+        for k, fut in enumerate(futures):
+            rows = fut.result()
+            futures[k] = None   # drop the shard once decoded
+            if k == 0:
+                if not rows:
+                    return
+                header, rows = rows[0], rows[1:]
+                dupes = sorted({h for h in header if header.count(h) > 1})
+                if dupes:
+                    raise ValueError(f"the header row contains duplicates: {dupes}")
+                expected = shard_lens[0] - 1
+            else:
+                expected = shard_lens[k]
+            if rows:
+                # rows left out at the end of earlier shards were blank, but not trailing
+                for _ in range(blank_run):
+                    yield dict(zip(header, [''] * len(header)))
+                blank_run = 0
+            for row in rows:
+                row = list(row) + [''] * (len(header) - len(row))
+                yield dict(zip(header, numericise_all(row, False, '', False, [])))
+            blank_run += expected - len(rows)
+
+# ---------- resumable upload ----------
+DRIVE_UPLOAD_URL = 'https://www.googleapis.com/upload/drive/v3/files'
+UPLOAD_QUANTUM = 256 * 1024   # Drive wants every chunk but the last in multiples of 256 KiB
+
+class GrowingFile:
+    """Read side of a file that is still being written: read() waits for bytes until finish()."""
+    def __init__(self, path: str, poll_s: float = 0.05):
+        self.path, self.poll_s = path, poll_s
+        self._done = threading.Event()
+        self._aborted = False
+        self._fh = None
+
+    def finish(self):
+        self._done.set()
+
+    def abort(self):
+        """The writer failed: read() raises, so a partial file is never committed as complete."""
+        self._aborted = True
+        self._done.set()
+
+    def read(self, n: int) -> bytes:
+        out = b''
+        while len(out) < n:
+            done = self._done.is_set()   # sampled before reading, so the last bytes are never missed
+            if self._aborted:
+                raise Exception(f"{self.path}: writer aborted")
+            if self._fh is None and os.path.exists(self.path):
+                self._fh = open(self.path, 'rb')
+            chunk = self._fh.read(n - len(out)) if self._fh else b''
+            if chunk:
+                out += chunk
+            elif done:
+                break
+            else:
+                time.sleep(self.poll_s)
+        return out
+
+    def close(self):
+        if self._fh: self._fh.close()
+
+class ResumableUpload:
+    """
+    Drive resumable upload session fed from any readable stream (open file, BytesIO,
+    GrowingFile). Chunks go out as they are read and the total size is only declared with
+    the last one. Just the unacknowledged tail is buffered: after a dropped connection or
+    a 5xx the session is asked for its acknowledged offset and sending resumes from there.
+    `session` is requests-compatible (AuthorizedSession for Drive, any Session for a fake).
+    """
+    def __init__(self, session, metadata: dict, mimetype: str = 'application/pdf',
+                 upload_url: str = DRIVE_UPLOAD_URL, chunk_size: int = 32 * UPLOAD_QUANTUM,
+                 max_retries: int = 5, backoff_s: float = 1.0, timeout_s: float = 120):
+        self.session, self.metadata, self.mimetype = session, metadata, mimetype
+        self.upload_url = upload_url
+        self.chunk_size = max(UPLOAD_QUANTUM, chunk_size // UPLOAD_QUANTUM * UPLOAD_QUANTUM)
+        self.max_retries, self.backoff_s, self.timeout_s = max_retries, backoff_s, timeout_s
+        self.session_uri = None
+        self.retries = 0
+
+    def start(self):
+        r = self.session.post(self.upload_url, params={'uploadType': 'resumable', 'fields': 'id'},
+                              json=self.metadata, headers={'X-Upload-Content-Type': self.mimetype},
+                              timeout=self.timeout_s)
+        r.raise_for_status()
+        self.session_uri = r.headers['Location']
+
+    def upload(self, stream) -> dict:
+        """Send everything `stream` yields; returns the created file's JSON (e.g. {'id': ...})."""
+        if self.session_uri is None:
+            self.start()
+        buf, offset, eof = b'', 0, False   # buf starts at `offset`, the server's acknowledged size
+        while True:
+            while not eof and len(buf) < self.chunk_size:
+                data = stream.read(self.chunk_size - len(buf))
+                eof = not data
+                buf += data
+            if eof:
+                send, total = buf, offset + len(buf)
+            else:
+                send, total = buf[:len(buf) // UPLOAD_QUANTUM * UPLOAD_QUANTUM], '*'
+            r = self._put(send, offset, total)
+            if r.status_code in (200, 201):
+                return r.json()
+            acked = self._acknowledged(r)
+            if eof and not send and acked == offset:
+                raise Exception(f"Upload of {offset} bytes was never completed by the server")
+            buf, offset = buf[acked - offset:], acked
+
+    def _put(self, data: bytes, offset: int, total):
+        rng = f'bytes {offset}-{offset + len(data) - 1}/{total}' if data else f'bytes */{total}'
+        for attempt in range(self.max_retries + 1):
+            try:
+                r = self.session.put(self.session_uri, data=data, headers={'Content-Range': rng},
+                                     timeout=self.timeout_s, allow_redirects=False)
+                if r.status_code in (200, 201, 308):
+                    return r
+                if r.status_code < 500 and r.status_code != 429:
+                    r.raise_for_status()   # 404/410: the session is gone, the stream cannot be replayed
+            except (_requests().ConnectionError, _requests().Timeout):
+                pass
+            if attempt == self.max_retries:
+                break
+            self.retries += 1
+            time.sleep(self.backoff_s * 2 ** attempt)
+            status = self._status(total)
+            if status is not None:
+                return status
+        raise Exception(f"Upload failed after {self.max_retries} retries at byte {offset}")
+
+    def _status(self, total):
+        """The session's current state (308 with Range, or 200/201 if complete); None if unreachable."""
+        try:
+            r = self.session.put(self.session_uri, headers={'Content-Range': f'bytes */{total}'},
+                                 timeout=self.timeout_s, allow_redirects=False)
+        except (_requests().ConnectionError, _requests().Timeout):
+            return None
+        return r if r.status_code in (200, 201, 308) else None
+
+    @staticmethod
+    def _acknowledged(r) -> int:
+        m = re.match(r'bytes=0-(\d+)', r.headers.get('Range', ''))
+        return int(m.group(1)) + 1 if m else 0
+
+# ---------- page packing ----------
+PAGE_PACKERS = ('greedy', 'optimal', 'tight')
+
+def pack_pages(gids: List[str], per_page: int, minimize: str = 'splits') -> List[int]:
+    """
+    Page sizes for items kept in catalog order, each page 1..per_page consecutive items.
+    gids holds each item's Group ID ('' = ungrouped); a page break between two items with
+    the same Group ID splits that group.
+    minimize='splits': fewest splits (only groups larger than a page are broken), then fewest pages.
+    minimize='pages':  fewest pages, then fewest splits.
+    Dynamic program over the break positions, O(len(gids) * per_page).
+    """
+    n = len(gids)
+    splits_first = minimize == 'splits'
+    cost = [(0, 0)] * (n + 1)   # cost[i] = (pages, splits) of the best packing of items i..n-1
+    first = [0] * (n + 1)       # first[i] = size of that packing's first page
+    for i in range(n - 1, -1, -1):
+        best_key = None
+        # largest first page wins ties, so pages fill up front like the greedy packer
+        for size in range(min(per_page, n - i), 0, -1):
+            j = i + size
+            pages, splits = cost[j]
+            c = (pages + 1, splits + (1 if j < n and gids[j] and gids[j] == gids[j - 1] else 0))
+            key = (c[1], c[0]) if splits_first else c
+            if best_key is None or key < best_key:
+                best_key, cost[i], first[i] = key, c, size
+    sizes, i = [], 0
+    while i < n:
+        sizes.append(first[i]); i += first[i]
+    return sizes
+
+# ---------- catalog index ----------
+class CatalogIndex:
+    """
+    Random access into a loaded catalog: category -> subcategory -> group -> record ranges.
+    Built once per load from _collect_groups' merged rows and groups (the full catalog,
+    before any selection); every lookup is a dict access.
+
+    Nodes are dicts with 'ranges' ([start, stop) slices of the merged rows), 'items',
+    'pages' (estimated pages in the catalog, covers included) and 'first_page' (estimated
+    page number of its first page). Group nodes also carry 'id' (stable across loads:
+    category/subcategory/Group ID, or the item code for a table without a Group ID),
+    'format', 'group_id', 'position' in the groups list and the TABLE2 'partner' id;
+    category and subcategory nodes list their 'groups' ids in catalog order. The id is
+    also written to each group dict as g['id'].
+    """
+    def __init__(self, records: list, groups: list, estimate_pages, covers=(), main_cover: bool = False):
+        self.rows, self.groups = records, groups
+        self._groups, self._categories, self._subcategories = {}, {}, {}
+        self.pages = 1 if main_cover else 0
+        start, prev_cat, prev_group = 0, None, None
+        for pos, g in enumerate(groups):
+            cat, sub = _s(g['category']).upper(), g['subcategory'] or ''
+            stop = start + len(g['rows'])
+            cat_node = self._categories.get(cat)
+            if cat_node is None:
+                cat_node = self._categories[cat] = self._node(first_page=self.pages + 1, subcategories=[])
+            if cat != prev_cat and (cat in covers or prev_cat is not None):
+                # _build_story puts the cover in front of every run of the category; without a
+                # cover its two page breaks at a category change leave a blank page instead
+                self.pages += 1; cat_node['pages'] += 1
+            sub_node = self._subcategories.get((cat, sub))
+            if sub_node is None:
+                sub_node = self._subcategories[(cat, sub)] = self._node(first_page=self.pages + 1)
+                cat_node['subcategories'].append(sub)
+
+            bottom = prev_group is not None and prev_group.get('table2_partner') is g
+            pages = estimate_pages(g, bottom)
+            node = self._node(first_page=self.pages if bottom else self.pages + 1,
+                              id=self._stable_id(cat, sub, g), category=cat, subcategory=sub,
+                              format=_norm(g['format']), group_id=self._group_id(g), position=pos,
+                              partner=None)
+            del node['groups']
+            node['ranges'].append((start, stop)); node['items'], node['pages'] = stop - start, pages
+            if bottom:
+                node['partner'] = self._groups[prev_group['id']]['id']
+                self._groups[prev_group['id']]['partner'] = node['id']
+            self._groups[node['id']] = node
+            g['id'] = node['id']
+            for parent in (cat_node, sub_node):
+                parent['groups'].append(node['id'])
+                parent['items'] += stop - start
+                parent['pages'] += pages
+                if parent['ranges'] and parent['ranges'][-1][1] == start:
+                    parent['ranges'][-1] = (parent['ranges'][-1][0], stop)
+                else:
+                    parent['ranges'].append((start, stop))
+            self.pages += pages
+            start, prev_cat, prev_group = stop, cat, g
+
+    @staticmethod
+    def _node(**fields) -> dict:
+        return dict({'ranges': [], 'items': 0, 'pages': 0, 'groups': []}, **fields)
+
+    @staticmethod
+    def _group_id(g) -> str:
+        if _norm(g['format']) not in ('TABLE', 'TABLE2'):
+            return ''
+        return _s(g['rows'][0]['raw'].get('Group ID', '')).strip()
+
+    def _stable_id(self, cat: str, sub: str, g) -> str:
+        label = self._group_id(g)
+        if not label:
+            first = g['rows'][0]['resolved']
+            code = _s(first.get('Item Code') or first.get('Code')).strip()
+            label = (f"item {code}" if _norm(g['format']) in ('TABLE', 'TABLE2') and code
+                     else f"format {_norm(g['format'])}")
+        base = gid = f"{cat}/{sub}/{label}"
+        n = 1
+        while gid in self._groups:   # a section that comes back later in the sheet
+            n += 1; gid = f"{base}#{n}"
+        return gid
+
+    def group(self, group_id: str) -> dict:
+        return self._groups[group_id]
+
+    def category(self, name: str) -> dict:
+        return self._categories[_s(name).strip().upper()]
+
+    def subcategory(self, category: str, name: str) -> dict:
+        return self._subcategories[(_s(category).strip().upper(), name or '')]
+
+    def categories(self) -> List[str]:
+        return list(self._categories)
+
+    def records(self, node: dict) -> list:
+        """Merged rows of a node, in sheet order."""
+        return [r for start, stop in node['ranges'] for r in self.rows[start:stop]]
+
+    def group_dicts(self, node: dict) -> list:
+        """The _collect_groups group dicts under a node (or the group itself)."""
+        return [self.groups[self._groups[gid]['position']] for gid in (node['groups'] if 'groups' in node else [node['id']])]
+
+    def stats(self) -> dict:
+        return {'categories': len(self._categories), 'subcategories': len(self._subcategories),
+                'groups': len(self._groups), 'records': len(self.rows), 'estimated_pages': self.pages}
+
+    def summary(self) -> str:
+        return ("Catalog index: {categories} categories, {subcategories} subcategories, {groups} groups, "
+                "{records} rows, ~{estimated_pages} pages").format(**self.stats())
+
+# ---------- pipelined build ----------
+class StreamingDocTemplate(SimpleDocTemplate):
+    """
+    SimpleDocTemplate whose story arrives from another thread: build_stream(chunks) renders
+    flowable lists taken from a queue.Queue (None ends the story, an exception is re-raised).
+    The story list doc.build works on is only ever touched by the rendering thread; it is
+    topped up from the queue in handle_flowable whenever it runs empty.
+    """
+    def build_stream(self, chunks: queue.Queue, **kwargs):
+        self._chunks, self._stream_done = chunks, False
+        self._story = self._next_chunk()
+        self.build(self._story, **kwargs)
+
+    def _next_chunk(self) -> list:
+        item = self._chunks.get()
+        if isinstance(item, BaseException):
+            raise item
+        if item is None:
+            self._stream_done = True
+            return []
+        return list(item)
+
+    def handle_flowable(self, flowables):
+        super().handle_flowable(flowables)
+        while flowables is self._story and not flowables and not self._stream_done:
+            flowables.extend(self._next_chunk())
+
+class BuildPipeline:
+    """
+    Overlapped build for generate_professional_pdf(pipeline=True), three stages connected by
+    bounded queues:
+      images: walks the groups in catalog order and fetches (and normalizes) their images on
+              `workers` threads, at most `ahead_groups` groups ahead of layout;
+      layout: turns groups into flowables in order (_story_chunks) and queues them, waiting
+              while `max_chunks` laid-out groups are not rendered yet;
+      render: StreamingDocTemplate.build_stream on the calling thread, drawing them as they arrive.
+    So the first categories are drawn while images of later ones still download. Sheet fetch and
+    row normalization already overlap in _collect_groups (ShardedSheetReader); grouping needs the
+    whole sheet (TABLE2 pairing, CatalogIndex), so it completes before the pipeline starts.
+    """
+    def __init__(self, workers: int = 8, ahead_groups: int = 8, max_chunks: int = 16):
+        self.workers = workers
+        self.ahead_groups = ahead_groups
+        self.max_chunks = max_chunks
+
+    @staticmethod
+    def group_images(gen, g) -> List[str]:
+        """Image URLs _story_chunks downloads for group g."""
+        fmt = _norm(g['format'])
+        rows = g['rows'][:1] if fmt in ('TABLE', 'TABLE2') else g['rows']
+        urls = [gen.get_best_image(it['images']) for it in rows]
+        if fmt == '1WP':
+            urls += [gen.get_graph_image(it['images']) for it in rows]
+        return urls
+
+    def run(self, gen, doc: StreamingDocTemplate, groups, remark_lookup, canvasmaker):
+        chunks = queue.Queue(maxsize=max(1, self.max_chunks))
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='catalog-image')
+        cond = threading.Condition()
+        state = {'fetching': 0, 'laid_out': 0, 'stop': False}   # groups queued for images / laid out
+        ahead = max(2, self.ahead_groups)   # layout needs up to two groups at once (TABLE2 pair)
+
+        def images():
+            try:
+                urls = [remark_lookup.get('DELI CATALOGUE COVER')]
+                prev_cat = None
+                for k, g in enumerate(groups):
+                    with cond:
+                        while not state['stop'] and k >= state['laid_out'] + ahead:
+                            cond.wait()
+                        if state['stop']:
+                            return
+                    cat = _s(g['category']).upper()
+                    if cat != prev_cat:
+                        urls.append(remark_lookup.get(cat)); prev_cat = cat
+                    for url in urls + self.group_images(gen, g):
+                        if url and url not in gen._image_prefetch and url not in getattr(gen, '_img_cache', {}):
+                            gen._image_prefetch[url] = pool.submit(gen._download_image, url)
+                    urls = []
+                    with cond:
+                        state['fetching'] = k + 1; cond.notify_all()
+            except Exception as e:
+                log.warning(f"⚠️ Image stage stopped ({e}); layout downloads the rest itself")
+            finally:
+                with cond:
+                    state['fetching'] = len(groups); cond.notify_all()
+
+        def layout():
+            try:
+                with gen.metrics.stage('build_story'):
+                    story, done = gen._story_chunks(groups, remark_lookup), 0
+                    while True:
+                        with cond:   # the next group (or TABLE2 pair) has its images queued
+                            while not state['stop'] and state['fetching'] < min(done + 2, len(groups)):
+                                cond.wait()
+                            if state['stop']:
+                                return
+                        chunk = next(story, None)
+                        if chunk is None:
+                            break
+                        done, flowables = chunk
+                        gen.metrics.count('flowables', _count_flowables(flowables))
+                        if gen.flowable_profiler is not None:
+                            flowables = gen.flowable_profiler.wrap(flowables)
+                        chunks.put(flowables)   # blocks while max_chunks groups wait to be rendered
+                        with cond:
+                            state['laid_out'] = done; cond.notify_all()
+                chunks.put(None)
+            except BaseException as e:
+                chunks.put(e)
+
+        stages = [threading.Thread(target=images, name='catalog-images', daemon=True),
+                  threading.Thread(target=layout, name='catalog-layout', daemon=True)]
+        for t in stages:
+            t.start()
+        try:
+            doc.build_stream(chunks, canvasmaker=canvasmaker)
+        finally:
+            with cond:
+                state['stop'] = True; cond.notify_all()
+            while stages[1].is_alive():   # free a layout stage blocked on a full queue
+                try:
+                    chunks.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+            for t in stages:
+                t.join()
+            pool.shutdown(cancel_futures=True)
+            gen._image_prefetch = {}
+
+# ---------- dry run ----------
+class _PageDiscardingCanvas(canvas.Canvas):
+    """Finished pages are counted and dropped instead of being serialized."""
+    def showPage(self):
+        if self._onPage: self._onPage(self._pageNumber)
+        self._startPage()
+    def save(self):
+        if len(self._code): self.showPage()   # same trailing-page rule as Canvas.save
+        self.page_count = self._pageNumber - 1
+
+class _DryRunCanvas(FooterCanvas, _PageDiscardingCanvas):
+    """FooterCanvas page logic (footer included, so page counts match) without any PDF output."""
+
+class _PageMapDocTemplate(SimpleDocTemplate):
+    """Records the page each tagged flowable (f._page_map) lands on, split remainders included."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page_map = {}
+    def handle_flowable(self, flowables):
+        tag = getattr(flowables[0], '_page_map', None) if flowables else None
+        rest = len(flowables) - 1
+        super().handle_flowable(flowables)
+        if tag is not None:
+            for f in flowables[:len(flowables) - rest]:   # remainder / postponed flowable
+                f._page_map = tag
+    def afterFlowable(self, flowable):
+        tag = getattr(flowable, '_page_map', None)
+        if tag is None:
+            return
+        entry = self.page_map.setdefault(self.page, {'skus': []})
+        entry['subcategory'] = getattr(self.canv, '_current_subcategory', '')
+        if 'cover' in tag:
+            entry['cover'] = tag['cover']
+        entry['skus'].extend(c for c in tag.get('skus', ()) if c not in entry['skus'])
 
 class EllipsizedTextBox(Flowable):
     """Fixed-width text; manual wrap + in-place ellipsis; vertical centering."""
@@ -174,7 +1367,7 @@ class EllipsizedTextBox(Flowable):
         self.height = self.leading * self.max_lines
 
     def _stringWidth(self, s):
-        return pdfmetrics.stringWidth(s, self.fontName, self.fontSize)
+        return string_width(s, self.fontName, self.fontSize)
 
     def _wrap_lines(self):
         """Improved wrapping that tries to show all content without aggressive truncation."""
@@ -268,9 +1461,9 @@ class EllipsizedTextBox(Flowable):
             y = (self.height + total_h)/2.0 - self.leading
         for line in self.lines:
             if self.align == 'CENTER':
-                x = (self.width - pdfmetrics.stringWidth(line, self.fontName, self.fontSize)) / 2.0
+                x = (self.width - self._stringWidth(line)) / 2.0
             elif self.align == 'RIGHT':
-                x = self.width - pdfmetrics.stringWidth(line, self.fontName, self.fontSize)
+                x = self.width - self._stringWidth(line)
             else:
                 x = 0
             c.drawString(max(0, x), max(0, y), line)
@@ -300,46 +1493,425 @@ class PaddedBox(Flowable):
             y = (self.h - self.ch) / 2.0
         self.child.drawOn(self.canv, self.pad_l, y)
 
-# -------- INLINE ICON + TEXT FLOWABLE (for TABLE format) --------
-from reportlab.platypus import Flowable, Image, Paragraph
-
+# -------- INLINE ICON + TEXT FLOWABLE (for span-tagged values) --------
 class InlineImageText(Flowable):
-    def __init__(self, img_path, txt, style, img_width=12):
+    """Shape icon (shared Form XObject) followed by an already-sized text flowable."""
+    def __init__(self, shape, child, img_width=ICON_SIZE):
         Flowable.__init__(self)
-        self.img = Image(img_path, width=img_width, height=img_width)
-        self.txt = Paragraph(txt, style)
+        self.shape = shape
+        self.child = child
         self.img_width = img_width
 
-        # Pre-measure sizes
-        txt_w, txt_h = self.txt.wrap(1000, 1000)
-        self.width = img_width + 2 + txt_w
-        self.height = max(img_width, txt_h)
-
     def wrap(self, w, h):
+        cw, ch = self.child.wrap(max(1, w - self.img_width - 2), h)
+        self.width = self.img_width + 2 + cw
+        self.height = max(self.img_width, ch)
+        self._ch = ch
         return (self.width, self.height)
 
     def draw(self):
         # Draw icon
-        self.img.drawOn(self.canv, 0, 0)
+        draw_shape_icon(self.canv, self.shape, 0, (self.height - self.img_width) / 2.0, self.img_width)
         # Draw text beside it
-        self.txt.drawOn(self.canv, self.img_width + 2, 0)
+        self.child.drawOn(self.canv, self.img_width + 2, (self.height - self._ch) / 2.0)
+
+class _ImageJob:
+    """One resampling request: the source file, its pixel size, and the pending (or cached) output."""
+    def __init__(self, source, src_px, output=None, future=None, stats=None):
+        self.source = source
+        self.src_px = src_px
+        self.output = output or source
+        self._future = future
+        self._stats = stats
+        self._path = None
+
+    def result(self) -> str:
+        if self._path is None:
+            self._path = self.output
+            if self._future is not None:
+                try:
+                    self._future.result()
+                except Exception:
+                    self._path = self.source
+            if self._stats is not None and self._path != self.source:
+                self._stats['resampled'] += 1
+                self._stats['bytes_in'] += os.path.getsize(self.source)
+                self._stats['bytes_out'] += os.path.getsize(self._path)
+        return self._path
+
+class FittedImage(Flowable):
+    """
+    Image fitted arithmetically into a max_w x max_h box (never enlarged), replacing the
+    KeepInFrame(mode='shrink') negotiation. Reports the same box width the shrink frame did
+    (min of max_w, available width and the image's natural width) and centres the image in
+    it. Drawn by filename so every use of the same file shares one XObject; `source` is a
+    path or an _ImageJob resolved at draw time.
+    """
+    def __init__(self, source, src_px, max_w, max_h, hAlign='LEFT', vAlign='TOP'):
+        super().__init__()
+        self.source = source
+        self.src_px = src_px
+        self.max_w, self.max_h = max_w, max_h
+        self.hAlign, self.vAlign = hAlign, vAlign
+        self.wrap(max_w, max_h)
 
+    def wrap(self, availWidth, availHeight):
+        w, h = self.src_px
+        box_w = min(self.max_w, availWidth)
+        f = min(1.0, box_w / w, min(self.max_h, availHeight) / h)
+        self.drawWidth, self.drawHeight = w * f, h * f
+        self.width, self.height = min(box_w, w), self.drawHeight
+        return (self.width, self.height)
+
+    def draw(self):
+        path = self.source.result() if isinstance(self.source, _ImageJob) else self.source
+        x = (self.width - self.drawWidth) / 2.0
+        self.canv.drawImage(path, x, 0, self.drawWidth, self.drawHeight, mask='auto')
 
 
+
+# ---------- instrumentation ----------
+def _peak_rss_mb() -> Optional[float]:
+    """Process high-water-mark RSS so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1048576.0 if sys.platform == 'darwin' else 1024.0), 1)
+
+def _count_flowables(flowables) -> int:
+    """Flowables in a story, including those nested in tables, frames and lists."""
+    n = 0
+    stack = list(flowables)
+    while stack:
+        f = stack.pop()
+        if isinstance(f, (list, tuple)):
+            stack.extend(f)
+            continue
+        if isinstance(f, _ProfiledFlowable):
+            stack.append(f.flowable)
+            continue
+        if not isinstance(f, Flowable):
+            continue
+        n += 1
+        for attr in ('_cellvalues', '_content', 'child'):
+            inner = getattr(f, attr, None)
+            if inner is not None:
+                stack.append(inner)
+    return n
+
+# stages of a pipelined build whose overlap RunMetrics reports (see BuildPipeline)
+PIPELINE_STAGES = ('fetch_sheets', 'download_images', 'build_story', 'layout_render')
+
+class RunMetrics:
+    """
+    Telemetry of one build: wall/CPU seconds and peak RSS per stage (stages nest, e.g.
+    download_images runs inside build_story), named counters, pages per format and render
+    time per category (the time between finished pages, charged to each page's category).
+    """
+    def __init__(self):
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self.stages, self.counters = {}, {}
+        self.spans = {}   # stage -> [first start, last end], seconds since the metrics were created
+        self.pages_per_format, self.category_render_s = {}, {}
+        self._last_page = None
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()   # stages and counters are updated from pipeline threads too
+
+    @contextmanager
+    def stage(self, name: str):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                st = self.stages.setdefault(name, {'wall_s': 0.0, 'cpu_s': 0.0, 'calls': 0})
+                st['wall_s'] += end - wall
+                st['cpu_s'] += time.process_time() - cpu   # whole process, other threads included
+                st['calls'] += 1
+                st['peak_rss_mb'] = _peak_rss_mb()
+                span = self.spans.setdefault(name, [wall - self._t0, end - self._t0])
+                span[0], span[1] = min(span[0], wall - self._t0), max(span[1], end - self._t0)
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def overlap(self, names=PIPELINE_STAGES) -> dict:
+        """
+        How far the spans of these stages ran at the same time: seconds per overlapping pair,
+        span_s covered by them together and hidden_s, the summed spans minus span_s. Nested
+        stages count too (download_images runs inside build_story when not pipelined).
+        """
+        spans = sorted((self.spans[n][0], self.spans[n][1], n) for n in names if n in self.spans)
+        pairs = {}
+        for k, (a0, a1, a) in enumerate(spans):
+            for b0, b1, b in spans[k + 1:]:
+                if min(a1, b1) > b0:
+                    pairs[f'{a}|{b}'] = round(min(a1, b1) - b0, 3)
+        covered, reach = 0.0, None
+        for s0, s1, _ in spans:
+            if reach is None or s0 > reach:
+                covered += s1 - s0; reach = s1
+            elif s1 > reach:
+                covered += s1 - reach; reach = s1
+        return {'pairs': pairs, 'span_s': round(covered, 3),
+                'hidden_s': round(sum(s1 - s0 for s0, s1, _ in spans) - covered, 3)}
+
+    def start_pages(self):
+        self._last_page = time.perf_counter()
+
+    def page_done(self, category, fmt):
+        now = time.perf_counter()
+        cat = category or '(cover)'
+        self.pages_per_format[fmt or '(cover)'] = self.pages_per_format.get(fmt or '(cover)', 0) + 1
+        if self._last_page is not None:
+            self.category_render_s[cat] = self.category_render_s.get(cat, 0.0) + now - self._last_page
+        self._last_page = now
+
+    @contextmanager
+    def counting_width_helpers(self):
+        """
+        Count text measurements of our own helpers (string_width, measure_strings) while active
+        as 'helper_width_calls'; concurrent builds share the count. ReportLab's own stringWidth
+        calls (Paragraph, Table) are not counted.
+        """
+        with _width_lock:
+            _width_meters.append(self)
+        try:
+            yield
+        finally:
+            with _width_lock:
+                _width_meters.remove(self)
+
+    def report(self) -> dict:
+        r3 = lambda v: round(v, 3)
+        return {'started': self.started,
+                'stages': {k: {**v, 'wall_s': r3(v['wall_s']), 'cpu_s': r3(v['cpu_s'])} for k, v in self.stages.items()},
+                'counters': dict(self.counters),
+                'spans': {k: [r3(a), r3(b)] for k, (a, b) in self.spans.items()},
+                'overlap': self.overlap(),
+                'pages': sum(self.pages_per_format.values()),
+                'pages_per_format': dict(self.pages_per_format),
+                'category_render_s': {k: r3(v) for k, v in self.category_render_s.items()},
+                'peak_rss_mb': _peak_rss_mb()}
+
+    def write_json(self, path: str, **extra):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({**self.report(), **extra}, f, indent=2)
+
+    def write_prometheus(self, path: str):
+        """Prometheus textfile-collector format, replaced atomically."""
+        esc = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        lines = ['# TYPE catalog_stage_wall_seconds gauge', '# TYPE catalog_stage_cpu_seconds gauge']
+        for name, st in self.stages.items():
+            lines.append(f'catalog_stage_wall_seconds{{stage="{esc(name)}"}} {st["wall_s"]:.6f}')
+            lines.append(f'catalog_stage_cpu_seconds{{stage="{esc(name)}"}} {st["cpu_s"]:.6f}')
+        for name, value in sorted(self.counters.items()):
+            lines += [f'# TYPE catalog_{name}_total counter', f'catalog_{name}_total {value}']
+        lines += ['# TYPE catalog_pipeline_hidden_seconds gauge',
+                  f'catalog_pipeline_hidden_seconds {self.overlap()["hidden_s"]:.6f}']
+        lines.append('# TYPE catalog_pages gauge')
+        lines += [f'catalog_pages{{format="{esc(k)}"}} {v}' for k, v in self.pages_per_format.items()]
+        lines.append('# TYPE catalog_category_render_seconds gauge')
+        lines += [f'catalog_category_render_seconds{{category="{esc(k)}"}} {v:.6f}'
+                  for k, v in self.category_render_s.items()]
+        peak = _peak_rss_mb()
+        if peak is not None:
+            lines += ['# TYPE catalog_peak_rss_megabytes gauge', f'catalog_peak_rss_megabytes {peak}']
+        lines += ['# TYPE catalog_last_run_timestamp_seconds gauge', f'catalog_last_run_timestamp_seconds {time.time():.0f}']
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, path)
+
+class _ProfiledFlowable(Flowable):
+    """
+    A flowable as seen by its parent (doc.build, a Table cell, a KeepInFrame, a PaddedBox)
+    while a FlowableProfiler runs: times the wrapped flowable.
+    """
+    _PASSED_ATTRS = ('hAlign', 'vAlign', 'frameAction', '_ZEROSIZE', '_SPACETRANSFER',
+                     '_fixedWidth', '_fixedHeight')
+
+    def __init__(self, flowable, profiler):
+        Flowable.__init__(self)
+        self.flowable, self.profiler = flowable, profiler
+        for attr in self._PASSED_ATTRS:
+            if hasattr(flowable, attr):
+                setattr(self, attr, getattr(flowable, attr))
+
+    def getSpaceBefore(self):
+        return self.flowable.getSpaceBefore()
+
+    def getSpaceAfter(self):
+        return self.flowable.getSpaceAfter()
+
+    def getKeepWithNext(self):
+        return self.flowable.getKeepWithNext()
+
+    def identity(self, maxLen=None):
+        return self.flowable.identity(maxLen)
+
+    def minWidth(self):
+        return self.flowable.minWidth()
+
+    def wrap(self, availWidth, availHeight):
+        # parents that call wrap() directly (PaddedBox, InlineImageText) never set self.canv
+        canv = getattr(self, 'canv', None)
+        call = ((lambda: self.flowable.wrap(availWidth, availHeight)) if canv is None else
+                (lambda: self.flowable.wrapOn(canv, availWidth, availHeight)))
+        self.width, self.height = self.profiler._call(self.flowable, 'wrap', call)
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        canv = getattr(self, 'canv', None)
+        call = ((lambda: self.flowable.split(availWidth, availHeight)) if canv is None else
+                (lambda: self.flowable.splitOn(canv, availWidth, availHeight)))
+        return self.profiler.wrap(self.profiler._call(self.flowable, 'split', call) or [])
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        self.profiler._call(self.flowable, 'drawOn', lambda: self.flowable.drawOn(canvas, x, y, _sW))
+
+class FlowableProfiler:
+    """
+    Opt-in layout profile of one build: the story items handed to doc.build are wrapped
+    (wrap()) in proxies that time wrap/split/drawOn of the item they carry, aggregated by the
+    item's class and by page. The generator puts the cells and nested flowables it builds
+    for that build in proxies too (proxy(), see ProfessionalPDFGenerator._profiled), so each
+    call is charged to the innermost profiled class: self_s excludes the time spent in
+    nested profiled flowables (the cells of a Table, the content of a KeepInFrame), time_s
+    does not. Nothing outside the build is touched. Product blocks are tagged with their
+    SKUs (see _page_map_tag) so each page lists the products drawn on it.
+    """
+    METHODS = ('wrap', 'split', 'drawOn')
+
+    def __init__(self):
+        self.doc = None
+        self.by_class = {}   # (class name, method) -> [calls, time_s, self_s]
+        self.pages = {}      # page -> {'calls', 'self_s', 'classes', 'skus', 'category'}
+        self._stack = []     # [flowable, method, time spent in nested calls]
+
+    def __deepcopy__(self, memo):
+        return self   # proxies copied by ReportLab (KeepInFrame shrink) keep reporting here
+
+    def proxy(self, f):
+        """f in a profiling proxy; page breaks, other actions and non-flowables stay as they are."""
+        if isinstance(f, (ActionFlowable, PageBreak, _ProfiledFlowable)) or not isinstance(f, Flowable):
+            return f
+        return _ProfiledFlowable(f, self)
+
+    def wrap(self, flowables) -> list:
+        """Story items in profiling proxies (see proxy())."""
+        return [self.proxy(f) for f in flowables]
+
+    @contextmanager
+    def active(self, doc):
+        """Record the proxies' calls while doc builds; outside it they only pass through."""
+        self.doc = doc
+        try:
+            yield self
+        finally:
+            self.doc = None
+            self._stack.clear()
+
+    def _call(self, f, method, call):
+        if self.doc is None:
+            return call()
+        frame = [f, method, 0.0]
+        self._stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            result = call()
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][2] += elapsed
+            self._record(type(f).__name__, method, elapsed, elapsed - frame[2])
+        tag = getattr(f, '_page_map', None)
+        if tag is not None:
+            if method == 'split':
+                for part in result or ():
+                    if getattr(part, '_page_map', None) is None:
+                        part._page_map = tag
+            elif method == 'drawOn':
+                page = self._page()
+                for sku in tag.get('skus', ()):
+                    if sku not in page['skus']: page['skus'].append(sku)
+        return result
+
+    def _page(self):
+        n = getattr(self.doc, 'page', 0)
+        page = self.pages.get(n)
+        if page is None:
+            page = self.pages[n] = {'calls': 0, 'self_s': 0.0, 'classes': {}, 'skus': [], 'category': None}
+        if page['category'] is None:
+            page['category'] = getattr(getattr(self.doc, 'canv', None), '_current_category', None)
+        return page
+
+    def _record(self, cname, method, elapsed, own):
+        st = self.by_class.setdefault((cname, method), [0, 0.0, 0.0])
+        st[0] += 1; st[1] += elapsed; st[2] += own
+        page = self._page()
+        page['calls'] += 1; page['self_s'] += own
+        page['classes'][cname] = page['classes'].get(cname, 0.0) + own
+
+    def report(self, slowest: int = 10) -> dict:
+        r = lambda v: round(v, 4)
+        by_class = [{'class': c, 'method': m, 'calls': n, 'time_s': r(t), 'self_s': r(own),
+                     'mean_ms': r(own * 1000 / n)}
+                    for (c, m), (n, t, own) in sorted(self.by_class.items(), key=lambda kv: -kv[1][2])]
+        pages = [{'page': n, 'calls': p['calls'], 'self_s': r(p['self_s']), 'category': p['category'],
+                  'skus': p['skus'],
+                  'top_classes': [[c, r(t)] for c, t in sorted(p['classes'].items(), key=lambda kv: -kv[1])[:3]]}
+                 for n, p in sorted(self.pages.items())]
+        return {'by_class': by_class, 'pages': pages,
+                'slowest_pages': sorted(pages, key=lambda p: -p['self_s'])[:slowest]}
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and any `extra` fields."""
+    _STANDARD = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+    def format(self, record):
+        entry = {'ts': self.formatTime(record), 'level': record.levelname, 'logger': record.name,
+                 'msg': record.getMessage()}
+        entry.update({k: v for k, v in vars(record).items() if k not in self._STANDARD})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
 # ----------------------------- main class -----------------------------
 class ProfessionalPDFGenerator:
-    def upload_to_drive(self, file_path, folder_id):
+    def upload_to_drive(self, file_path, folder_id, resumable=True):
+        if resumable:
+            with open(file_path, 'rb') as f:
+                return self.upload_stream_to_drive(f, os.path.basename(file_path), folder_id)
         file_metadata = {
             'name': os.path.basename(file_path),
             'parents': [folder_id]
         }
+        from googleapiclient.http import MediaFileUpload
         media = MediaFileUpload(file_path, mimetype='application/pdf')
         uploaded = self.drive_service.files().create(
             body=file_metadata,
             media_body=media,
             fields='id'
         ).execute()
-        print("Uploaded PDF to Google Drive with File ID:", uploaded.get('id'))
+        log.info(f"Uploaded PDF to Google Drive with File ID: {uploaded.get('id')}")
+        return uploaded.get('id')
+
+    def upload_stream_to_drive(self, stream, name, folder_id, chunk_size=32 * UPLOAD_QUANTUM):
+        """Resumable chunked upload of a readable stream (file, BytesIO, GrowingFile); returns the file ID."""
+        session = self.upload_session
+        if session is None:
+            from google.auth.transport.requests import AuthorizedSession
+            session = AuthorizedSession(self.drive_credentials)
+        upload = ResumableUpload(session, {'name': name, 'parents': [folder_id]},
+                                 upload_url=self.drive_upload_url, chunk_size=chunk_size)
+        uploaded = upload.upload(stream)
+        log.info(f"Uploaded PDF to Google Drive with File ID: {uploaded.get('id')}"
+                 + (f" ({upload.retries} retries)" if upload.retries else ""),
+                 extra={'file_id': uploaded.get('id'), 'retries': upload.retries})
+        return uploaded.get('id')
 
 
     def __init__(self, credentials_path: str, spreadsheet_id: str):
@@ -348,6 +1920,40 @@ class ProfessionalPDFGenerator:
         self._header_band_mm  = 14
         self.downloaded_images = {}
 
+        # image resampling (see prepare_image); None disables it
+        self.image_dpi = IMAGE_DPI_PRESETS['print']
+        self._image_pool = None
+        self._image_jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._source_hashes = {}
+        self._image_sizes = {}        # path -> (w_px, h_px) from the file header
+        self._canonical_images = {}   # content hash -> first path seen with that content
+        self._spec_layout_cache = LayoutCache(4096)    # spec-card rows/widths/styles -> measured layout
+        self._spec_row_cache = LayoutCache(16384)      # single spec row -> (key layout, value layout, height)
+        self._image_stats = {'resampled': 0, 'bytes_in': 0, 'bytes_out': 0}
+        self._variant_dpis = set()    # DPIs of extra output targets, resampled alongside image_dpi
+        self._job_sources = {}        # resampled file -> its source image
+        self.keep_image_alpha = False   # True: transparent images stay PNG with alpha instead of flattening
+        self.dry_run = False            # set by dry_run_layout(): no image downloads, page map tagging on
+        self.draft = False              # set by generate_professional_pdf(draft=True), see set_draft
+        self.written_targets = []       # extra output files of the last generate_professional_pdf
+        self.optimize_reports = []      # optimize_pdf() reports of the last generate_professional_pdf
+        self._dry_truncated = []
+        self.drive_upload_url = DRIVE_UPLOAD_URL
+        self.upload_session = None      # requests-style session for uploads; default: Drive credentials
+        self.uploaded_file_id = None    # set by generate_professional_pdf(upload_folder=...)
+        self.keep_sheets = False        # watch mode: reuse fetched sheets until marked changed
+        self._sheet_snapshot = {}       # sheet name -> DataFrame of the last fetch (keep_sheets)
+        self.sheet_reader = ShardedSheetReader()   # row-range shard size / parallel reads for Google sheets
+        self.metrics = RunMetrics()     # stage timings and counters of the last build (see RunMetrics)
+        self.flowable_profiler = None   # set by generate_professional_pdf(profile=...): tag products for the profile
+        self.flowable_profile = None    # FlowableProfiler report of the last profiled build
+        self.page_packer = 'greedy'     # formats 2/3/4: 'greedy', 'optimal' or 'tight', see pack_pages
+        self.catalog_index = None       # CatalogIndex of the last loaded catalog (before selection)
+        self.build_pipeline = BuildPipeline()   # image / layout / render overlap of generate_professional_pdf
+        self._image_prefetch = {}       # image URL -> Future of the pipeline's image stage
+        self._local = threading.local() # per-thread Drive transport (_drive_http)
+
         self.detail_row_caps = {'1WP': 16, '2': 16, '3': 9, '4': 6, 'TABLE': 9999}
         self.page_offset_mm = {'2': 0, '3': 0, '4': 0, '1WP': 0, 'TABLE': 0}
 
@@ -365,41 +1971,83 @@ class ProfessionalPDFGenerator:
 
     # ---------- setup ----------
     def setup_google_services(self, credentials_path: str):
-        scope = ['https://www.googleapis.com/auth/spreadsheets',
-                 'https://www.googleapis.com/auth/drive']
-        creds = Credentials.from_service_account_file(credentials_path, scopes=scope)
-        self.gs_client = gspread.authorize(creds)
-        self.drive_service = build('drive', 'v3', credentials=creds)
+        """Only remembers the key file: credentials and clients are created on first use."""
+        self.credentials_path = credentials_path
+
+    # clients, built lazily; subclasses and tests may assign their own
+    credentials_path = None
+    _drive_credentials = _gs_client = _drive_service = None
+
+    @property
+    def drive_credentials(self):
+        if self._drive_credentials is None and self.credentials_path:
+            self._drive_credentials = load_service_account_credentials(self.credentials_path)
+        return self._drive_credentials
+
+    @drive_credentials.setter
+    def drive_credentials(self, creds):
+        self._drive_credentials = creds
+
+    @property
+    def gs_client(self):
+        if self._gs_client is None and self.drive_credentials is not None:
+            import gspread
+            self._gs_client = gspread.authorize(self.drive_credentials)
+        return self._gs_client
+
+    @gs_client.setter
+    def gs_client(self, client):
+        self._gs_client = client
+
+    @property
+    def drive_service(self):
+        if self._drive_service is None and self.drive_credentials is not None:
+            from googleapiclient.discovery import build
+            # discovery document bundled with googleapiclient: no fetch, no on-disk cache lookups
+            self._drive_service = build('drive', 'v3', credentials=self.drive_credentials,
+                                        static_discovery=True, cache_discovery=False)
+        return self._drive_service
+
+    @drive_service.setter
+    def drive_service(self, service):
+        self._drive_service = service
+
+    def store_token(self):
+        """Persist the current access token for the next invocation (see load_service_account_credentials)."""
+        if self._drive_credentials is not None:
+            store_token_cache(self._drive_credentials)
 
     def setup_directories(self):
         self.temp_dir = tempfile.mkdtemp()
         self.output_dir = os.path.join(self.temp_dir, 'output')
         self.images_dir = os.path.join(self.temp_dir, 'images')
+        self.image_cache_dir = os.path.join(self.temp_dir, 'resampled')
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(self.images_dir, exist_ok=True)
+        os.makedirs(self.image_cache_dir, exist_ok=True)
 
     def setup_custom_fonts(self):
-        self.fonts_available = {'Avenir-Black': False, 'Avenir-Book': False}
-    
-        # Get the folder where this script lives
-        base_path = os.path.dirname(__file__)  # Works on any machine
-    
-        # Relative paths to your font files
-        paths = {
-            'Avenir-Black': os.path.join(base_path, 'Avenir-Black.ttf'),
-            'Avenir-Book':  os.path.join(base_path, 'Avenir-Book.ttf')
-        }
-    
-        for fam, p in paths.items():
-            if os.path.exists(p):
-                try:
-                    pdfmetrics.registerFont(TTFont(fam, p))
-                    self.fonts_available[fam] = True
-                except Exception:
-                    pass
+        self.fonts_available = register_bundled_fonts()
 
     def get_font_name(self, preferred, fallback):
-        return preferred if self.fonts_available.get(preferred) else fallback
+        if not self.fonts_available.get(preferred):
+            return fallback
+        if self.draft:
+            # draft: draw the built-in fallback, measure with the real font (same pagination)
+            name = f'{preferred}-Draft'
+            try:
+                pdfmetrics.getFont(name)
+            except KeyError:
+                pdfmetrics.registerFont(DraftFont(name, fallback, preferred))
+                pdfmetrics.registerFontFamily(name, normal=name, bold=name, italic=name, boldItalic=name)
+            return name
+        return preferred
+
+    def set_draft(self, draft: bool):
+        """Switch styles between production fonts and draft (built-in Helvetica) fonts."""
+        if bool(draft) != self.draft:
+            self.draft = bool(draft)
+            self.setup_pdf_styles()
 
     def setup_pdf_styles(self):
         self.styles = getSampleStyleSheet()
@@ -415,8 +2063,13 @@ class ProfessionalPDFGenerator:
         self.styles.add(ParagraphStyle('Footer',            fontName=avenir_black, fontSize=9,  leading=11))
 
     # ---------- layout helpers ----------
+    def _profiled(self, flowable):
+        """flowable in a FlowableProfiler proxy while this build is profiled, else flowable itself."""
+        profiler = self.flowable_profiler
+        return flowable if profiler is None else profiler.proxy(flowable)
+
     def fixed_box(self, flowable, w, h):
-        return KeepInFrame(w, h, [flowable], mode='truncate', vAlign='TOP')
+        return KeepInFrame(w, h, [self._profiled(flowable)], mode='truncate', vAlign='TOP')
 
     # ---------- utils ----------
     def clean_html_css(self, text):
@@ -495,41 +2148,246 @@ class ProfessionalPDFGenerator:
 
     def download_image(self, image_url: str) -> Optional[str]:
         if not image_url or _s(image_url) == '': return None
+        if self.dry_run: return None   # layout only: image boxes keep their size as placeholders
+        prefetched = self._image_prefetch.get(image_url)
+        if prefetched is not None:
+            return prefetched.result()   # fetched ahead by the image stage of BuildPipeline
+        return self._download_image(image_url)
+
+    def _download_image(self, image_url: str) -> Optional[str]:
         if not hasattr(self, "_img_cache"): self._img_cache = {}
-        if image_url in self._img_cache: return self._img_cache[image_url]
+        if image_url in self._img_cache:
+            self.metrics.count('images_cached'); return self._img_cache[image_url]
+        with self.metrics.stage('download_images'):
+            path = self._fetch_image(image_url)
+        self.metrics.count('images_fetched' if path else 'images_failed')
+        return path
+
+    def _fetch_image(self, image_url: str) -> Optional[str]:
         try:
             if 'drive.google.com' in image_url:
                 fid = self.extract_file_id(image_url)
                 if fid:
                     path = self.download_drive_image(fid)
-                    if path: self._img_cache[image_url] = path; return path
+                    if path:
+                        path = self._normalize_image(path)
+                        self._img_cache[image_url] = path; return path
             elif str(image_url).startswith('http'):
-                resp = requests.get(image_url, timeout=10); resp.raise_for_status()
-                path = os.path.join(self.images_dir, f"img_{len(self._img_cache)}.jpg")
+                resp = _requests().get(image_url, timeout=10); resp.raise_for_status()
+                ext = sniff_image_ext(resp.content[:16])
+                name = hashlib.sha1(image_url.encode('utf-8')).hexdigest()[:16]   # unique across fetch threads
+                path = os.path.join(self.images_dir, f"img_{name}{ext}")
                 with open(path, 'wb') as f: f.write(resp.content)
+                path = self._normalize_image(path)
                 self._img_cache[image_url] = path; return path
         except Exception:
             pass
         return None
 
+    def clear_image_cache(self):
+        """Forget downloaded images and what was derived from their paths (next build re-fetches)."""
+        self._img_cache = {}
+        self._source_hashes.clear(); self._image_sizes.clear(); self._canonical_images.clear()
+
     def download_drive_image(self, file_id: str) -> Optional[str]:
+        from googleapiclient.http import MediaIoBaseDownload
         try:
             request = self.drive_service.files().get_media(fileId=file_id)
-            path = os.path.join(self.images_dir, f"{file_id}.jpg")
-            with open(path, 'wb') as f:
+            http = self._drive_http()
+            if http is not None:
+                request.http = http
+            part = os.path.join(self.images_dir, f"{file_id}.{threading.get_ident()}.part")
+            with open(part, 'wb') as f:
                 downloader = MediaIoBaseDownload(f, request)
                 done = False
                 while not done:
                     _, done = downloader.next_chunk()
+            with open(part, 'rb') as f:
+                ext = sniff_image_ext(f.read(16))
+            path = os.path.join(self.images_dir, f"{file_id}{ext}")
+            os.replace(part, path)
             return path
         except Exception:
             return None
 
+    def _drive_http(self):
+        """This thread's authorized transport for Drive downloads (httplib2 objects are not thread-safe)."""
+        if self._drive_service is not None and self._drive_credentials is None:
+            return None   # service set from outside: use its own transport
+        http = getattr(self._local, 'drive_http', None)
+        if http is None and self.drive_credentials is not None:
+            import google_auth_httplib2, httplib2
+            http = self._local.drive_http = google_auth_httplib2.AuthorizedHttp(self.drive_credentials,
+                                                                                http=httplib2.Http(timeout=60))
+        return http
+
+    def _normalize_image(self, path: str) -> str:
+        """
+        Make a downloaded image cheap to embed. JPEGs that ReportLab can pass through as raw
+        DCT streams are returned untouched (never decoded). Anything else is decoded once here,
+        alpha flattened onto white, and cached as JPEG (photos) or PNG (line art, or when
+        keep_image_alpha is set and the image really is transparent).
+        """
+        if path.lower().endswith(('.jpg', '.jpeg')):
+            try:
+                with open(path, 'rb') as f:
+                    pdfutils.readJPEGInfo(f)
+                return path
+            except Exception:
+                pass
+        key = self._source_hash(path)
+        for ext in ('.jpg', '.png'):
+            cached = os.path.join(self.image_cache_dir, f"{key}_flat{ext}")
+            if os.path.exists(cached):
+                return cached
+        try:
+            with PILImage.open(path) as src:
+                im = src
+                if im.mode in ('RGBA', 'LA', 'PA') or (im.mode == 'P' and 'transparency' in im.info):
+                    im = im.convert('RGBA')
+                    alpha = im.getchannel('A')
+                    if self.keep_image_alpha and alpha.getextrema()[0] < 255:
+                        dst = os.path.join(self.image_cache_dir, f"{key}_flat.png")
+                        im.save(dst, 'PNG')
+                        return dst
+                    flat = PILImage.new('RGB', im.size, (255, 255, 255))
+                    flat.paste(im, mask=alpha)
+                    im = flat
+                elif im.mode not in ('RGB', 'L'):
+                    im = im.convert('RGB')
+                if im.getcolors(maxcolors=256) is None:
+                    dst = os.path.join(self.image_cache_dir, f"{key}_flat.jpg")
+                    im.save(dst, 'JPEG', quality=90)
+                else:
+                    dst = os.path.join(self.image_cache_dir, f"{key}_flat.png")
+                    im.save(dst, 'PNG')
+                return dst
+        except Exception:
+            return path
+
+    # ---------- image preprocessing ----------
+    def set_image_dpi(self, dpi):
+        """dpi: a number, a preset name ('print' / 'web'), or None to embed originals."""
+        self.image_dpi = _dpi_value(dpi)
+
+    def image_size(self, path: str) -> Optional[Tuple[int, int]]:
+        """Registry lookup: pixel size of `path`, probed from its header once per run."""
+        if path not in self._image_sizes:
+            self._image_sizes[path] = probe_image_size(path)
+        return self._image_sizes[path]
+
+    def canonical_image(self, path: str) -> str:
+        """First path seen with the same content, so identical files embed as one XObject."""
+        return self._canonical_images.setdefault(self._source_hash(path), path)
+
+    def _source_hash(self, path: str) -> str:
+        h = self._source_hashes.get(path)
+        if h is None:
+            with open(path, 'rb') as f:
+                h = hashlib.sha1(f.read()).hexdigest()
+            self._source_hashes[path] = h
+        return h
+
+    def _image_executor(self):
+        if self._image_pool is None:
+            # spawn, not fork: the pool is created lazily from builds that already run threads
+            # (pipeline stages, sheet reads, the service's build threads)
+            self._image_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 2,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+        return self._image_pool
+
+    def prepare_image(self, path, box_w_pt, box_h_pt, keep_aspect=True) -> Optional[_ImageJob]:
+        """
+        Queue `path` for resampling to the pixels it actually occupies in a box_w_pt x box_h_pt
+        box at self.image_dpi. keep_aspect=True mirrors KeepInFrame(mode='shrink') (fit, never
+        enlarge); False is for images stretched to the box (covers). Variants for the extra
+        output targets' DPIs are queued alongside.
+        """
+        src_px = self.image_size(path)
+        if not src_px:
+            return None
+        sw, sh = src_px
+        if keep_aspect:
+            scale = min(1.0, box_w_pt / sw, box_h_pt / sh)
+            out_w_pt, out_h_pt = sw * scale, sh * scale
+        else:
+            out_w_pt, out_h_pt = box_w_pt, box_h_pt
+        for dpi in self._variant_dpis:
+            self._resample_job(path, src_px, out_w_pt, out_h_pt, dpi)
+        if not self.image_dpi:
+            return None
+        return self._resample_job(path, src_px, out_w_pt, out_h_pt, self.image_dpi, self._image_stats)
+
+    def _resample_job(self, path, src_px, out_w_pt, out_h_pt, dpi, stats=None) -> _ImageJob:
+        """Job for `path` at out_w_pt x out_h_pt and `dpi`, cached by (source hash, target size, DPI)."""
+        sw, sh = src_px
+        k = dpi / 72.0
+        target = (max(1, min(sw, int(round(out_w_pt * k)))),
+                  max(1, min(sh, int(round(out_h_pt * k)))))
+        if target[0] * target[1] >= 0.8 * sw * sh:
+            return _ImageJob(path, src_px)   # already close to the needed size
+
+        key = (self._source_hash(path), target, dpi)
+        with self._jobs_lock:   # layout (pipeline thread) and output targets (render) both queue jobs
+            job = self._image_jobs.get(key)
+            if job is not None:
+                return job
+            ext = '.jpg' if path.lower().endswith(('.jpg', '.jpeg')) else '.png'
+            dst = os.path.join(self.image_cache_dir, f"{key[0]}_{target[0]}x{target[1]}_{dpi}{ext}")
+            future = None
+            if not os.path.exists(dst):
+                future = self._image_executor().submit(_resample_image_file, path, dst, target)
+            job = self._image_jobs[key] = _ImageJob(path, src_px, output=dst, future=future, stats=stats)
+            self._job_sources[dst] = path
+            return job
+
+    def image_variant(self, path, w_pt, h_pt, dpi) -> str:
+        """File to embed for an image the primary output drew from `path` at w_pt x h_pt, at `dpi`."""
+        dpi = _dpi_value(dpi)
+        if dpi == self.image_dpi:
+            return path
+        source = self._job_sources.get(path, path)
+        src_px = self.image_size(source)
+        if not dpi or not src_px:
+            return source
+        # images are drawn a little inside the box prepare_image() sized them for, so reuse the
+        # smallest variant already queued for this source that still covers the drawn size
+        need = (w_pt * dpi / 72.0 - 0.5, h_pt * dpi / 72.0 - 0.5)
+        h = self._source_hash(source)
+        queued = [t for (kh, t, kd) in list(self._image_jobs) if kh == h and kd == dpi
+                  and t[0] >= need[0] and t[1] >= need[1]]
+        if queued:
+            return self._image_jobs[(h, min(queued, key=lambda t: t[0] * t[1]), dpi)].result()
+        return self._resample_job(source, src_px, w_pt, h_pt, dpi).result()
+
+    def _finish_image_pipeline(self):
+        for job in self._image_jobs.values():
+            job.result()
+        if self._image_pool is not None:
+            self._image_pool.shutdown()
+            self._image_pool = None
+        st = self._image_stats
+        if st['resampled']:
+            saved = st['bytes_in'] - st['bytes_out']
+            log.info(f"🖼️ Resampled {st['resampled']} images at {self.image_dpi} DPI: "
+                     f"{st['bytes_in']/1048576:.1f} MB -> {st['bytes_out']/1048576:.1f} MB "
+                     f"({saved/1048576:.1f} MB saved)")
+        return st
+
+    def _abort_image_pipeline(self):
+        """Failed build: drop queued resampling work and stop the worker processes."""
+        if self._image_pool is not None:
+            self._image_pool.shutdown(cancel_futures=True)
+            self._image_pool = None
+        self._image_jobs = {k: j for k, j in self._image_jobs.items()
+                            if j._future is None or (j._future.done() and not j._future.cancelled())}
+
     def create_safe_image_box(self, path, max_w, max_h, height_cap=0.75, empty_placeholder=False):
         max_h = max_h * height_cap
-        if path and os.path.exists(path):
-            img = Image(path); img.hAlign = 'CENTER'
-            return KeepInFrame(max_w, max_h, [img], mode='shrink', vAlign='TOP')
+        src_px = self.image_size(path) if path and os.path.exists(path) else None
+        if src_px:
+            path = self.canonical_image(path)
+            return FittedImage(self.prepare_image(path, max_w, max_h) or path, src_px, max_w, max_h)
         if empty_placeholder:
             return Table([['']], colWidths=[max_w], rowHeights=[max_h],
                          style=TableStyle([('LEFTPADDING',(0,0),(-1,-1),0),
@@ -582,7 +2440,7 @@ class ProfessionalPDFGenerator:
         # Shrink-only logic
         fs = original_fs
         def width(size):
-            return pdfmetrics.stringWidth(text, fn, size)
+            return string_width(text, fn, size)
 
         w = width(fs)
         while w > max_w and fs > min_fs:
@@ -670,120 +2528,74 @@ class ProfessionalPDFGenerator:
         Improved: auto-detect optimal widths, prevent large blank gaps,
         and ensure most values stay in one line without wrapping.
         """
-        def sw(txt, fn, fs):
-            return pdfmetrics.stringWidth(str(txt or ""), fn, fs)
-
         fn_h = self.styles['DetailKey'].fontName
         fn_v = self.styles['DetailVal'].fontName
         fs   = 9
         min_pt = base_min_mm * mm
+        n = len(headers)
 
-        # --- 1️⃣ Measure maximum text width per column ---
-        raw_widths = []
-        for j, h in enumerate(headers):
-            m = sw(h, fn_h, fs)
-            for r in rows_text:
-                if j < len(r):
-                    m = max(m, sw(r[j], fn_v, fs))
-            raw_widths.append(m + pad_pt)
+        # --- 1️⃣ Measure maximum text width per column (one batch per column) ---
+        raw_widths = measure_strings(headers, fn_h, fs)
+        for j in range(n):
+            col = [r[j] for r in rows_text if j < len(r)]
+            if col:
+                raw_widths[j] = max(raw_widths[j], measure_strings(col, fn_v, fs).max())
+        raw_widths = raw_widths + pad_pt
 
         # --- 2️⃣ Special handling for Size and Height columns ---
-        for j, h in enumerate(headers):
-            header_clean = str(h).strip().lower()
-            if header_clean == "height":
-                # Cap Height column width to 130pt
-                raw_widths[j] = min(raw_widths[j], 130)
-            # 🔴 FIX: Also cap Size column width to prevent it from dominating
-            elif header_clean == "size":
-                # Cap Size column to reasonable width (30% of total or 100pt max)
-                size_max = min(total_w_pts * 0.30, 100)
-                raw_widths[j] = min(raw_widths[j], size_max)
+        header_clean = np.array([str(h).strip().lower() for h in headers], dtype=object)
+        # Cap Height column width to 130pt
+        raw_widths = np.where(header_clean == "height", np.minimum(raw_widths, 130), raw_widths)
+        # 🔴 FIX: Also cap Size column width to prevent it from dominating
+        # (30% of total or 100pt max)
+        size_max = min(total_w_pts * 0.30, 100)
+        raw_widths = np.where(header_clean == "size", np.minimum(raw_widths, size_max), raw_widths)
 
         # --- 3️⃣ Normalize extremely large columns ---
         max_allowed = max_col_ratio * total_w_pts
-        raw_widths = [min(w, max_allowed) for w in raw_widths]
+        raw_widths = np.minimum(raw_widths, max_allowed)
 
         # --- 4️⃣ Calculate total and compression ratio ---
-        total_raw = sum(raw_widths)
+        total_raw = raw_widths.sum()
+        avg = total_raw / n
         if total_raw <= total_w_pts:
             # If total is smaller than page width, distribute leftover proportionally
             leftover = total_w_pts - total_raw
             # Give more leftover to longer columns (not short ones)
-            avg = total_raw / len(raw_widths)
-            weights = [min(2.0, w / avg) for w in raw_widths]
-            total_weight = sum(weights)
-            adj = [w + leftover * (weights[i] / total_weight) for i, w in enumerate(raw_widths)]
+            weights = np.minimum(2.0, raw_widths / avg)
+            adj = raw_widths + leftover * (weights / weights.sum())
         else:
             # If total too wide, compress large columns more aggressively
             compress_factor = total_w_pts / total_raw
             # Columns > average shrink more, smaller shrink less
-            avg = total_raw / len(raw_widths)
-            adj = []
-            for w in raw_widths:
-                ratio = 0.7 + 0.6 * min(1.0, w / avg)
-                adj.append(w * compress_factor * ratio)
+            ratio = 0.7 + 0.6 * np.minimum(1.0, raw_widths / avg)
+            adj = raw_widths * compress_factor * ratio
 
         # --- 5️⃣ Enforce minimum width & normalize total exactly ---
-        adj = [max(min_pt, w) for w in adj]
-        factor = total_w_pts / sum(adj)
-        final = [w * factor for w in adj]
+        adj = np.maximum(min_pt, adj)
+        final = adj * (total_w_pts / adj.sum())
 
-        return final
+        return final.tolist()
 
     # ---------- fixed-size cell helper ----------
     def _clip_cell(self, text, style, col_width_pt, max_lines=1, pad_lr_pt=3, pad_tb_pt=0, valign='MIDDLE'):
-        # --- INLINE ICON HANDLING FOR TABLE FORMAT ---
-        # Only convert if input begins with "<span>"
-        t_raw = str(text).strip()
-        if t_raw.lower().startswith("<span>"):
-            # remove <span>
-            t_clean = t_raw[6:].strip()
-
-            icon_map = {
-                "flat": "/workspaces/testing2/Flat.png",
-                "half round": "/workspaces/testing2/Half Round.png",
-                "round": "/workspaces/testing2/Round.png",
-                "triangle": "/workspaces/testing2/Triangle.png",
-                "square": "/workspaces/testing2/Square.png",
-            }
-            low = t_clean.lower()
-            for key, path in icon_map.items():
-                if key in low:
-                    # RETURN icon+text flowable immediately
-                    return (
-                        InlineImageText(
-                            img_path=path,
-                            txt=t_clean,
-                            style=style,
-                            img_width=12
-                        ),
-                        style.leading + 6  # row height
-                    )
-
-        # --- ICON HANDLING FOR TABLE FORMAT ---
-        # Only convert if column value starts with "<span>"
-        t_raw = str(text).strip()
-        if t_raw.lower().startswith("<span>"):
-            # remove <span>
-            t_clean = t_raw[6:].strip()
-
-            # mapping
-            icon_map = {
-                "flat": "/workspaces/testing2/Flat.png",
-                "half round": "/workspaces/testing2/Half Round.png",
-                "round": "/workspaces/testing2/Round.png",
-                "triangle": "/workspaces/testing2/Triangle.png",
-                "square": "/workspaces/testing2/Square.png",
-            }
-
-            low = t_clean.lower()
-            for key, path in icon_map.items():
-                if key in low:
-                    # IMPORTANT: ReportLab wants <image>
-                    text = f'<image file="{path}" width="12"/> {t_clean}'
-                    break
+        layout = self._clip_cell_layout(text, style, col_width_pt, max_lines, pad_lr_pt, pad_tb_pt)
+        return self._clip_cell_from_layout(layout, style, col_width_pt, pad_lr_pt, pad_tb_pt, valign), layout[-1]
+
+    def _clip_cell_layout(self, text, style, col_width_pt, max_lines=1, pad_lr_pt=3, pad_tb_pt=0):
+        """Measure a fixed-width cell: (shape, text, wrapped lines, line count, height). No flowables kept."""
+        # --- SHAPE ICON HANDLING ---
+        # Values starting with "<span>" get their shape icon in front of the text
+        shape = None
+        span = match_shape_span(text)
+        if span is not None:
+            shape, text = span
+            if not shape_icon(shape):
+                shape = None
+        icon_w = (ICON_SIZE + 2) if shape else 0
 
         text_str = self.clean_html_css(text or "")
+        text_w = max(1, col_width_pt - 2*pad_lr_pt - icon_w)
 
         # 🔴 SMART LINE DETECTION: Auto-calculate needed lines based on content
         # ✅ FIX: determine lines ONLY by real breaks, not estimation
@@ -796,7 +2608,7 @@ class ProfessionalPDFGenerator:
             text=text_str,
             fontName=style.fontName,
             fontSize=style.fontSize,
-            max_width_pt=max(1, col_width_pt - 2*pad_lr_pt),
+            max_width_pt=text_w,
             max_lines=max_lines,
             leading=style.leading * 1.25,
             align='LEFT',
@@ -812,6 +2624,12 @@ class ProfessionalPDFGenerator:
         # 🔴 FIXED: Use consistent leading multiplier (1.25) for both height calculation and text rendering
         effective_leading = style.leading * 1.25  # Changed from 1.15 to 1.25 to match the inner box
         fixed_h = max(1, eff_max_lines * effective_leading + 3.5 * pad_tb_pt)
+        return shape, text_str, _measure.lines, eff_max_lines, fixed_h
+
+    def _clip_cell_from_layout(self, layout, style, col_width_pt, pad_lr_pt=3, pad_tb_pt=0, valign='MIDDLE'):
+        """Build the cell flowables from a _clip_cell_layout result (lines already wrapped)."""
+        shape, text_str, lines, eff_max_lines, fixed_h = layout
+        icon_w = (ICON_SIZE + 2) if shape else 0
 
         # Check if this is an Item Code that should be red
         text_color = getattr(style, 'textColor', colors.black)
@@ -820,13 +2638,17 @@ class ProfessionalPDFGenerator:
             text=text_str,
             fontName=style.fontName,
             fontSize=style.fontSize,
-            max_width_pt=max(1, col_width_pt - 2*pad_lr_pt),
+            max_width_pt=max(1, col_width_pt - 2*pad_lr_pt - icon_w),
             max_lines=eff_max_lines,  # Use calculated max_lines
             leading=style.leading * 1.25,
             align='LEFT',
             v_align='MIDDLE',
             textColor=text_color  
         )
+        inner.lines = list(lines)
+        inner = self._profiled(inner)
+        if shape:
+            inner = self._profiled(InlineImageText(shape, inner))
         cell = PaddedBox(
             width=col_width_pt,
             height=fixed_h,
@@ -834,16 +2656,12 @@ class ProfessionalPDFGenerator:
             pad_l=pad_lr_pt, pad_r=pad_lr_pt, pad_t=pad_tb_pt, pad_b=pad_tb_pt,
             valign=valign
         )
-        return cell, fixed_h
+        return self._profiled(cell)
 
     # ---------- spec block ----------
     def build_specifications_card(self, raw_data, resolved_data, detail_limit, col_w, row_h, key_w_override=None):
-        from math import ceil
         from reportlab.lib import colors
         from reportlab.lib.styles import ParagraphStyle
-        from reportlab.pdfbase import pdfmetrics
-
-        sw = pdfmetrics.stringWidth
 
         # =========================================================
         # CATEGORY-SPECIFIC FONT OVERRIDE
@@ -906,8 +2724,9 @@ class ProfessionalPDFGenerator:
             if not key_label or not raw_val:
                 continue
 
-            val = detect_shape_from_span(raw_val)
-            val = self.clean_html_css(val)
+            # span-tagged shape values keep their tag; _clip_cell draws the icon
+            span = match_shape_span(raw_val)
+            val = '<span>' + self.clean_html_css(span[1]) if span else self.clean_html_css(raw_val)
 
             low = key_label.lower().strip()
 
@@ -930,56 +2749,21 @@ class ProfessionalPDFGenerator:
             rows = [('—', '—', val_style)]
 
         # =========================================================
-        # COLUMN WIDTHS
-        # =========================================================
-        pad_pt = 6
-        STANDARD_KEY_RATIO = 0.40
-
-        key_w = col_w * STANDARD_KEY_RATIO
-        val_w = col_w - key_w
-
-        # =========================================================
-        # LINE ALLOCATION LOGIC (UNCHANGED, SAFE)
+        # LAYOUT (memoized: variants in a Group ID often share spec rows)
         # =========================================================
-        total_lines_budget = max(1, int((row_h * 1.5) // val_style.leading))
-        n = len(rows)
-
-        desired, weights = [], []
-        avail_val_text_w = max(1, val_w - pad_pt)
-
-        for k, v, st in rows:
-            txt_w = sw(self.clean_html_css(v or ""), st.fontName, st.fontSize)
-            est = max(1, int(ceil(txt_w / (avail_val_text_w * 0.95))))
-            desired.append(est)
-
-            lowk = k.lower().strip()
-            if lowk in {'specification', 'specifications', 'features', 'material', 'size'}:
-                weights.append(1.6)
-            elif lowk == 'item code':
-                weights.append(0.8)
-            else:
-                weights.append(1.0)
-
-        lines = [1] * n
-        budget = max(n, total_lines_budget * 2)
-        remaining = budget - n
-
-        for i in range(n):
-            if desired[i] > 2:
-                extra = min(desired[i] - 1, 3)
-                give = min(extra, remaining)
-                lines[i] += give
-                remaining -= give
-
-        while remaining > 0:
-            best_i = max(
-                range(n),
-                key=lambda i: ((desired[i] - lines[i]) * weights[i], desired[i])
-            )
-            if desired[best_i] <= lines[best_i]:
-                break
-            lines[best_i] += 1
-            remaining -= 1
+        cache_key = (tuple((k, v, self._style_sig(st)) for k, v, st in rows),
+                     col_w, self._style_sig(key_style))
+        layout = self._spec_layout_cache.get(cache_key)
+        if layout is None:
+            layout = self._spec_card_layout(rows, key_style, col_w)
+            self._spec_layout_cache.put(cache_key, layout)
+        key_w, val_w, row_layouts = layout
+        if self.dry_run:
+            for (k, v, st), (key_layout, val_layout, _rh) in zip(rows, row_layouts):
+                for cell, cell_layout in (('key', key_layout), ('value', val_layout)):
+                    if self._layout_truncated(cell_layout):
+                        self._dry_truncated.append({'sku': item_code, 'field': k, 'cell': cell,
+                                                    'text': cell_layout[1]})
 
         # =========================================================
         # BUILD TABLE
@@ -987,43 +2771,9 @@ class ProfessionalPDFGenerator:
         table_rows = []
         row_heights = []
 
-        for (k, v, st), ml in zip(rows, lines):
-            cleaned_v = self.clean_html_css(v or "")
-
-            # Force single-line if it fits
-            if (
-                '\n' not in cleaned_v and
-                pdfmetrics.stringWidth(cleaned_v, st.fontName, st.fontSize) <= (val_w - 10)
-            ):
-                ml = 1
-
-            # 🔥 FIX: Keys that fit in one line must stay one line
-            key_text = self.clean_html_css(k)
-            key_width = pdfmetrics.stringWidth(
-                key_text,
-                key_style.fontName,
-                key_style.fontSize
-            )
-
-            key_max_lines = 1 if key_width <= (key_w - 6) else 2
-
-            key_cell, h1 = self._clip_cell(
-                k, key_style, key_w,
-                max_lines=key_max_lines,
-                pad_lr_pt=3,
-                pad_tb_pt=0
-            )
-
-
-            val_cell, h2 = self._clip_cell(
-                v, st, val_w,
-                max_lines=9999,
-                pad_lr_pt=5,
-                pad_tb_pt=3,
-                valign='MIDDLE'
-            )
-
-            rh = max(h1, h2)
+        for (k, v, st), (key_layout, val_layout, rh) in zip(rows, row_layouts):
+            key_cell = self._clip_cell_from_layout(key_layout, key_style, key_w, pad_lr_pt=3, pad_tb_pt=0)
+            val_cell = self._clip_cell_from_layout(val_layout, st, val_w, pad_lr_pt=5, pad_tb_pt=3, valign='MIDDLE')
             table_rows.append([key_cell, val_cell])
             row_heights.append(rh)
 
@@ -1042,7 +2792,7 @@ class ProfessionalPDFGenerator:
             ('LINEBELOW', (0,0), (-1,-2), 0.5, colors.HexColor('#999999')),
         ]))
 
-        outer = Table([[inner]], colWidths=[col_w])
+        outer = Table([[self._profiled(inner)]], colWidths=[col_w])
         outer.setStyle(TableStyle([
             ('LEFTPADDING', (0,0), (-1,-1), 0),
             ('RIGHTPADDING', (0,0), (-1,-1), 0),
@@ -1053,6 +2803,48 @@ class ProfessionalPDFGenerator:
 
         return outer
 
+    @staticmethod
+    def _layout_truncated(layout):
+        """True when the wrapped lines of a _clip_cell_layout result don't hold the whole text."""
+        _shape, text_str, lines, _n, _h = layout
+        return ''.join(''.join(lines).split()) != ''.join(text_str.split())
+
+    @staticmethod
+    def _style_sig(st):
+        return (st.name, st.fontName, st.fontSize, st.leading, st.textColor)
+
+    def _spec_card_layout(self, rows, key_style, col_w):
+        """Measure a spec card once: (key_w, val_w, [(key_layout, val_layout, row_h)])."""
+        sw = string_width
+
+        # =========================================================
+        # COLUMN WIDTHS
+        # =========================================================
+        STANDARD_KEY_RATIO = 0.40
+
+        key_w = col_w * STANDARD_KEY_RATIO
+        val_w = col_w - key_w
+
+        row_layouts = []
+        for k, v, st in rows:
+            # rows repeat across variants even when the Item Code makes the card unique
+            row_key = (k, v, self._style_sig(st), self._style_sig(key_style), key_w, val_w)
+            row_layout = self._spec_row_cache.get(row_key)
+            if row_layout is None:
+                # 🔥 FIX: Keys that fit in one line must stay one line
+                key_width = sw(self.clean_html_css(k), key_style.fontName, key_style.fontSize)
+                key_max_lines = 1 if key_width <= (key_w - 6) else 2
+
+                key_layout = self._clip_cell_layout(k, key_style, key_w, max_lines=key_max_lines,
+                                                    pad_lr_pt=3, pad_tb_pt=0)
+                val_layout = self._clip_cell_layout(v, st, val_w, max_lines=9999,
+                                                    pad_lr_pt=5, pad_tb_pt=3)
+                row_layout = (key_layout, val_layout, max(key_layout[-1], val_layout[-1]))
+                self._spec_row_cache.put(row_key, row_layout)
+            row_layouts.append(row_layout)
+
+        return key_w, val_w, row_layouts
+
 
     # ---------- product block for 2/3/4 ----------
     def _product_block(self, product_data, container_h, row_h, img_w, spec_w, detail_limit,
@@ -1061,7 +2853,7 @@ class ProfessionalPDFGenerator:
         raw = product_data['raw']; res = product_data['resolved']; imgs = product_data['images']
         name = self.get_first_non_empty(res, ['Item Name','Title','Product Name']) or 'UNKNOWN PRODUCT'
 
-        elems.append(self.create_item_name_with_line(name))
+        elems.append(self._profiled(self.create_item_name_with_line(name)))
         elems.append(Spacer(1, 8 * mm))
 
         main_url = self.get_best_image(imgs)
@@ -1071,7 +2863,7 @@ class ProfessionalPDFGenerator:
         spec_card = self.build_specifications_card(raw, res, detail_limit, spec_w, row_h, key_w_override=key_w_override)
         spec_card_box = self.fixed_box(spec_card, spec_w, row_h)
 
-        spec_cell = Table([[spec_card_box]], colWidths=[spec_w], rowHeights=[row_h])
+        spec_cell = Table([[self._profiled(spec_card_box)]], colWidths=[spec_w], rowHeights=[row_h])
         spec_cell.setStyle(TableStyle([
             ('LEFTPADDING',   (0,0), (-1,-1), 0),
             ('RIGHTPADDING',  (0,0), (-1,-1), 0),
@@ -1083,9 +2875,9 @@ class ProfessionalPDFGenerator:
         row_cells, col_w = [], []
         if left_pad > 0:
             row_cells.append(''); col_w.append(left_pad)
-        row_cells.append(image_box); col_w.append(img_w)
+        row_cells.append(self._profiled(image_box)); col_w.append(img_w)
         row_cells.append('');        col_w.append(gutter)
-        row_cells.append(spec_cell); col_w.append(spec_w)
+        row_cells.append(self._profiled(spec_cell)); col_w.append(spec_w)
 
         row = Table([row_cells], colWidths=col_w, rowHeights=[row_h])
         row.setStyle(TableStyle([
@@ -1095,7 +2887,7 @@ class ProfessionalPDFGenerator:
             ('TOPPADDING',    (0,0), (-1,-1), 0),
             ('BOTTOMPADDING', (0,0), (-1,-1), 0),
         ]))
-        elems.append(row)
+        elems.append(self._profiled(row))
 
         wrapper = Table([[elems]], colWidths=[sum(col_w)], rowHeights=[container_h])
         wrapper.setStyle(TableStyle([
@@ -1115,7 +2907,7 @@ class ProfessionalPDFGenerator:
         raw = product_data['raw']; res = product_data['resolved']; imgs = product_data['images']
         name = self.get_first_non_empty(res, ['Item Name','Title','Product Name']) or 'UNKNOWN PRODUCT'
 
-        elems.append(self.create_item_name_with_line(name))
+        elems.append(self._profiled(self.create_item_name_with_line(name)))
         elems.append(Spacer(1, 8 * mm))
 
         main_url = self.get_best_image(imgs)
@@ -1124,7 +2916,7 @@ class ProfessionalPDFGenerator:
 
         spec_card = self.build_specifications_card(raw, res, detail_limit, spec_w, row_h,
                                                key_w_override=key_w_override)
-        spec_cell = Table([[spec_card]], colWidths=[spec_w], rowHeights=[row_h])
+        spec_cell = Table([[self._profiled(spec_card)]], colWidths=[spec_w], rowHeights=[row_h])
         spec_cell.setStyle(TableStyle([
             ('VALIGN',(0,0),(-1,-1),'TOP'),
             ('LEFTPADDING',(0,0),(-1,-1),0),
@@ -1137,9 +2929,9 @@ class ProfessionalPDFGenerator:
         col_w = []
         if left_pad > 0:
             row_cells.append(''); col_w.append(left_pad)
-        row_cells.append(image_box); col_w.append(img_w)
+        row_cells.append(self._profiled(image_box)); col_w.append(img_w)
         row_cells.append(''); col_w.append(gutter)
-        row_cells.append(spec_cell); col_w.append(spec_w)
+        row_cells.append(self._profiled(spec_cell)); col_w.append(spec_w)
 
         row = Table([row_cells], colWidths=col_w, rowHeights=[row_h])
         row.setStyle(TableStyle([
@@ -1150,7 +2942,7 @@ class ProfessionalPDFGenerator:
             ('TOPPADDING',(0,0),(-1,-1),0),
             ('BOTTOMPADDING',(0,0),(-1,-1),0),
         ]))
-        elems.append(row)
+        elems.append(self._profiled(row))
         wrapper = Table([[elems]], colWidths=[sum(col_w)], rowHeights=[container_h])
         wrapper.setStyle(TableStyle([
             ('VALIGN',(0,0),(-1,-1),'TOP'),
@@ -1193,7 +2985,7 @@ class ProfessionalPDFGenerator:
         graph_w = total_w * 0.85
 
         graph_inner = self.create_safe_image_box(graph_path, graph_w, graph_h, height_cap=1.0, empty_placeholder=True)
-        graph_row = Table([[graph_inner]], colWidths=[total_w])
+        graph_row = Table([[self._profiled(graph_inner)]], colWidths=[total_w])
         graph_row.setStyle(TableStyle([
             ('ALIGN', (0,0), (-1,-1), 'CENTER'),
             ('LEFTPADDING', (0,0), (-1,-1), 0),
@@ -1210,7 +3002,7 @@ class ProfessionalPDFGenerator:
 
         elems = []
         item_name = self.create_item_name_with_line(name)
-        item_name_wrapper = Table([[item_name]], colWidths=[self._content_width_pts()])
+        item_name_wrapper = Table([[self._profiled(item_name)]], colWidths=[self._content_width_pts()])
         item_name_wrapper.setStyle(TableStyle([
             ('LEFTPADDING',(0,0),(-1,-1), 0),
             ('RIGHTPADDING',(0,0),(-1,-1), 0),
@@ -1226,7 +3018,7 @@ class ProfessionalPDFGenerator:
         main_path = self.download_image(main_url) if main_url else None
         # Shift the image downward (adjust TOPPADDING as needed)
         image_box = Table(
-            [[self.create_safe_image_box(main_path, img_w, row_h, height_cap=0.40)]],
+            [[self._profiled(self.create_safe_image_box(main_path, img_w, row_h, height_cap=0.40))]],
             colWidths=[img_w],
             style=[
                 ('TOPPADDING', (0,0), (-1,-1), 8),  
@@ -1241,9 +3033,9 @@ class ProfessionalPDFGenerator:
         bottom_cells = []; col_w = []
         if left_pad > 0:
             bottom_cells.append(''); col_w.append(left_pad)
-        bottom_cells.append(image_box); col_w.append(img_w)
+        bottom_cells.append(self._profiled(image_box)); col_w.append(img_w)
         bottom_cells.append('');       col_w.append(gutter)
-        bottom_cells.append(spec_card); col_w.append(spec_w)
+        bottom_cells.append(self._profiled(spec_card)); col_w.append(spec_w)
 
         row = Table([bottom_cells], colWidths=col_w)
         row.setStyle(TableStyle([
@@ -1257,7 +3049,9 @@ class ProfessionalPDFGenerator:
         return elems
 
     # ---------- TABLE (one per page) ----------
-    def create_table_format(self, group_data):
+    def create_table_format(self, group_data, measure: bool = False):
+        """Item name, banner image and spec table of one Group ID. measure: skip the image
+        download, the banner keeps its full box height (see _table_height)."""
         elements = []
         if not group_data:
             return elements
@@ -1271,7 +3065,7 @@ class ProfessionalPDFGenerator:
 
         # Item name with trailing line
         item_name_flow = self.create_item_name_with_line(name)
-        item_name_wrapper = Table([[item_name_flow]], colWidths=[total_w_pts])
+        item_name_wrapper = Table([[self._profiled(item_name_flow)]], colWidths=[total_w_pts])
         item_name_wrapper.setStyle(TableStyle([
             ('LEFTPADDING', (0,0), (-1,-1), 0),
             ('RIGHTPADDING',(0,0),(-1,-1), 0),
@@ -1283,7 +3077,7 @@ class ProfessionalPDFGenerator:
 
         # Header image (top banner)
         header_img_url  = self.get_best_image(imgs0)
-        header_img_path = self.download_image(header_img_url) if header_img_url else None
+        header_img_path = self.download_image(header_img_url) if header_img_url and not measure else None
         header_img_h = 45 * mm
         elements.append(self.create_safe_image_box(header_img_path, total_w_pts, header_img_h, height_cap=1.0, empty_placeholder=True))
         elements.append(Spacer(1, 5 * mm))
@@ -1401,7 +3195,7 @@ class ProfessionalPDFGenerator:
                 ('TEXTCOLOR', (0, row_idx), (0, row_idx), colors.red),
             ]))
 
-        table_wrapper = Table([[t]], colWidths=[total_w_pts])
+        table_wrapper = Table([[self._profiled(t)]], colWidths=[total_w_pts])
         table_wrapper.setStyle(TableStyle([
             ('LEFTPADDING', (0, 0), (-1, -1), 0),
             ('RIGHTPADDING', (0, 0), (-1, -1), 0),
@@ -1418,24 +3212,122 @@ class ProfessionalPDFGenerator:
         # Reuse create_table_format but avoid repeated returns – we need the elements
         return self.create_table_format(group_data)
 
-    def create_full_page_cover(self, image_url: str):
+    def _table_height(self, group_data) -> float:
+        """Laid-out height (pt) of create_table_format(group_data); an upper bound, since a
+        fitted banner image is never taller than its box."""
+        w = self._content_width_pts()
+        return sum(f.wrap(w, A4[1])[1] for f in self.create_table_format(group_data, measure=True))
+
+    def _table2_space(self, subcategory) -> float:
+        """Height (pt) left for tables on a TABLE2 page below the subcategory header."""
+        doc = self._make_doc(io.BytesIO())
+        frame_h = doc.height - 12   # Frame's default 6pt top and bottom padding
+        header = sum(f.wrap(doc.width, frame_h)[1] for f in self.create_subcategory_header(subcategory))
+        return frame_h - header - _mm(self._header_band_mm - 11.5) - TABLE2_SAFETY_PT
+
+    def _pair_table2(self, groups):
+        """
+        Set g['table2_partner'] = next group for TABLE2 groups sharing a page (top + bottom):
+        consecutive Group IDs of the same section whose measured tables fit on one page
+        together. A table that fits with neither neighbour keeps a page to itself instead of
+        overflowing into a split. Pairing the first pair that fits is optimal along a run of
+        consecutive groups, so one pass gives the fewest pages.
+        """
+        def section(g):
+            return (_s(g['category']).upper(), g['subcategory'] or '')
+        heights, space = {}, {}
+        def height(k):
+            if k not in heights:
+                heights[k] = self._table_height(groups[k]['rows'])
+            return heights[k]
+        i = 0
+        while i < len(groups):
+            g = groups[i]
+            if not (_norm(g['format']) == 'TABLE2' and i + 1 < len(groups)
+                    and _norm(groups[i + 1]['format']) == 'TABLE2' and section(g) == section(groups[i + 1])):
+                i += 1
+                continue
+            sub = g['subcategory'] or ''
+            if sub not in space:
+                space[sub] = self._table2_space(sub)
+            if height(i) + TABLE2_GAP_MM * mm + height(i + 1) <= space[sub]:
+                g['table2_partner'] = groups[i + 1]
+                self.metrics.count('table2_pairs')
+                i += 2
+            else:
+                self.metrics.count('table2_unpaired')
+                i += 1
+
+    def create_full_page_cover(self, image_url: str, category: str = None):
+        if self.dry_run:
+            marker = Spacer(0, 0); marker._page_map = {'cover': image_url}
+            return [marker, PageBreak()]
         path = self.download_image(image_url)
         if not path or not os.path.exists(path): return []
         generator = self
+        path = self.canonical_image(path)
+        job = self.prepare_image(path, A4[0], A4[1], keep_aspect=False)
         class FullPageImage(Flowable):
             def __init__(self, img_path):
                 super().__init__(); self.img_path = img_path; self.width, self.height = A4
             def wrap(self, availWidth, availHeight): return (0, 0)
             def drawOn(self, canv, x, y, _sW=0):
                 generator._hide_footer_for_page = True
+                canv._current_category = category
+                canv._current_format = None   # counted as a cover page
                 canv.saveState()
-                canv.drawImage(self.img_path, 0, 0, width=A4[0], height=A4[1])
+                canv.drawImage(job.result() if job else self.img_path, 0, 0, width=A4[0], height=A4[1])
                 canv.restoreState()
         return [FullPageImage(path), PageBreak()]
 
     # ---------- grouping helper (GroupID-aware pagination for 2/3/4) ----------
     # ---------- grouping helper (GroupID-aware pagination for 2/3/4) ----------
     def _paginate_groups(self, items: List[dict], per_page: int) -> List[List[dict]]:
+        """Split a subcategory's products into pages with self.page_packer (see PAGE_PACKERS)."""
+        pages = self._pack_items(items, per_page)
+        if self.page_packer != 'greedy':
+            self.metrics.count('pages_saved_by_packer', len(self._paginate_greedy(items, per_page)) - len(pages))
+        gids = [_s(it['raw'].get('Group ID', '')) for it in items]
+        k, splits = 0, 0
+        for p in pages[:-1]:
+            k += len(p)
+            splits += bool(gids[k] and gids[k] == gids[k - 1])
+        self.metrics.count('product_pages', len(pages))
+        self.metrics.count('group_splits', splits)
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Paginating %d items into %d pages with %d per page", len(items), len(pages), per_page,
+                      extra={'items': len(items), 'pages': len(pages), 'per_page': per_page})
+            for i, p in enumerate(pages):
+                group_ids = sorted(set(_s(item['raw'].get('Group ID', '')) for item in p))
+                log.debug("  Page %d: %d items, Group IDs: %s", i + 1, len(p), group_ids,
+                          extra={'page': i + 1, 'items': len(p), 'group_ids': group_ids})
+
+        return pages
+
+    def _pack_items(self, items: List[dict], per_page: int) -> List[List[dict]]:
+        """Pages of items as self.page_packer lays them out (no metrics; see _paginate_groups)."""
+        if self.page_packer not in PAGE_PACKERS:
+            raise ValueError(f"Unknown page packer {self.page_packer!r}, expected one of {PAGE_PACKERS}")
+        if self.page_packer == 'greedy':
+            return self._paginate_greedy(items, per_page)
+        gids = [_s(it['raw'].get('Group ID', '')) for it in items]
+        pages, k = [], 0
+        for size in pack_pages(gids, per_page, 'pages' if self.page_packer == 'tight' else 'splits'):
+            pages.append(items[k:k + size]); k += size
+        return pages
+
+    def _estimate_pages(self, g, bottom: bool = False) -> int:
+        """Pages _build_story gives group g (a TABLE2 bottom table shares its partner's page)."""
+        fmt = _norm(g['format'])
+        if fmt in ('TABLE', 'TABLE2'):
+            return 0 if bottom else 1
+        if fmt == '1WP':
+            return len(g['rows'])
+        return len(self._pack_items(g['rows'], {'3': 3, '4': 4}.get(fmt, 2)))
+
+    def _paginate_greedy(self, items: List[dict], per_page: int) -> List[List[dict]]:
+        """Original packer: a cluster goes on the last page if it fits, oversized clusters start a new page."""
         clusters: List[List[dict]] = []
         cur: List[dict] = []
         last_gid = None
@@ -1471,26 +3363,232 @@ class ProfessionalPDFGenerator:
                     pages[-1].extend(cl)
                 else:
                     pages.append(cl)
-
-        # Debug print
-        print(f"DEBUG: Paginating {len(items)} items into {len(pages)} pages with {per_page} per page")
-        for i, p in enumerate(pages):
-            group_ids = set(_s(item['raw'].get('Group ID', '')) for item in p)
-            print(f"  Page {i+1}: {len(p)} items, Group IDs: {group_ids}")
-
         return pages
 
     # ---------- build ----------
-    def generate_professional_pdf(self, output_path: str = None) -> str:
-        if not output_path:
-            ts = datetime.now().strftime('%Y%m%d_%H%M%S')
-            output_path = os.path.join(self.output_dir, f'professional_catalog_{ts}.pdf')
-
-        master_df   = self.get_sheet_data('Master')
-        resolved_df = self.get_sheet_data('Master_Resolved')
-        images_df   = self.get_sheet_data('Master_With_Images')
-        remark_df   = self.get_sheet_data('Remark')
-        if master_df.empty: raise Exception("Master sheet is empty")
+    def generate_professional_pdf(self, output_path: str = None, stream_pages: bool = False,
+                                  image_dpi='print', select: dict = None, draft: bool = False,
+                                  targets: list = None, optimize=None, upload_folder: str = None,
+                                  report_path: str = None, prometheus_path: str = None, profile=None,
+                                  pipeline: bool = False) -> str:
+        """
+        Build the catalog PDF.
+        stream_pages: write each finished page to disk right after showPage, so memory
+                      during doc.build no longer grows with the page count.
+        image_dpi:    resample images to their rendered box size at this DPI
+                      ('print' = 300, 'web' = 150, a number, or None for originals).
+        select:       partial build, e.g. {'categories': ['HAND TOOLS'], 'skus': [...]}
+                      (keys in SELECTOR_KEYS; values are lists or comma-separated strings).
+                      Only matching groups and their category covers are downloaded/rendered.
+        draft:        quick review copy with the same pages as production: 72 DPI cached
+                      thumbnails, built-in Helvetica laid out with Avenir metrics (nothing
+                      embedded), no page compression, pages streamed to disk as they finish.
+        targets:      extra outputs written from the same laid-out pages, e.g.
+                      [{'path': 'web.pdf', 'image_dpi': 'web'},
+                       {'path': 'split/{category}.pdf', 'split': 'category', 'compress': True}].
+                      Each gets its own image DPI (default: same as image_dpi) and page
+                      compression; split files keep the catalog's page numbers. Paths written
+                      are left in self.written_targets.
+        optimize:     post-process the output with optimize_pdf (needs pikepdf): True for
+                      linearized + object streams, or its keyword arguments as a dict, e.g.
+                      {'linearize': True, 'object_streams': True, 'compress_level': 9}.
+                      A target may carry its own 'optimize'. Reports go to self.optimize_reports.
+        upload_folder: Drive folder ID to upload the output to (resumable, chunked). The
+                      upload tails the file while it is written, so with stream_pages it
+                      overlaps rendering; with optimize it starts after post-processing.
+                      output_path may also be a BytesIO, uploaded from memory.
+                      The file ID is left in self.uploaded_file_id.
+        report_path:  write the run's RunMetrics report (stage times, peak RSS, counters,
+                      pages per format, render time per category) here as JSON.
+        prometheus_path: the same numbers in Prometheus textfile-collector format.
+        profile:      time wrap/split/drawOn of the story items (FlowableProfiler), by class
+                      and by page with the products on each page. True keeps the report in
+                      self.flowable_profile; a path also writes it there as JSON.
+        pipeline:     overlap image downloads, story layout and rendering (self.build_pipeline,
+                      see BuildPipeline) instead of laying out the whole story before doc.build.
+        """
+        self.metrics = RunMetrics()
+        try:
+            with self.metrics.stage('total'), self.metrics.counting_width_helpers():
+                self.set_draft(draft)
+                if draft:
+                    image_dpi, stream_pages = 'draft', True
+                self.set_image_dpi(image_dpi)
+                self._image_stats.update(resampled=0, bytes_in=0, bytes_out=0)
+                sinks = [self._make_sink(t, stream_pages) for t in targets or ()]
+                self._variant_dpis = {s.image_dpi for s in sinks} - {self.image_dpi, None}
+                if not output_path:
+                    ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    output_path = os.path.join(self.output_dir, f'professional_catalog_{ts}.pdf')
+
+                merged, groups, remark_lookup = self._collect_groups(select)
+                if not groups: raise Exception("No groups match the selection")
+                base_raw = merged[0]['raw'] if merged else {}
+                doc = self._make_doc(output_path, StreamingDocTemplate if pipeline else SimpleDocTemplate)
+                profiler = self.flowable_profiler = FlowableProfiler() if profile else None
+                canvasmaker = lambda *a, **k: FooterCanvas(*a, **k, generator=self, raw_data=base_raw, doc_ref=doc,
+                                                           stream_pages=stream_pages, sinks=sinks)
+                story = None
+                if not pipeline:
+                    with self.metrics.stage('build_story'):
+                        story = self._build_story(groups, remark_lookup)
+                    self.metrics.count('flowables', _count_flowables(story))
+                    if profiler:
+                        story = profiler.wrap(story)
+
+                to_file = isinstance(output_path, str)
+                upload_name = (os.path.basename(output_path) if to_file else
+                               f"professional_catalog_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+                live_upload = None
+                if upload_folder and to_file and not optimize:
+                    open(output_path, 'wb').close()   # tail this run's bytes, never a previous file
+                    tail = GrowingFile(output_path)
+                    uploader = ThreadPoolExecutor(max_workers=1)
+                    live_upload = uploader.submit(self.upload_stream_to_drive, tail, upload_name, upload_folder)
+                self.metrics.start_pages()
+                try:
+                    with self.metrics.stage('layout_render'), (profiler.active(doc) if profiler else nullcontext()):
+                        if story is None:
+                            self.build_pipeline.run(self, doc, groups, remark_lookup, canvasmaker)
+                        else:
+                            doc.build(story, canvasmaker=canvasmaker)
+                    if story is None:
+                        o = self.metrics.overlap()
+                        log.info("🔀 Pipeline overlap: " + ", ".join(f"{k} {v:.1f}s" for k, v in o['pairs'].items())
+                                 + f"; {o['hidden_s']:.1f}s of stage time hidden", extra={'overlap': o})
+                except BaseException:
+                    if live_upload: tail.abort(); uploader.shutdown()
+                    raise
+                if live_upload: tail.finish()
+                if profiler:
+                    self._write_flowable_profile(profiler, profile)
+                with self.metrics.stage('image_pipeline'):
+                    self._finish_image_pipeline()
+                self._variant_dpis = set()
+                self.written_targets = [p for s in sinks for p in s.outputs()]
+                self.optimize_reports = []
+                for opt, paths in [(optimize, [output_path])] + [(t.get('optimize', optimize), s.outputs())
+                                                                for t, s in zip(targets or (), sinks)]:
+                    if opt:
+                        for path in paths:
+                            with self.metrics.stage('optimize'):
+                                report = optimize_pdf(path, **(opt if isinstance(opt, dict) else {}))
+                            if report: self.optimize_reports.append(report)
+                if upload_folder:
+                    with self.metrics.stage('upload'):   # live upload: only the part left after rendering
+                        if live_upload:
+                            try:
+                                self.uploaded_file_id = live_upload.result()
+                            finally:
+                                uploader.shutdown(); tail.close()
+                        elif to_file:
+                            self.uploaded_file_id = self.upload_to_drive(output_path, upload_folder)
+                        else:
+                            output_path.seek(0)
+                            self.uploaded_file_id = self.upload_stream_to_drive(output_path, upload_name, upload_folder)
+                return output_path
+        except BaseException:
+            self._abort_image_pipeline()
+            raise
+        finally:
+            self.flowable_profiler = None
+            self.store_token()
+            self._write_run_report(report_path, prometheus_path, output=output_path)
+
+    def _write_run_report(self, report_path, prometheus_path, **extra):
+        """Write self.metrics (also after a failed build, so slow or broken runs are visible)."""
+        r = self.metrics.report()
+        log.info("⏱️ " + ", ".join(f"{k} {v['wall_s']:.2f}s" for k, v in r['stages'].items()),
+                 extra={'run_report': r})
+        if report_path:
+            self.metrics.write_json(report_path, **{k: v for k, v in extra.items() if isinstance(v, str)})
+        if prometheus_path:
+            self.metrics.write_prometheus(prometheus_path)
+
+    def _write_flowable_profile(self, profiler, profile):
+        self.flowable_profile = report = profiler.report()
+        if isinstance(profile, str):
+            with open(profile, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        top = report['by_class'][:3]
+        log.info("🔬 Layout hot spots: " + ", ".join(f"{c['class']}.{c['method']} {c['self_s']:.2f}s/{c['calls']}"
+                                                     for c in top), extra={'by_class': top})
+        for p in report['slowest_pages'][:3]:
+            log.info(f"🐢 Page {p['page']} ({p['category'] or 'cover'}): {p['self_s']:.2f}s in {p['calls']} calls, "
+                     f"products {', '.join(p['skus']) or '-'}", extra={'slow_page': p})
+
+    def _make_sink(self, target: dict, stream: bool):
+        kwargs = dict(image_dpi=_dpi_value(target.get('image_dpi', self.image_dpi)),
+                      compress=target.get('compress', True), stream=stream)
+        split = target.get('split')
+        if split == 'category':
+            return _CategorySplitSink(target['path'], self, **kwargs)
+        if split:
+            raise ValueError(f"Unknown split {split!r} (only 'category' is supported)")
+        os.makedirs(os.path.dirname(target['path']) or '.', exist_ok=True)
+        return _PageSink(target['path'], self, **kwargs)
+
+    def dry_run_layout(self, json_path: str = None, select: dict = None) -> dict:
+        """
+        Predict pagination without downloading or drawing anything: runs the real story
+        and frame layout with image boxes as same-size placeholders and returns a page map
+        (page count, SKUs per page, truncated spec cells). Written as JSON to json_path if given.
+        select: same partial-build selectors as generate_professional_pdf.
+        """
+        t0 = time.perf_counter()
+        self.dry_run = True
+        self._dry_truncated = []
+        self.metrics = RunMetrics()
+        try:
+            merged, groups, remark_lookup = self._collect_groups(select)
+            base_raw = merged[0]['raw'] if merged else {}
+            doc = self._make_doc(io.BytesIO(), doc_cls=_PageMapDocTemplate)
+            canvases = []
+            def make_canvas(*a, **k):
+                canvases.append(_DryRunCanvas(*a, **k, generator=self, raw_data=base_raw, doc_ref=doc))
+                return canvases[-1]
+            with self.metrics.stage('build_story'):
+                story = self._build_story(groups, remark_lookup)
+            self.metrics.start_pages()
+            with self.metrics.stage('layout_render'):
+                doc.build(story, canvasmaker=make_canvas)
+        finally:
+            self.dry_run = False
+
+        page_count = canvases[-1].page_count
+        pages, sku_pages = [], {}
+        for n in range(1, page_count + 1):
+            entry = dict(page=n, **doc.page_map.get(n, {'skus': []}))
+            pages.append(entry)
+            for code in entry['skus']:
+                sku_pages.setdefault(code, []).append(n)
+        truncated = [dict(t, pages=sku_pages.get(t['sku'], [])) for t in self._dry_truncated]
+        result = {'pages': page_count, 'page_map': pages, 'sku_pages': sku_pages,
+                  'truncated_cells': truncated, 'elapsed_s': round(time.perf_counter() - t0, 3)}
+        if not select:
+            # CatalogIndex estimate, plus the footer-only last page FooterCanvas.save closes
+            result['estimated_pages'] = self.catalog_index.pages + 1
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+        log.info(f"DRY RUN: {result['pages']} pages, {len(sku_pages)} SKUs, "
+                 f"{len(truncated)} truncated cells in {result['elapsed_s']}s")
+        return result
+
+    def _page_map_tag(self, flows, items):
+        """Dry run / profiling: tag a product block's flowables with its SKUs for the page map."""
+        if self.dry_run or self.flowable_profiler is not None:
+            codes = (_s(it['resolved'].get('Item Code') or it['resolved'].get('Code')) for it in items)
+            tag = {'skus': [c for c in codes if c]}
+            for f in flows:
+                f._page_map = tag
+        return flows
+
+    def _collect_groups(self, select: dict = None):
+        """Load the four sheets, merge rows and group them: (merged rows, groups, cover lookup)."""
+        with self.metrics.stage('fetch_sheets'):
+            rows = self._sheet_rows(SHEET_NAMES)
+            remark_df = pd.DataFrame(list(rows['Remark']))
 
         remark_lookup = {}
         if not remark_df.empty:
@@ -1499,48 +3597,118 @@ class ProfessionalPDFGenerator:
                 url = _s(row.get('Cover Page URL') or row.get('URL') or row.get('Cover URL'))
                 if cat: remark_lookup[cat.upper()] = url
 
-        merged, total = [], min(len(master_df), len(resolved_df), len(images_df))
-        for i in range(total):
-            m = master_df.iloc[i].to_dict()
-            r = resolved_df.iloc[i].to_dict()
-            im = images_df.iloc[i].to_dict()
-            fmt = _norm(m.get('Format', '2'))
-            m['Format'] = r['Format'] = fmt
-            merged.append({'raw': m, 'resolved': r, 'images': im})
-
-        # Build (Category, Format, SubCategory[, Group ID for TABLE/TABLE2]) groups
-        groups, current, prev = [], [], (None, None, None)
-        for item in merged:
-            fmt = _norm(item['raw'].get('Format','2'))
-            category = (item['raw'].get('Category','') or '').strip()
-            subcategory = item['raw'].get('SubCategory','')
-            if fmt in ('TABLE','TABLE2'):
-                gid = _s(item['raw'].get('Group ID', '')).strip()
-                if gid == '':
-                    # generate a synthetic unique ID for blank group IDs
-                    # this ensures each consecutive blank section under same subcategory forms its own group
-                    gid = f"_blank_{len(groups)}_{len(current)}"
-                key = (category, fmt, subcategory, gid)
-            else:
-                key = (category, fmt, subcategory)
-            if key != prev and current:
-                groups.append({'category': prev[0], 'format': prev[1], 'subcategory': prev[2], 'rows': current})
-                current = []
-            current.append(item); prev = key
+        # Merge rows as the sheets stream in and build (Category, Format, SubCategory
+        # [, Group ID for TABLE/TABLE2]) groups in the same pass
+        merged, groups, current, prev = [], [], [], (None, None, None)
+        with self.metrics.stage('fetch_sheets'):
+            for m, r, im in zip(rows['Master'], rows['Master_Resolved'], rows['Master_With_Images']):
+                fmt = _norm(m.get('Format', '2'))
+                m['Format'] = r['Format'] = fmt
+                item = {'raw': m, 'resolved': r, 'images': im}
+                merged.append(item)
+
+                category = (m.get('Category','') or '').strip()
+                subcategory = m.get('SubCategory','')
+                if fmt in ('TABLE','TABLE2'):
+                    gid = _s(m.get('Group ID', '')).strip()
+                    if gid == '':
+                        # a row with a blank Group ID is a table of its own (keyed by its row number)
+                        gid = f"_blank_{len(merged)}"
+                    key = (category, fmt, subcategory, gid)
+                else:
+                    key = (category, fmt, subcategory)
+                if key != prev and current:
+                    groups.append({'category': prev[0], 'format': prev[1], 'subcategory': prev[2], 'rows': current})
+                    current = []
+                current.append(item); prev = key
+        if not merged: raise Exception("Master sheet is empty")
         if current:
             groups.append({'category': prev[0], 'format': prev[1], 'subcategory': prev[2], 'rows': current})
 
-        doc = SimpleDocTemplate(
+        # TABLE2: pair consecutive Group IDs of a section whose tables fit on one page (top + bottom)
+        with self.metrics.stage('pair_table2'):
+            self._pair_table2(groups)
+
+        with self.metrics.stage('index'):
+            self.catalog_index = CatalogIndex(
+                merged, groups, self._estimate_pages,
+                covers={c for c, url in remark_lookup.items() if url and c != 'DELI CATALOGUE COVER'},
+                main_cover=bool(remark_lookup.get('DELI CATALOGUE COVER')))
+        log.info("🗂️ %s", self.catalog_index.summary(), extra=self.catalog_index.stats())
+
+        if select:
+            groups = self._select_groups(groups, select)
+            merged = [it for g in groups for it in g['rows']]
+            remark_lookup.pop('DELI CATALOGUE COVER', None)   # partial builds skip the main cover
+        return merged, groups, remark_lookup
+
+    def _select_groups(self, groups, select):
+        """
+        Keep only groups matching `select` (see SELECTOR_KEYS). Categories/subcategories pick
+        whole groups; group_ids/skus pick rows. TABLE/TABLE2 groups stay whole tables and
+        TABLE2 pairs are kept together, so grouping and pairing match the full catalog.
+        """
+        def norm_set(key):
+            vals = select.get(key)
+            if not vals:
+                return None
+            if isinstance(vals, str):
+                vals = vals.split(',')
+            return {_s(v).strip().upper() for v in vals if _s(v).strip()}
+        cats, subs, gids, skus = (norm_set(k) for k in SELECTOR_KEYS)
+
+        def row_match(it):
+            if gids and _s(it['raw'].get('Group ID', '')).strip().upper() not in gids:
+                return False
+            code = _s(it['resolved'].get('Item Code') or it['resolved'].get('Code')).strip().upper()
+            return not skus or code in skus
+
+        def pick(g):
+            """Selected copy of a group, or None."""
+            if cats and _s(g['category']).strip().upper() not in cats:
+                return None
+            if subs and _s(g['subcategory']).strip().upper() not in subs:
+                return None
+            rows = [it for it in g['rows'] if row_match(it)]
+            if not rows:
+                return None
+            return dict(g) if _norm(g['format']) in ('TABLE', 'TABLE2') else dict(g, rows=rows)
+
+        out, i = [], 0
+        while i < len(groups):
+            g = groups[i]
+            partner = g.get('table2_partner')
+            if partner is None:
+                picked = pick(g)
+                if picked is not None:
+                    out.append(picked)
+                i += 1
+                continue
+            if pick(g) is not None or pick(partner) is not None:
+                top, bottom = dict(g), dict(partner)
+                top['table2_partner'] = bottom
+                out += [top, bottom]
+            i += 2
+        return out
+
+    def _make_doc(self, output_path, doc_cls=SimpleDocTemplate):
+        return doc_cls(
             output_path,
             pagesize=A4,
             topMargin=_mm(self._top_margin_mm -1),
             bottomMargin=_mm(self._bottom_margin_mm -2),
             leftMargin=_mm(self._left_margin_mm),
             rightMargin=_mm(self._right_margin_mm),
+            pageCompression=0 if self.draft else None,
         )
 
+    def _build_story(self, groups, remark_lookup):
+        """Flowables for the whole catalog (covers, headers, product blocks, page breaks)."""
+        return [f for _, chunk in self._story_chunks(groups, remark_lookup) for f in chunk]
+
+    def _story_chunks(self, groups, remark_lookup):
+        """_build_story one group (or TABLE2 pair) at a time: yields (groups done, their flowables)."""
         story = []
-        base_raw = merged[0]['raw'] if merged else {}
 
         # MAIN COVER (footer suppressed by flowable)
         main_cover_url = remark_lookup.get('DELI CATALOGUE COVER')
@@ -1554,6 +3722,9 @@ class ProfessionalPDFGenerator:
         i = 0
         n = len(groups)
         while i < n:
+            if story:
+                yield i, story
+                story = []
             g = groups[i]
         
             fmt = _norm(g['format'])
@@ -1568,48 +3739,41 @@ class ProfessionalPDFGenerator:
             if cat != prev_category:
                 cover_url = remark_lookup.get(cat)
                 if cover_url:
-                    story.extend(self.create_full_page_cover(cover_url))
+                    story.extend(self.create_full_page_cover(cover_url, cat))
                     cover_added = True
                 prev_category = cat
 
             # If we added a category cover, we're already on a new page
             # Otherwise, only add page break if this isn't the first group
-            if story and not cover_added and not first_group:
+            if not cover_added and not first_group:
                 story.append(PageBreak())
 
             items = g['rows']
 
             # Pure TABLE (1 per page)
             if fmt == 'TABLE':
-                story.append(SetSubcategoryForFooter(sub))
+                story.append(SetSubcategoryForFooter(sub, cat, fmt))
                 story.extend(self.create_subcategory_header(sub))
                 story.append(Spacer(1, _mm(self._header_band_mm - 11.5)))
-                story.extend(self.create_table_format(items))
+                story.extend(self._page_map_tag(self.create_table_format(items), items))
                 i += 1
                 first_group = False
                 continue
 
             # TABLE2 (two Group-ID tables per page: top + bottom)
             if fmt == 'TABLE2':
-                story.append(SetSubcategoryForFooter(sub))
+                story.append(SetSubcategoryForFooter(sub, cat, fmt))
                 story.extend(self.create_subcategory_header(sub))
                 story.append(Spacer(1, _mm(self._header_band_mm - 11.5)))
 
-                def _same_section(g1, g2):
-                    return (
-                        _norm(g2['format']) == 'TABLE2' and
-                        _s(g1['category']).upper() == _s(g2['category']).upper() and
-                        (g1['subcategory'] or '') == (g2['subcategory'] or '')
-                    )
-
                 # Render TOP table (current Group ID)
-                story.extend(self.create_table_format(items))
+                story.extend(self._page_map_tag(self.create_table_format(items), items))
 
                 used = 1
-                # Try to render BOTTOM table (next Group ID) on the same page
-                if i + 1 < n and _same_section(g, groups[i + 1]):
-                    story.append(Spacer(1, 14 * mm))
-                    story.extend(self.create_table_format(groups[i + 1]['rows']))
+                # Render BOTTOM table (next Group ID) on the same page, as paired in _collect_groups
+                if i + 1 < n and g.get('table2_partner') is groups[i + 1]:
+                    story.append(Spacer(1, TABLE2_GAP_MM * mm))
+                    story.extend(self._page_map_tag(self.create_table_format(groups[i + 1]['rows']), groups[i + 1]['rows']))
                     used = 2
 
                 i += used
@@ -1621,10 +3785,10 @@ class ProfessionalPDFGenerator:
                 for idx, prod in enumerate(items):
                     if idx > 0:
                         story.append(PageBreak())
-                    story.append(SetSubcategoryForFooter(sub))
+                    story.append(SetSubcategoryForFooter(sub, cat, fmt))
                     story.extend(self.create_subcategory_header(sub))
                     story.append(Spacer(1, _mm(self._header_band_mm - 12)))
-                    story.extend(self.create_1wp_format(prod))
+                    story.extend(self._page_map_tag(self.create_1wp_format(prod), [prod]))
                 i += 1
                 first_group = False
                 continue  
@@ -1645,7 +3809,7 @@ class ProfessionalPDFGenerator:
                         story.append(PageBreak())
 
                     # Add subcategory header on EVERY page for multi-page subcategories
-                    story.append(SetSubcategoryForFooter(sub))
+                    story.append(SetSubcategoryForFooter(sub, cat, fmt))
                     header_blocks = self.create_subcategory_header(sub)
                     if header_blocks:
                         story.extend(header_blocks)
@@ -1656,11 +3820,11 @@ class ProfessionalPDFGenerator:
                         if j > 0 and inter_gap_mm > 0:
                             story.append(Spacer(1, _mm(inter_gap_mm)))
                         if fmt == '2':
-                            story.extend(self.create_format_2_layout(prod, cont_h, row_h))
+                            story.extend(self._page_map_tag(self.create_format_2_layout(prod, cont_h, row_h), [prod]))
                         elif fmt == '3':
-                            story.extend(self.create_product_block_3(prod, cont_h, row_h))
+                            story.extend(self._page_map_tag(self.create_product_block_3(prod, cont_h, row_h), [prod]))
                         elif fmt == '4':
-                            story.extend(self.create_product_block_4(prod, cont_h, row_h))
+                            story.extend(self._page_map_tag(self.create_product_block_4(prod, cont_h, row_h), [prod]))
     
                 i += 1
                 first_group = False
@@ -1676,32 +3840,676 @@ class ProfessionalPDFGenerator:
             for page_idx, page_items in enumerate(pages):
                 if page_idx > 0:
                     story.append(PageBreak())
-                story.append(SetSubcategoryForFooter(sub))
+                story.append(SetSubcategoryForFooter(sub, cat, '2'))
                 story.extend(self.create_subcategory_header(sub))
                 story.append(Spacer(1, _mm(self._header_band_mm - 12)))
                 for j, prod in enumerate(page_items):
                     if j > 0 and inter_gap_mm > 0:
                         story.append(Spacer(1, _mm(inter_gap_mm)))
-                    story.extend(self.create_format_2_layout(prod, cont_h, row_h))
+                    story.extend(self._page_map_tag(self.create_format_2_layout(prod, cont_h, row_h), [prod]))
             i += 1
             first_group = False
-
-        doc.build(story, canvasmaker=lambda *a, **k: FooterCanvas(*a, **k, generator=self, raw_data=base_raw, doc_ref=doc))        
-        return output_path
+        if story:
+            yield n, story
+
+        counters = self.metrics.counters
+        if counters.get('product_pages'):
+            saved = '' if self.page_packer == 'greedy' else f", {counters['pages_saved_by_packer']} fewer than greedy"
+            log.info("📐 Page packing (%s): %d pages for formats 2/3/4%s, %d Group ID splits",
+                     self.page_packer, counters['product_pages'], saved, counters['group_splits'],
+                     extra={'packer': self.page_packer, 'product_pages': counters['product_pages'],
+                            'pages_saved': counters.get('pages_saved_by_packer', 0),
+                            'group_splits': counters['group_splits']})
 
     # ---------- data ----------
+    def _load_sheet(self, sheet_name: str) -> pd.DataFrame:
+        """get_sheet_data, or the copy kept from the last build while keep_sheets is on (watch mode)."""
+        df = self._sheet_snapshot.get(sheet_name)
+        if df is None:
+            df = self.get_sheet_data(sheet_name)
+            if self.keep_sheets and not df.empty:
+                self._sheet_snapshot[sheet_name] = df
+        return df.copy()
+
     def get_sheet_data(self, sheet_name: str) -> pd.DataFrame:
         try:
-            spreadsheet = self.gs_client.open_by_key(self.spreadsheet_id)
-            worksheet = spreadsheet.worksheet(sheet_name)
-            data = worksheet.get_all_records()
-            return pd.DataFrame(data)
+            records = self.open_sheet_records([sheet_name])[sheet_name]
+            return pd.DataFrame(list(records))
         except Exception as e:
-            print(f"❌ Error loading {sheet_name}: {e}")
+            log.error(f"❌ Error loading {sheet_name}: {e}")
             return pd.DataFrame()
 
+    def open_sheet_records(self, sheet_names) -> dict:
+        """
+        name -> iterator of row records, read as parallel row-range shards (see
+        ShardedSheetReader). A worksheet that does not exist is logged and reads as empty; the
+        others are read as usual.
+        """
+        spreadsheet = self.gs_client.open_by_key(self.spreadsheet_id)
+        by_title = {ws.title: ws for ws in spreadsheet.worksheets()}
+        rows = self.sheet_reader.open([by_title[n] for n in sheet_names if n in by_title])
+        for n in sheet_names:
+            if n not in by_title:
+                log.error(f"❌ Error loading {n}: worksheet not found")
+                rows[n] = iter(())
+        return rows
+
+    def _sheet_rows(self, sheet_names) -> dict:
+        """
+        name -> iterator of row records for merging. Straight from the sharded reader (no
+        DataFrame in between) unless a subclass supplies its own get_sheet_data or watch mode
+        keeps DataFrame snapshots. A sheet that fails to load merges as empty; the others
+        still load.
+        """
+        streamed = [n for n in sheet_names if type(self).get_sheet_data is ProfessionalPDFGenerator.get_sheet_data
+                    and not self.keep_sheets and n not in self._sheet_snapshot]
+        rows = {}
+        if streamed:
+            try:
+                rows = self.open_sheet_records(streamed)
+            except Exception as e:
+                log.error(f"❌ Error loading {', '.join(streamed)}: {e}")
+                rows = {n: iter(()) for n in streamed}
+        for n in sheet_names:
+            if n not in rows:
+                rows[n] = iter(self._load_sheet(n).to_dict('records'))
+        return rows
+
+# ----------------------------- service -----------------------------
+class CatalogService:
+    """
+    Resident builder: generators are created once and reused, so fonts stay registered,
+    Google clients authorized and the image / layout caches warm between builds. A request
+    identical to one still waiting in the queue joins it instead of building twice; at most
+    max_builds builds run at a time (one warm generator each). Every path a request names is
+    resolved under output_root (default: the first generator's output_dir); anything else is
+    rejected.
+    """
+    REQUEST_KEYS = {'select', 'draft', 'image_dpi', 'stream_pages', 'targets', 'optimize',
+                    'upload_folder', 'output', 'refresh_images', 'report_path', 'prometheus_path', 'profile',
+                    'pipeline'}
+    PATH_KEYS = ('output', 'report_path', 'prometheus_path', 'profile')
+    TOKEN_HEADER = 'X-Catalog-Token'
+
+    def __init__(self, make_generator, max_builds: int = 1, output_root: str = None):
+        self._generators = queue.Queue()
+        for _ in range(max_builds):
+            self._generators.put(make_generator())
+        self.output_root = os.path.realpath(output_root or self._generators.queue[0].output_dir)
+        self._pool = ThreadPoolExecutor(max_workers=max_builds)
+        self._lock = threading.Lock()
+        self._queued = {}   # request key -> future of a build that has not started yet
+        self.stats = {'requested': 0, 'coalesced': 0, 'built': 0, 'failed': 0, 'running': 0,
+                      'queued': 0, 'last': None}
+
+    def submit(self, **request):
+        """Queue a build (generate_professional_pdf kwargs, 'output' = path to write, 'refresh_images'
+        = re-download images); returns a Future of {'output', 'elapsed_s', ...}."""
+        unknown = set(request) - self.REQUEST_KEYS
+        if unknown:
+            raise ValueError(f"Unknown build options: {sorted(unknown)}")
+        request = self._confine_paths(request)
+        key = json.dumps(request, sort_keys=True, default=str)
+        with self._lock:
+            self.stats['requested'] += 1
+            future = self._queued.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future
+            future = self._queued[key] = self._pool.submit(self._build, key, dict(request))
+            self.stats['queued'] = len(self._queued)
+            return future
+
+    def resolve_path(self, path) -> str:
+        """path (relative paths are taken from output_root) as an absolute path inside output_root."""
+        if not isinstance(path, str) or not path:
+            raise ValueError(f"Invalid path {path!r}")
+        full = os.path.realpath(os.path.join(self.output_root, path))
+        if os.path.commonpath([full, self.output_root]) != self.output_root:
+            raise ValueError(f"Path {path!r} is outside the service output root")
+        return full
+
+    def _confine_paths(self, request: dict) -> dict:
+        request = dict(request)
+        for key in self.PATH_KEYS:
+            value = request.get(key)
+            if value and value is not True:   # profile=True keeps the report in memory
+                request[key] = self.resolve_path(value)
+        if request.get('targets') is not None:
+            if not isinstance(request['targets'], list):
+                raise ValueError("targets must be a list")
+            targets = []
+            for target in request['targets']:
+                if not isinstance(target, dict) or not isinstance(target.get('path'), str):
+                    raise ValueError(f"Invalid target {target!r}")
+                if re.search(r'[{}]', target['path'].replace('{category}', '')):
+                    raise ValueError(f"Only {{category}} may be substituted in target path {target['path']!r}")
+                targets.append(dict(target, path=self.resolve_path(target['path'])))
+            request['targets'] = targets
+        return request
+
+    def _build(self, key, request):
+        with self._lock:
+            self._queued.pop(key, None)
+            self.stats.update(queued=len(self._queued), running=self.stats['running'] + 1)
+        gen = self._generators.get()
+        t0 = time.perf_counter()
+        try:
+            if request.pop('refresh_images', False):
+                gen.clear_image_cache()
+            output = request.pop('output', None)
+            if output:
+                os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+            out = gen.generate_professional_pdf(output_path=output, **request)
+            result = {'output': out, 'targets': gen.written_targets, 'uploaded_file_id': gen.uploaded_file_id,
+                      'elapsed_s': round(time.perf_counter() - t0, 3), 'metrics': gen.metrics.report()}
+            with self._lock:
+                self.stats.update(built=self.stats['built'] + 1, last=result)
+            return result
+        except Exception:
+            with self._lock:
+                self.stats['failed'] += 1
+            raise
+        finally:
+            self._generators.put(gen)
+            with self._lock:
+                self.stats['running'] -= 1
+
+    def serve(self, host: str = '127.0.0.1', port: int = 8765, token: str = None):
+        """
+        HTTP trigger (returns the server; call serve_forever()). POST /build takes the submit()
+        options as JSON plus "wait": false to return 202 at once; GET /status reports counters.
+        With token set, every request must carry it in the X-Catalog-Token header; binding to
+        anything but a loopback address requires a token.
+        """
+        service = self
+        try:
+            loopback = host == 'localhost' or ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            loopback = False
+        if not loopback and not token:
+            raise ValueError(f"Serving on {host} needs a shared-secret token")
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        class Handler(BaseHTTPRequestHandler):
+            def _authorized(self):
+                sent = self.headers.get(service.TOKEN_HEADER) or ''
+                if token and not hmac.compare_digest(sent.encode(), token.encode()):
+                    self._reply(401, {'error': 'unauthorized'})
+                    return False
+                return True
+            def _reply(self, code, payload):
+                body = json.dumps(payload, default=str).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def do_GET(self):
+                if not self._authorized():
+                    return
+                if self.path == '/status':
+                    with service._lock:
+                        return self._reply(200, dict(service.stats))
+                self._reply(404, {'error': 'not found'})
+            def do_POST(self):
+                if not self._authorized():
+                    return
+                if self.path != '/build':
+                    return self._reply(404, {'error': 'not found'})
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                    wait = request.pop('wait', True)
+                    future = service.submit(**request)
+                except (ValueError, TypeError) as e:
+                    return self._reply(400, {'error': str(e)})
+                if not wait:
+                    return self._reply(202, {'queued': True})
+                try:
+                    self._reply(200, future.result())
+                except Exception as e:
+                    self._reply(500, {'error': str(e)})
+            def log_message(self, fmt, *args):
+                log.info(f"🛰️ {self.address_string()} {fmt % args}")
+        server = ThreadingHTTPServer((host, port), Handler)
+        log.info(f"🛰️ Catalog service listening on http://{host}:{server.server_port}")
+        return server
+
+# ----------------------------- watch mode -----------------------------
+class DriveRevisionSource:
+    """
+    Change signals for the spreadsheet. revision(): Drive version + modifiedTime (one small
+    files.get per poll). sheet_tokens(): a fingerprint per sheet from one batched values read,
+    because Drive only versions the file as a whole. sheet_frames(): DataFrames of changed
+    sheets from that same read, so they are not fetched a second time. Any object with
+    revision() and sheet_tokens() (e.g. a fake in tests) can drive CatalogWatcher; without
+    sheet_frames() the generator re-fetches the changed sheets.
+    """
+    def __init__(self, generator, sheets=SHEET_NAMES):
+        self.generator, self.sheets = generator, sheets
+        self._values = {}   # sheet name -> rows of the last sheet_tokens() read
+
+    def revision(self) -> str:
+        meta = self.generator.drive_service.files().get(
+            fileId=self.generator.spreadsheet_id, fields='version,modifiedTime').execute()
+        return f"{meta.get('version')}@{meta.get('modifiedTime')}"
+
+    def sheet_tokens(self) -> dict:
+        book = self.generator.gs_client.open_by_key(self.generator.spreadsheet_id)
+        ranges = book.values_batch_get([f"'{name}'" for name in self.sheets]).get('valueRanges', [])
+        self._values = {name: vr.get('values', []) for name, vr in zip(self.sheets, ranges)}
+        return {name: hashlib.sha1(json.dumps(values).encode()).hexdigest()
+                for name, values in self._values.items()}
+
+    def sheet_frames(self, names) -> dict:
+        """name -> DataFrame built from the last sheet_tokens() read (records as get_sheet_data)."""
+        return {name: pd.DataFrame(list(ShardedSheetReader.records(self._values[name])))
+                for name in names if name in self._values}
+
+class CatalogWatcher:
+    """
+    Rebuilds when the spreadsheet changes. A new revision opens a quiet period of debounce_s
+    that every further revision restarts; once edits settle, sheet tokens decide which sheets
+    are re-fetched (the others come from the last build's snapshot) and a revision that
+    changed no sheet content (formatting, comments) builds nothing. Changed sheets come from
+    source.sheet_frames() when the source has it.
+    """
+    def __init__(self, generator, source, build_kwargs: dict = None, poll_s: float = 30,
+                 debounce_s: float = 60, clock=time.monotonic, sleep=time.sleep):
+        self.generator, self.source = generator, source
+        self.build_kwargs = build_kwargs or {}
+        self.poll_s, self.debounce_s = poll_s, debounce_s
+        self.clock, self.sleep = clock, sleep
+        self._revision = None
+        self._settle_at = clock()   # build once at start, which also fills the snapshot
+        self._tokens = {}
+        self.builds = []            # {'revision', 'changed', 'output', 'elapsed_s'} per build
+        generator.keep_sheets = True
+
+    def step(self) -> Optional[dict]:
+        """One poll; returns the build record if this poll ran a build."""
+        revision = self.source.revision()
+        now = self.clock()
+        if revision != self._revision:
+            if self._revision is not None:
+                self._settle_at = now + self.debounce_s
+            self._revision = revision
+        if self._settle_at is None or now < self._settle_at:
+            return None
+        self._settle_at = None
+        tokens = self.source.sheet_tokens()
+        changed = [name for name in SHEET_NAMES
+                   if tokens.get(name) is None or tokens.get(name) != self._tokens.get(name)]
+        if not changed:
+            return None
+        frames = self.source.sheet_frames(changed) if hasattr(self.source, 'sheet_frames') else {}
+        for name in changed:
+            df = frames.get(name)
+            if df is not None and not df.empty:
+                self.generator._sheet_snapshot[name] = df
+            else:
+                self.generator._sheet_snapshot.pop(name, None)
+        t0 = time.perf_counter()
+        try:
+            out = self.generator.generate_professional_pdf(**self.build_kwargs)
+        except Exception:
+            self._settle_at = now + self.debounce_s   # retry after another quiet period
+            raise
+        self._tokens = tokens
+        record = {'revision': revision, 'changed': changed, 'output': out,
+                  'elapsed_s': round(time.perf_counter() - t0, 3)}
+        self.builds.append(record)
+        log.info(f"👀 Rebuilt after changes to {', '.join(changed)} in {record['elapsed_s']}s", extra={'watch': record})
+        return record
+
+    def run(self, max_builds: int = None):
+        while max_builds is None or len(self.builds) < max_builds:
+            try:
+                self.step()
+            except Exception as e:
+                log.error(f"❌ Watch error: {e}")
+            self.sleep(self.poll_s)
+
+# ----------------------------- benchmark -----------------------------
+BENCHMARK_SIZES = (100, 1000, 10000, 50000)
+_BENCH_FORMATS = ('2', '3', '4', '1WP', 'TABLE', 'TABLE2')
+_BENCH_PARAMS = ('Size', 'Material', 'Shape', 'Packing', 'Price', 'Features', 'Weight', 'Packing Dimension')
+
+class OfflineCatalogGenerator(ProfessionalPDFGenerator):
+    """Generator fed from in-memory sheets (name -> DataFrame) and local images; no Google services."""
+    def __init__(self, sheets: dict):
+        self.sheets = sheets
+        super().__init__(None, None)
+    def setup_google_services(self, credentials_path: str):
+        self.credentials_path = None
+    def get_sheet_data(self, sheet_name: str) -> pd.DataFrame:
+        df = self.sheets.get(sheet_name)
+        return df.copy() if df is not None else pd.DataFrame()
+    def _fetch_image(self, image_url: str) -> Optional[str]:
+        url = str(image_url)
+        path = url[7:] if url.startswith('file://') else url
+        if not os.path.isfile(path):
+            return super()._fetch_image(image_url)
+        try:
+            path = self._normalize_image(path)   # local files are used in place, never copied
+        except Exception:
+            return None
+        self._img_cache[image_url] = path; return path
+
+def synthetic_images(image_dir: str, photos: int = 12) -> dict:
+    """Local stand-in photos (JPEG), transparent graphs (PNG) and covers, written once per directory."""
+    from PIL import ImageDraw
+    os.makedirs(image_dir, exist_ok=True)
+    def make(name, draw):
+        path = os.path.join(image_dir, name)
+        if not os.path.exists(path):
+            draw(path)
+        return path
+    def photo(seed):
+        def draw(path):
+            w, h = 1600, 1200
+            grad = PILImage.linear_gradient('L').resize((w, h))
+            noise = PILImage.effect_noise((w, h), 40 + seed)
+            im = PILImage.merge('RGB', (grad, noise, grad.rotate(90 + seed * 7).resize((w, h))))
+            ImageDraw.Draw(im).ellipse((300 + seed * 20, 200, 1300, 1000), outline=(20, 20, 20), width=12)
+            im.save(path, 'JPEG', quality=85)
+        return draw
+    def graph(path):
+        im = PILImage.new('RGBA', (1200, 450), (255, 255, 255, 0))
+        d = ImageDraw.Draw(im)
+        for k in range(12):
+            d.line((50 + 90 * k, 400, 50 + 90 * k, 380 - 25 * k), fill=(200, 30, 30, 255), width=18)
+        im.save(path, 'PNG')
+    def cover(path):
+        im = PILImage.linear_gradient('L').resize((1240, 1754)).convert('RGB')
+        im.save(path, 'JPEG', quality=85)
+    return {'photos': [make(f'photo_{k}.jpg', photo(k)) for k in range(photos)],
+            'graph': make('graph.png', graph), 'cover': make('cover.jpg', cover)}
+
+def synthetic_catalog(n_skus: int, image_dir: str, seed: int = 0) -> dict:
+    """
+    Master / Master_Resolved / Master_With_Images / Remark sheets for n_skus products, mixing all
+    formats, Group IDs, long and HTML-styled spec values and span-tagged shape cells; images are
+    local files (see synthetic_images).
+    """
+    rnd = random.Random(seed)
+    imgs = synthetic_images(image_dir)
+    categories = [f'CATEGORY {k + 1}' for k in range(max(2, min(12, n_skus // 500)))]
+    shapes = ['Flat', 'Half Round', 'Round', 'Triangle', 'Square']
+    master, resolved, images = [], [], []
+    i = sub_no = 0
+    while i < n_skus:
+        cat = categories[i * len(categories) // n_skus]
+        fmt = rnd.choice(_BENCH_FORMATS)
+        sub_no += 1
+        sub = f'{fmt} SERIES {sub_no}'
+        table = fmt in ('TABLE', 'TABLE2')
+        for g in range(rnd.randint(1, 4) if table else 1):
+            gid = f'G{sub_no}-{g}'
+            n_rows = rnd.randint(3, 8) if table else rnd.randint(1, 6)
+            for _ in range(min(n_rows, n_skus - i)):
+                params = rnd.sample(_BENCH_PARAMS, rnd.randint(4, len(_BENCH_PARAMS)))
+                m = {'Category': cat, 'SubCategory': sub, 'Format': fmt, 'Group ID': gid}
+                r = {'Item Code': f'SYN{i:06d}', 'Item Name': f'Synthetic product {i} ' + 'extra long name ' * rnd.randint(0, 3),
+                     'Format': fmt}
+                for k, label in enumerate(params, 1):
+                    m[f'Parameter{k}'] = label
+                    if label == 'Shape':
+                        val = f'<span>{rnd.choice(shapes)} {rnd.choice((150, 200, 250))}mm'
+                    elif label == 'Size':   # table rows stay short: a Group ID table never splits
+                        val = ', '.join(f'{v}mm' for v in range(6, 6 + 2 * rnd.randint(1, 3 if table else 15), 2))
+                    elif label == 'Features' and not table:
+                        val = ('<p style="margin:0"><span style="color:#333">Hardened, tempered and '
+                               'lacquered</span><br><br>' + 'long wearing surface, ' * rnd.randint(1, 8) + '</p>')
+                    elif label == 'Price':
+                        val = f'{rnd.randint(5, 900)}.{rnd.randint(0, 99):02d}'
+                    else:
+                        val = f'{label} value {rnd.randint(1, 999)}'
+                    r[f'Parameter{k}'] = val
+                im = {'Image URL': 'file://' + rnd.choice(imgs['photos'])}
+                if rnd.random() < 0.3:
+                    im['Image URL Graph'] = 'file://' + imgs['graph']
+                master.append(m); resolved.append(r); images.append(im)
+                i += 1
+    remark = [{'Category': 'DELI CATALOGUE COVER', 'Cover Page URL': 'file://' + imgs['cover']}]
+    remark += [{'Category': c, 'Cover Page URL': 'file://' + imgs['cover']} for c in categories]
+    return {'Master': pd.DataFrame(master), 'Master_Resolved': pd.DataFrame(resolved),
+            'Master_With_Images': pd.DataFrame(images), 'Remark': pd.DataFrame(remark)}
+
+def _benchmark_build(n_skus: int, image_dir: str, out_dir: str, build_kwargs: dict) -> dict:
+    """One offline build (run in its own process so peak RSS is per size)."""
+    gen = OfflineCatalogGenerator(synthetic_catalog(n_skus, image_dir))
+    out = os.path.join(out_dir, f'bench_{n_skus}.pdf')
+    try:
+        gen.generate_professional_pdf(out, **build_kwargs)
+        r = gen.metrics.report()
+        total = r['stages']['total']['wall_s']
+        return {'skus': n_skus, 'pages': r['pages'], 'total_s': total,
+                'pages_per_s': round(r['pages'] / total, 2) if total else None,
+                'ms_per_sku': round(total * 1000 / n_skus, 3), 'peak_rss_mb': r['peak_rss_mb'],
+                'output_bytes': os.path.getsize(out),
+                'stages': {k: v['wall_s'] for k, v in r['stages'].items()}, 'counters': r['counters']}
+    finally:
+        shutil.rmtree(gen.temp_dir, ignore_errors=True)
+        if os.path.exists(out): os.unlink(out)
+
+def micro_benchmarks(gen: ProfessionalPDFGenerator, repeat: int = 5) -> dict:
+    """Best-of-repeat microseconds per call for the hot text/layout helpers (>= 0.2 s per repeat)."""
+    import timeit
+    cat = synthetic_catalog(40, os.path.join(gen.temp_dir, 'bench_images'), seed=1)
+    raws, ress = cat['Master'].to_dict('records'), cat['Master_Resolved'].to_dict('records')
+    texts = [v for r in ress for v in r.values() if isinstance(v, str)]
+    fn = gen.styles['DetailVal'].fontName
+    box = EllipsizedTextBox(' '.join(texts[:12]), fn, 9, 120, max_lines=3)
+    headers = ['Item Code'] + list(_BENCH_PARAMS[:6])
+    rows = [[r.get('Item Code', '')] + [_s(r.get(f'Parameter{k}', '')) for k in range(1, 7)] for r in ress]
+    pairs = list(zip(raws, ress))
+    def spec_cards(cached):
+        if not cached:
+            gen._spec_layout_cache.clear(); gen._spec_row_cache.clear()
+        for raw, res in pairs[:4]:
+            gen.build_specifications_card(raw, res, 16, 90 * mm, 60 * mm)
+    cases = {
+        'clean_html_css': (lambda: [gen.clean_html_css(t) for t in texts], len(texts)),
+        'EllipsizedTextBox._wrap_lines': (box._wrap_lines, 1),
+        'build_specifications_card': (lambda: spec_cards(False), 4),
+        'build_specifications_card_cached': (lambda: spec_cards(True), 4),
+        '_auto_col_widths_generic': (lambda: gen._auto_col_widths_generic(headers, rows, 190 * mm), 1),
+    }
+    out = {}
+    for name, (fn_call, per_call) in cases.items():
+        timer = timeit.Timer(fn_call)
+        n, _ = timer.autorange()
+        best = min(timer.repeat(repeat=repeat, number=n))
+        out[name] = {'us_per_call': round(best * 1e6 / (n * per_call), 2), 'calls': n * per_call}
+    return out
+
+def compare_benchmarks(current: dict, baseline: dict, tolerance: float = 0.10) -> dict:
+    """current/baseline ratios of time, memory and size per SKU count and micro-benchmark."""
+    ratios, regressions = {}, []
+    base_sizes = {r['skus']: r for r in baseline.get('sizes', [])}
+    pairs = [(f"{r['skus']}.{m}", r.get(m), base_sizes[r['skus']].get(m))
+             for r in current.get('sizes', []) if r['skus'] in base_sizes
+             for m in ('total_s', 'peak_rss_mb', 'output_bytes')]
+    pairs += [(f'micro.{k}', v['us_per_call'], baseline.get('micro', {}).get(k, {}).get('us_per_call'))
+              for k, v in current.get('micro', {}).items()]
+    for key, cur, base in pairs:
+        if cur is None or not base:
+            continue
+        ratios[key] = round(cur / base, 3)
+        if ratios[key] > 1 + tolerance:
+            regressions.append(key)
+    return {'baseline': baseline.get('created'), 'tolerance': tolerance, 'ratios': ratios, 'regressions': regressions}
+
+def run_benchmark(sizes=BENCHMARK_SIZES, json_path: str = None, baseline_path: str = None,
+                  work_dir: str = None, micro: bool = True, build_kwargs: dict = None,
+                  isolate: bool = True, tolerance: float = 0.10) -> dict:
+    """
+    Offline benchmark: a full build per synthetic catalog size (total time, pages/s, peak RSS,
+    output size, stage times) plus micro-benchmarks. Each size runs in a fresh process unless
+    isolate=False. scaling holds the time exponent between neighbouring sizes (1.0 = linear).
+    With baseline_path, ratios against that earlier result and regressions beyond tolerance.
+    """
+    import reportlab
+    work_dir = work_dir or tempfile.mkdtemp(prefix='catalog_bench_')
+    image_dir = os.path.join(work_dir, 'images')
+    synthetic_images(image_dir)
+    for fam, ok in register_bundled_fonts().items():   # parsed once here, inherited by each build process
+        if ok: glyph_width_table(fam)
+    result = {'created': datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0],
+              'reportlab': reportlab.Version, 'build_kwargs': build_kwargs or {}, 'sizes': []}
+    for n in sorted(sizes):
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                r = pool.submit(_benchmark_build, n, image_dir, work_dir, build_kwargs or {}).result()
+        else:
+            r = _benchmark_build(n, image_dir, work_dir, build_kwargs or {})
+        result['sizes'].append(r)
+        log.info(f"⏱️ {n} SKUs: {r['pages']} pages in {r['total_s']:.1f}s ({r['pages_per_s']} pages/s), "
+                 f"peak {r['peak_rss_mb']} MB, {r['output_bytes'] / 1048576:.1f} MB", extra={'benchmark': r})
+    runs = result['sizes']
+    result['scaling'] = {f"{a['skus']}->{b['skus']}": round(np.log(b['total_s'] / a['total_s']) /
+                                                            np.log(b['skus'] / a['skus']), 3)
+                         for a, b in zip(runs, runs[1:]) if a['total_s'] and b['total_s']}
+    if micro:
+        gen = OfflineCatalogGenerator({})
+        try:
+            result['micro'] = micro_benchmarks(gen)
+        finally:
+            shutil.rmtree(gen.temp_dir, ignore_errors=True)
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            result['comparison'] = compare_benchmarks(result, json.load(f), tolerance)
+        for key in result['comparison']['regressions']:
+            log.warning(f"❌ Regression {key}: {result['comparison']['ratios'][key]}x baseline")
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    return result
+
 # ----------------------------- runner -----------------------------
-def main():
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Build the product catalog PDF from Google Sheets.")
+    ap.add_argument('--category', dest='categories', action='append', default=[],
+                    help="only this category (repeatable or comma-separated)")
+    ap.add_argument('--subcategory', dest='subcategories', action='append', default=[],
+                    help="only this subcategory (repeatable or comma-separated)")
+    ap.add_argument('--group-id', dest='group_ids', action='append', default=[],
+                    help="only rows with this Group ID (repeatable or comma-separated)")
+    ap.add_argument('--sku', dest='skus', action='append', default=[],
+                    help="only these item codes (repeatable or comma-separated)")
+    ap.add_argument('--sku-file', help="file with one item code per line")
+    ap.add_argument('--draft', action='store_true',
+                    help="fast review copy: same pages, low-DPI images, built-in fonts, uncompressed")
+    ap.add_argument('--output', help="copy the PDF here (default PROFESSIONAL_CATALOG.pdf, "
+                                     "PREVIEW_CATALOG.pdf for partial or draft builds)")
+    ap.add_argument('--web', metavar='PDF',
+                    help="also write a web copy (150 DPI images) from the same layout pass")
+    ap.add_argument('--split-dir', metavar='DIR',
+                    help="also write one PDF per category into DIR from the same layout pass")
+    ap.add_argument('--linearize', action='store_true',
+                    help="linearize the PDF(s) for fast first-page web viewing (needs pikepdf)")
+    ap.add_argument('--object-streams', action='store_true',
+                    help="pack objects into compressed object/xref streams (needs pikepdf)")
+    ap.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                    help="recompress Flate streams at this zlib level (needs pikepdf)")
+    ap.add_argument('--upload-folder', metavar='FOLDER_ID',
+                    help="upload the PDF to this Drive folder (resumable, overlapping the render)")
+    ap.add_argument('--serve', nargs='?', const='127.0.0.1:8765', metavar='[HOST:]PORT',
+                    help="run the warm build service (HTTP trigger) instead of building once")
+    ap.add_argument('--max-builds', type=int, default=1, help="concurrent builds in --serve mode")
+    ap.add_argument('--output-root', default='.', metavar='DIR',
+                    help="--serve: directory every requested output path must resolve into")
+    ap.add_argument('--service-token', default=os.getenv('CATALOG_SERVICE_TOKEN'), metavar='TOKEN',
+                    help="shared secret for --serve / --trigger (X-Catalog-Token header; required to "
+                         "serve on a non-loopback address; default $CATALOG_SERVICE_TOKEN)")
+    ap.add_argument('--trigger', nargs='?', const='http://127.0.0.1:8765', metavar='URL',
+                    help="ask a running --serve instance to build with these options")
+    ap.add_argument('--watch', action='store_true',
+                    help="stay running and rebuild whenever the spreadsheet changes")
+    ap.add_argument('--poll-s', type=float, default=30, help="--watch: seconds between revision checks")
+    ap.add_argument('--debounce-s', type=float, default=60,
+                    help="--watch: rebuild only after this many seconds without further edits")
+    ap.add_argument('--dry-run', nargs='?', const='page_map.json', metavar='JSON',
+                    help="layout only: write the page map JSON instead of a PDF")
+    ap.add_argument('--benchmark', nargs='?', const='benchmark.json', metavar='JSON',
+                    help="offline benchmark on synthetic catalogs; write the results here")
+    ap.add_argument('--bench-sizes', default=','.join(map(str, BENCHMARK_SIZES)),
+                    help="--benchmark: comma-separated SKU counts")
+    ap.add_argument('--baseline', metavar='JSON', help="--benchmark: compare against an earlier result")
+    ap.add_argument('--bench-tolerance', type=float, default=0.10,
+                    help="--benchmark: slowdown vs --baseline reported as a regression (0.10 = 10%%)")
+    ap.add_argument('--report', metavar='JSON', help="write the run report (stage times, counters) here")
+    ap.add_argument('--prometheus', metavar='PROM', help="write the run metrics as a Prometheus textfile")
+    ap.add_argument('--profile', nargs='?', const='flowable_profile.json', metavar='JSON',
+                    help="time wrap/split/drawOn per flowable class and page; write the profile here")
+    ap.add_argument('--pipeline', action='store_true',
+                    help="overlap image downloads, layout and rendering instead of laying out the "
+                         "whole catalog before rendering")
+    ap.add_argument('--packer', choices=PAGE_PACKERS, default='greedy',
+                    help="formats 2/3/4 page packing: greedy (original), optimal (fewest pages without "
+                         "splitting groups that fit on a page) or tight (fewest pages)")
+    ap.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                    help="DEBUG adds per-page pagination detail")
+    ap.add_argument('--log-json', action='store_true', help="log one JSON object per line")
+    args = ap.parse_args(argv)
+    if args.sku_file:
+        with open(args.sku_file, encoding='utf-8') as f:
+            args.skus += [line.strip() for line in f if line.strip()]
+    select = {k: [v.strip() for arg in getattr(args, k) for v in arg.split(',') if v.strip()]
+              for k in SELECTOR_KEYS}
+    args.select = {k: v for k, v in select.items() if v} or None
+    opts = dict(linearize=args.linearize, object_streams=args.object_streams,
+                compress_level=args.compress_level)
+    args.optimize = opts if (args.linearize or args.object_streams or args.compress_level is not None) else None
+    args.targets = []
+    if args.web:
+        args.targets.append({'path': args.web, 'image_dpi': 'web'})
+    if args.split_dir:
+        args.targets.append({'path': os.path.join(args.split_dir, '{category}.pdf'), 'split': 'category'})
+    return args
+
+def trigger_build(args):
+    """--trigger: post this invocation's build options to a running service and wait."""
+    preview = args.select or args.draft
+    request = {'output': args.output or ("PREVIEW_CATALOG.pdf" if preview else "PROFESSIONAL_CATALOG.pdf")}
+    for key in ('select', 'targets', 'optimize', 'upload_folder'):
+        if getattr(args, key):
+            request[key] = getattr(args, key)
+    for key, arg in (('report_path', args.report), ('prometheus_path', args.prometheus), ('profile', args.profile)):
+        if arg:
+            request[key] = arg   # resolved under the service's --output-root
+    if args.draft:
+        request['draft'] = True
+    if args.pipeline:
+        request['pipeline'] = True
+    t0 = time.perf_counter()
+    headers = {CatalogService.TOKEN_HEADER: args.service_token} if args.service_token else {}
+    resp = _requests().post(args.trigger.rstrip('/') + '/build', json=request, headers=headers, timeout=None)
+    if resp.status_code != 200:
+        print(f"❌ Error: {resp.json().get('error', resp.text)}")
+        return
+    print(f"DONE: PDF GENERATED {resp.json()['output']} in {time.perf_counter() - t0:.1f}s")
+
+def setup_logging(level: str = 'INFO', json_lines: bool = False):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonLogFormatter() if json_lines else logging.Formatter('%(message)s'))
+    log.handlers[:] = [handler]
+    log.setLevel(level)
+    log.propagate = False
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging(args.log_level, args.log_json)
+    if args.trigger:
+        return trigger_build(args)
+    if args.benchmark:
+        result = run_benchmark([int(n) for n in args.bench_sizes.split(',') if n.strip()], args.benchmark,
+                               baseline_path=args.baseline, build_kwargs=dict(draft=args.draft, pipeline=args.pipeline),
+                               tolerance=args.bench_tolerance)
+        print(f"DONE: BENCHMARK WRITTEN TO {args.benchmark}")
+        if result.get('comparison', {}).get('regressions'):
+            raise SystemExit(1)
+        return
     credentials_json = os.getenv('GOOGLE_CREDENTIALS_JSON')
     spreadsheet_id   = os.getenv('SPREADSHEET_ID')
     if not credentials_json or not spreadsheet_id:
@@ -1710,10 +4518,49 @@ def main():
     temp_creds = tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False)
     temp_creds.write(credentials_json); temp_creds.close()
     try:
+        if args.serve:
+            host, _, port = args.serve.rpartition(':')
+            def make_generator():
+                g = ProfessionalPDFGenerator(temp_creds.name, spreadsheet_id)
+                g.page_packer = args.packer
+                return g
+            service = CatalogService(make_generator, max_builds=args.max_builds, output_root=args.output_root)
+            server = service.serve(host or '127.0.0.1', int(port), token=args.service_token)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                server.server_close()
+            return
         gen = ProfessionalPDFGenerator(temp_creds.name, spreadsheet_id)
-        out = gen.generate_professional_pdf()
+        gen.page_packer = args.packer
+        if args.watch:
+            preview = args.select or args.draft
+            target = args.output or ("./PREVIEW_CATALOG.pdf" if preview else "./PROFESSIONAL_CATALOG.pdf")
+            build_kwargs = dict(output_path=target, select=args.select, draft=args.draft, targets=args.targets,
+                                optimize=args.optimize, upload_folder=args.upload_folder,
+                                report_path=args.report, prometheus_path=args.prometheus, profile=args.profile,
+                                pipeline=args.pipeline)
+            watcher = CatalogWatcher(gen, DriveRevisionSource(gen), build_kwargs,
+                                     poll_s=args.poll_s, debounce_s=args.debounce_s)
+            try:
+                watcher.run()
+            except KeyboardInterrupt:
+                pass
+            return
+        if args.dry_run:
+            gen.dry_run_layout(args.dry_run, select=args.select)
+            print(f"DONE: PAGE MAP WRITTEN TO {args.dry_run}")
+            return
+        out = gen.generate_professional_pdf(select=args.select, draft=args.draft, targets=args.targets,
+                                            optimize=args.optimize, upload_folder=args.upload_folder,
+                                            report_path=args.report, prometheus_path=args.prometheus,
+                                            profile=args.profile, pipeline=args.pipeline)
         if out and os.path.exists(out):
-            shutil.copy2(out, "./PROFESSIONAL_CATALOG.pdf")
+            preview = args.select or args.draft
+            target = args.output or ("./PREVIEW_CATALOG.pdf" if preview else "./PROFESSIONAL_CATALOG.pdf")
+            shutil.copy2(out, target)
+            for extra in gen.written_targets:
+                print(f"📄 Also wrote {extra}")
             print("DONE: PDF GENERATED")
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from professional_pdf_generator import OfflineCatalogGenerator, RunMetrics, pack_pages
+
+
+def items(gids):
+    return [{'raw': {'Group ID': gid, 'Item Code': f'SKU{k}'}} for k, gid in enumerate(gids)]
+
+
+def splits(gids, sizes):
+    k, n = 0, 0
+    for size in sizes[:-1]:
+        k += size
+        n += bool(gids[k] and gids[k] == gids[k - 1])
+    return n
+
+
+@pytest.fixture(scope='module')
+def gen():
+    return OfflineCatalogGenerator({})
+
+
+def greedy_sizes(gen, gids, per_page):
+    return [len(p) for p in gen._paginate_greedy(items(gids), per_page)]
+
+
+def test_small_groups_are_kept_whole():
+    gids = ['A', 'A', 'B', 'B', 'B', 'C']
+    assert pack_pages(gids, 4) == [2, 4]
+    assert pack_pages(gids, 4, minimize='pages') == [2, 4]   # same pages, no split either
+
+
+def test_oversized_group_fills_the_previous_page(gen):
+    gids = ['X'] + ['A'] * 5
+    assert greedy_sizes(gen, gids, 4) == [1, 4, 1]
+    assert pack_pages(gids, 4) == [4, 2]            # one page fewer, still one split of A
+    assert splits(gids, [4, 2]) == splits(gids, [1, 4, 1]) == 1
+
+
+def test_tight_trades_splits_for_pages(gen):
+    gids = ['A'] * 3 + ['B'] * 2 + ['C'] * 3 + ['D'] * 2
+    assert greedy_sizes(gen, gids, 4) == [3, 2, 3, 2]
+    assert pack_pages(gids, 4) == [3, 2, 3, 2]      # no adjacent groups fit together unsplit
+    tight = pack_pages(gids, 4, minimize='pages')
+    assert len(tight) == 3 and sum(tight) == len(gids)
+
+
+@pytest.mark.parametrize('per_page', [2, 3, 4])
+def test_never_worse_than_greedy(gen, per_page):
+    rnd = random.Random(per_page)
+    for _ in range(300):
+        gids = []
+        while len(gids) < rnd.randint(1, 40):
+            gids += [rnd.choice(['', f'G{len(gids)}'])] * rnd.randint(1, 7)
+        greedy = greedy_sizes(gen, gids, per_page)
+        optimal = pack_pages(gids, per_page)
+        tight = pack_pages(gids, per_page, minimize='pages')
+        for sizes in (optimal, tight):
+            assert sum(sizes) == len(gids) and all(1 <= s <= per_page for s in sizes)
+        assert (splits(gids, optimal), len(optimal)) <= (splits(gids, greedy), len(greedy))
+        assert len(tight) <= min(len(greedy), len(optimal))
+
+
+def test_greedy_is_the_default_and_counts_pages(gen):
+    gids = ['X'] + ['A'] * 5
+    assert gen.page_packer == 'greedy'
+    gen.metrics = RunMetrics()
+    assert [len(p) for p in gen._paginate_groups(items(gids), 4)] == [1, 4, 1]
+    gen.page_packer = 'optimal'
+    try:
+        pages = gen._paginate_groups(items(gids), 4)
+    finally:
+        gen.page_packer = 'greedy'
+    assert [[it['raw']['Item Code'] for it in p] for p in pages] == [['SKU0', 'SKU1', 'SKU2', 'SKU3'], ['SKU4', 'SKU5']]
+    counters = gen.metrics.counters
+    assert counters['product_pages'] == 5 and counters['group_splits'] == 2
+    assert counters['pages_saved_by_packer'] == 1
+
+
+def test_unknown_packer_is_rejected(gen):
+    gen.page_packer = 'best'
+    try:
+        with pytest.raises(ValueError, match='Unknown page packer'):
+            gen._pack_items(items(['A']), 2)
+    finally:
+        gen.page_packer = 'greedy'
@@ -0,0 +1,56 @@
+import io
+
+import pytest
+from reportlab.lib.units import mm
+from reportlab.platypus import SimpleDocTemplate
+
+import professional_pdf_generator as pdfgen
+from professional_pdf_generator import FlowableProfiler, OfflineCatalogGenerator, synthetic_catalog
+
+NESTED = {'EllipsizedTextBox', 'PaddedBox', 'InlineImageText', 'ItemNameTrailingLine', 'FittedImage'}
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    cat = synthetic_catalog(40, str(tmp_path / 'img'))
+    graph = pdfgen.synthetic_images(str(tmp_path / 'img'))['graph']
+    for key, _fn in pdfgen._SHAPE_ICON_FILES:   # span-tagged values draw an InlineImageText
+        monkeypatch.setitem(pdfgen.SHAPE_ICONS, key, graph)
+    return cat
+
+
+def calls(report):
+    out = {}
+    for row in report['by_class']:
+        out[row['class']] = out.get(row['class'], 0) + row['calls']
+    return out
+
+
+def test_profile_reports_nested_flowables(catalog, tmp_path):
+    gen = OfflineCatalogGenerator(catalog)
+    gen.generate_professional_pdf(str(tmp_path / 'out.pdf'), draft=True, profile=True)
+    report = gen.flowable_profile
+    assert NESTED <= set(calls(report))
+    for row in report['by_class']:
+        assert row['self_s'] <= row['time_s'] + 1e-9
+    assert gen.flowable_profiler is None
+
+
+def test_profile_charges_nested_tables_and_frames(catalog):
+    gen = OfflineCatalogGenerator(catalog)
+    merged, groups, _remarks = gen._collect_groups()
+    product = next(g['rows'][0] for g in groups if g['rows'])
+    profiler = gen.flowable_profiler = FlowableProfiler()
+    try:
+        container_h, row_h, _gap = gen._compute_layout(2, desired_gap_mm=0, boost_mm=4)
+        story = gen._product_block(product, container_h, row_h, 85 * mm, 80 * mm, detail_limit=16)
+        assert len(story) == 1   # one top-level Table, the rest is nested
+        doc = SimpleDocTemplate(io.BytesIO())
+        with profiler.active(doc):
+            doc.build(profiler.wrap(story))
+    finally:
+        gen.flowable_profiler = None
+    by_class = calls(profiler.report())
+    assert 'KeepInFrame' in by_class and 'PaddedBox' in by_class
+    drawn = {r['class']: r['calls'] for r in profiler.report()['by_class'] if r['method'] == 'drawOn'}
+    assert drawn['Table'] > 1   # the wrapper, its row, the spec cell and the spec card tables
@@ -0,0 +1,118 @@
+import threading
+
+import pytest
+
+from professional_pdf_generator import ProfessionalPDFGenerator, ShardedSheetReader
+
+
+class FakeWorksheet:
+    """Worksheet of `values` (header row first); get(a1) fails the first failures[a1] reads of a range."""
+    def __init__(self, title, values, row_count=None, col_count=3, failures=None, hold=None):
+        self.title, self.values = title, values
+        self.row_count = row_count or len(values)
+        self.col_count = col_count
+        self.failures = dict(failures or {})
+        self.hold = hold or {}   # a1 -> Event the read waits for
+        self.reads = []          # ranges in the order their reads finished
+
+    def get(self, a1):
+        if a1 in self.hold:
+            assert self.hold[a1].wait(5), f"{a1} never released"
+        if self.failures.get(a1):
+            self.failures[a1] -= 1
+            raise ConnectionError(f"{a1} unavailable")
+        start, end = (int(''.join(c for c in part if c.isdigit())) for part in a1.split(':'))
+        self.reads.append(a1)
+        out = [list(row) for row in self.values[start - 1:end]]
+        while out and not any(out[-1]):   # like the Sheets API, trailing blank rows are left out
+            out.pop()
+        return out
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheets):
+        self._worksheets = worksheets
+
+    def worksheets(self):
+        return list(self._worksheets)
+
+
+class FakeClient:
+    def __init__(self, worksheets):
+        self.spreadsheet = FakeSpreadsheet(worksheets)
+
+    def open_by_key(self, key):
+        return self.spreadsheet
+
+
+def generator(worksheets, reader):
+    gen = ProfessionalPDFGenerator.__new__(ProfessionalPDFGenerator)   # no Google auth
+    gen.gs_client, gen.spreadsheet_id, gen.sheet_reader = FakeClient(worksheets), 'sheet-id', reader
+    gen.keep_sheets, gen._sheet_snapshot = False, {}
+    return gen
+
+
+def rows(n):
+    return [['Code', 'Qty', 'Note']] + [[f'C{i}', str(i), f'note {i}'] for i in range(1, n + 1)]
+
+
+def test_ranges_cover_the_sheet_with_the_header_in_the_first_shard():
+    reader = ShardedSheetReader(shard_rows=2)
+    ws = FakeWorksheet('Master', rows(6), row_count=7, col_count=3)
+    assert reader._ranges(ws) == [('A1:C3', 3), ('A4:C5', 2), ('A6:C7', 2)]
+    assert ShardedSheetReader(shard_rows=10)._ranges(ws) == [('A1:C7', 7)]
+
+
+def test_records_keep_row_order_when_shards_complete_out_of_order():
+    first = threading.Event()
+    ws = FakeWorksheet('Master', rows(6), hold={'A1:C3': first})
+    reader = ShardedSheetReader(shard_rows=2, max_workers=3)
+    later = threading.Timer(0.2, first.set)   # set once the later shards are read
+    later.start()
+    records = list(reader.open([ws])['Master'])
+    later.join()
+    assert ws.reads[-1] == 'A1:C3'
+    assert [r['Code'] for r in records] == [f'C{i}' for i in range(1, 7)]
+
+
+def test_records_decode_header_numbers_and_blank_rows():
+    values = [['Code', 'Qty', 'Price'], ['A', '12', '1.5'], ['B'], [], ['C', '', 'x'], [], []]
+    ws = FakeWorksheet('Master', values)
+    records = list(ShardedSheetReader(shard_rows=2).open([ws])['Master'])
+    assert records == [{'Code': 'A', 'Qty': 12, 'Price': 1.5},
+                       {'Code': 'B', 'Qty': '', 'Price': ''},
+                       {'Code': '', 'Qty': '', 'Price': ''},
+                       {'Code': 'C', 'Qty': '', 'Price': 'x'}]
+    assert list(ShardedSheetReader.records(values)) == records
+
+
+def test_duplicate_headers_are_rejected():
+    ws = FakeWorksheet('Master', [['Code', 'Code'], ['a', 'b']], col_count=2)
+    with pytest.raises(ValueError, match='duplicates'):
+        list(ShardedSheetReader().open([ws])['Master'])
+
+
+def test_missing_sheet_reads_empty_and_the_others_still_load(caplog):
+    master = FakeWorksheet('Master', rows(3))
+    gen = generator([master], ShardedSheetReader())
+    out = gen._sheet_rows(['Master', 'Remark'])
+    assert [r['Code'] for r in out['Master']] == ['C1', 'C2', 'C3']
+    assert list(out['Remark']) == []
+    assert 'Remark' in caplog.text
+
+
+def test_failing_shard_is_retried():
+    ws = FakeWorksheet('Master', rows(6), failures={'A4:C5': 2})
+    reader = ShardedSheetReader(shard_rows=2, retries=2, backoff_s=0)
+    assert [r['Code'] for r in reader.open([ws])['Master']] == [f'C{i}' for i in range(1, 7)]
+    assert reader.requests == 5
+
+
+def test_failed_shard_fails_its_sheet_before_any_record(caplog):
+    broken = FakeWorksheet('Master', rows(6), failures={'A4:C5': 3})
+    remark = FakeWorksheet('Remark', rows(2))
+    reader = ShardedSheetReader(shard_rows=2, retries=2, backoff_s=0)
+    out = generator([broken, remark], reader)._sheet_rows(['Master', 'Remark'])
+    assert list(out['Master']) == []
+    assert [r['Code'] for r in out['Remark']] == ['C1', 'C2']
+    assert 'Master!A4:C5' in caplog.text
@@ -0,0 +1,82 @@
+import gc
+import io
+import weakref
+
+import pikepdf
+from reportlab.pdfgen import canvas
+
+from professional_pdf_generator import StreamingPDFDocument, _FlushedObject
+
+PAGES = 4
+
+
+def build(stream, on_flush=None):
+    """
+    PAGES pages with forward references: outline entries, links to the next page's bookmark
+    and a form drawn on page 0 but defined on page 1. on_flush(doc, n, page) runs after each
+    streamed page is flushed, with a weak reference to that page's PDFPage.
+    """
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, invariant=1)
+    doc = StreamingPDFDocument.adopt(c._doc, buf) if stream else c._doc
+    for n in range(PAGES):
+        c.bookmarkPage(f'p{n}')
+        c.addOutlineEntry(f'Page {n}', f'p{n}', level=0)
+        c.drawString(100, 750, f'page {n}')
+        c.linkAbsolute('next', f'p{(n + 1) % PAGES}', (100, 700, 200, 720))
+        if n == 1:
+            c.beginForm('Later')
+            c.drawString(50, 50, 'form text')
+            c.endForm()
+        if n <= 1:
+            c.doForm('Later')
+        c.showPage()
+        if stream:
+            page = weakref.ref(doc.Pages.pages[-1])
+            doc.flush_pages()
+            if on_flush:
+                gc.collect()
+                on_flush(doc, n, page)
+    c.save()
+    return buf.getvalue()
+
+
+def graph(data):
+    pdf = pikepdf.open(io.BytesIO(data))
+    pdf.check_pdf_syntax()
+    index = {p.objgen: i for i, p in enumerate(pdf.pages)}
+    pages = []
+    for p in pdf.pages:
+        links = [index[a.Dest[0].objgen] for a in p.get('/Annots', [])]
+        pages.append((p.Contents.read_bytes(), sorted(p.Resources.get('/XObject', {}).keys()), links))
+    with pdf.open_outline() as outline:
+        entries = [(item.title, index[item.destination[0].objgen]) for item in outline.root]
+    return pages, entries, len(pdf.objects)
+
+
+def test_streamed_output_matches_buffered_build():
+    streamed, buffered = graph(build(True)), graph(build(False))
+    assert len(streamed[0]) == PAGES
+    assert streamed == buffered
+    assert streamed[1] == [(f'Page {n}', n) for n in range(PAGES)]
+    assert [links for _c, _x, links in streamed[0]] == [[1], [2], [3], [0]]
+
+
+def test_flush_pages_releases_written_pages():
+    seen = []
+
+    def on_flush(doc, n, page):
+        pages = doc.Pages.pages
+        if n == 0:   # uses the form defined on page 1: stays in memory until then
+            assert page() is not None and not isinstance(pages[0], _FlushedObject)
+            assert doc._unresolved
+        else:        # written as soon as it is finished, page 0 along with page 1
+            assert page() is None
+            assert all(isinstance(p, _FlushedObject) for p in pages)
+        written = [doc.idToObject[doc.numberToId[num]] for num in range(1, doc._scanned + 1)
+                   if num not in doc._late and num not in doc._unresolved]
+        assert all(isinstance(obj, _FlushedObject) for obj in written)
+        seen.append(n)
+
+    build(True, on_flush)
+    assert seen == list(range(PAGES))
@@ -0,0 +1,152 @@
+import os
+import re
+import threading
+
+import pytest
+import requests
+
+from professional_pdf_generator import UPLOAD_QUANTUM, GrowingFile, ResumableUpload
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, body=None):
+        self.status_code, self.headers, self._body = status_code, headers or {}, body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}")
+
+
+class FakeDrive:
+    """Resumable upload endpoint: keeps at most `keep` bytes of each chunk, fails PUTs listed in `failures`."""
+    def __init__(self, keep=None, failures=(), offline=False):
+        self.stored = bytearray()
+        self.offline = offline
+        self.keep = keep
+        self.failures = list(failures)   # per data PUT: None (ok), an HTTP status, or an exception
+        self.puts = []                    # Content-Range of every PUT
+
+    def post(self, url, **kwargs):
+        return FakeResponse(200, {'Location': 'https://upload.test/session'})
+
+    def _range(self):
+        return {'Range': f'bytes=0-{len(self.stored) - 1}'} if self.stored else {}
+
+    def put(self, uri, data=b'', headers=None, **kwargs):
+        rng = headers['Content-Range']
+        self.puts.append(rng)
+        if self.offline:
+            raise requests.ConnectionError('unreachable')
+        m = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', rng)
+        if m is None:   # status query: bytes */total
+            total = rng.rsplit('/', 1)[1]
+            if total != '*' and len(self.stored) == int(total):
+                return FakeResponse(200, body={'id': 'file-1'})
+            return FakeResponse(308, self._range())
+        failure = self.failures.pop(0) if self.failures else None
+        if isinstance(failure, Exception):
+            raise failure
+        if failure is not None:
+            return FakeResponse(failure)
+        start, total = int(m.group(1)), m.group(3)
+        assert start == len(self.stored), "chunk does not continue the acknowledged bytes"
+        kept = data if self.keep is None else data[:self.keep]
+        self.stored += kept
+        if total != '*' and len(self.stored) == int(total):
+            return FakeResponse(200, body={'id': 'file-1'})
+        return FakeResponse(308, self._range())
+
+
+@pytest.fixture
+def payload():
+    return os.urandom(3 * UPLOAD_QUANTUM + 1234)
+
+
+def upload(session, stream, **kwargs):
+    up = ResumableUpload(session, {'name': 'catalog.pdf'}, chunk_size=UPLOAD_QUANTUM, backoff_s=0, **kwargs)
+    return up, up.upload(stream)
+
+
+class _Stream:
+    def __init__(self, data):
+        self.data, self.pos = data, 0
+
+    def read(self, n):
+        out = self.data[self.pos:self.pos + n]
+        self.pos += len(out)
+        return out
+
+
+def test_resumes_from_the_acknowledged_range(payload):
+    drive = FakeDrive(keep=1000)   # every 308 acknowledges less than was sent
+    up, result = upload(drive, _Stream(payload))
+    assert result == {'id': 'file-1'}
+    assert bytes(drive.stored) == payload
+    assert drive.puts[1] == f'bytes 1000-{1000 + UPLOAD_QUANTUM - 1}/*'
+    assert up.retries == 0
+
+
+def test_retries_after_status_query(payload):
+    drive = FakeDrive(failures=[None, 503, requests.ConnectionError('reset')])
+    up, result = upload(drive, _Stream(payload))
+    assert bytes(drive.stored) == payload
+    assert up.retries == 2
+    status_queries = [r for r in drive.puts if r.startswith('bytes */')]
+    assert status_queries == ['bytes */*', 'bytes */*']
+
+
+def test_gives_up_when_the_session_stays_unreachable(payload):
+    drive = FakeDrive(offline=True)
+    with pytest.raises(Exception, match='Upload failed after 2 retries at byte 0'):
+        upload(drive, _Stream(payload), max_retries=2)
+    assert len(drive.puts) == 5   # 3 attempts, a status query between each
+
+
+def test_growing_file_is_read_until_finished(tmp_path, payload):
+    path = str(tmp_path / 'out.pdf')
+    tail = GrowingFile(path, poll_s=0.001)
+
+    def writer():
+        with open(path, 'wb') as f:
+            for k in range(0, len(payload), 50000):
+                f.write(payload[k:k + 50000]); f.flush()
+        tail.finish()
+
+    t = threading.Thread(target=writer)
+    t.start()
+    drive = FakeDrive()
+    _, result = upload(drive, tail)
+    t.join()
+    tail.close()
+    assert result == {'id': 'file-1'}
+    assert bytes(drive.stored) == payload
+
+
+def test_aborted_writer_never_completes_the_upload(tmp_path, payload):
+    path = str(tmp_path / 'out.pdf')
+    with open(path, 'wb') as f:
+        f.write(payload[:2 * UPLOAD_QUANTUM])
+    tail = GrowingFile(path, poll_s=0.001)
+    drive, errors = FakeDrive(), []
+
+    def uploader():
+        try:
+            upload(drive, tail)
+        except Exception as e:
+            errors.append(e)
+
+    t = threading.Thread(target=uploader)
+    t.start()
+    while len(drive.stored) < UPLOAD_QUANTUM:   # the first chunk is out, the reader waits for more
+        threading.Event().wait(0.001)
+    tail.abort()
+    t.join(5)
+    tail.close()
+    assert not t.is_alive()
+    assert [str(e) for e in errors] == [f'{path}: writer aborted']
+    assert all(r.endswith('/*') for r in drive.puts)   # the total size is never declared
+    with pytest.raises(Exception, match='writer aborted'):
+        tail.read(1)
@@ -0,0 +1,127 @@
+import pandas as pd
+import pytest
+
+from professional_pdf_generator import SHEET_NAMES, CatalogWatcher, DriveRevisionSource
+
+
+class FakeSource:
+    """Revision and per-sheet tokens set by the test."""
+    def __init__(self):
+        self.rev = 'r1'
+        self.tokens = {name: 't1' for name in SHEET_NAMES}
+
+    def revision(self):
+        return self.rev
+
+    def sheet_tokens(self):
+        return dict(self.tokens)
+
+
+class FakeGenerator:
+    def __init__(self):
+        self.keep_sheets = False
+        self._sheet_snapshot = {}
+        self.fetched = []     # sheets each build had to fetch (not in the snapshot)
+        self.fail = False
+
+    def generate_professional_pdf(self, **kwargs):
+        missing = [name for name in SHEET_NAMES if name not in self._sheet_snapshot]
+        self.fetched.append(missing)
+        for name in missing:   # as _load_sheet does with keep_sheets on
+            self._sheet_snapshot[name] = pd.DataFrame({'v': [name]})
+        if self.fail:
+            raise RuntimeError('build failed')
+        return kwargs.get('output_path', 'out.pdf')
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def watch():
+    source, gen, clock = FakeSource(), FakeGenerator(), Clock()
+    watcher = CatalogWatcher(gen, source, build_kwargs={'output_path': 'w.pdf'}, debounce_s=60,
+                             clock=clock, sleep=lambda s: None)
+    return watcher, source, gen, clock
+
+
+def test_builds_once_at_start_then_waits_for_changes(watch):
+    watcher, source, gen, clock = watch
+    assert gen.keep_sheets is True
+    record = watcher.step()
+    assert record['changed'] == list(SHEET_NAMES) and record['output'] == 'w.pdf'
+    clock.now = 500
+    assert watcher.step() is None
+    assert gen.fetched == [list(SHEET_NAMES)]
+
+
+def test_edits_are_debounced_until_quiet(watch):
+    watcher, source, gen, clock = watch
+    watcher.step()
+    source.rev, source.tokens['Master'] = 'r2', 't2'
+    clock.now = 10
+    assert watcher.step() is None            # quiet period starts
+    source.rev = 'r3'
+    clock.now = 60
+    assert watcher.step() is None            # another edit restarts it (until 120)
+    clock.now = 119
+    assert watcher.step() is None
+    clock.now = 120
+    record = watcher.step()
+    assert record['revision'] == 'r3' and record['changed'] == ['Master']
+    assert gen.fetched[-1] == ['Master']   # only the changed sheet is fetched again
+
+
+def test_revision_without_content_change_builds_nothing(watch):
+    watcher, source, gen, clock = watch
+    watcher.step()
+    source.rev = 'r2'                         # e.g. a formatting edit
+    clock.now = 10; watcher.step()
+    clock.now = 100
+    assert watcher.step() is None
+    assert len(gen.fetched) == 1 and watcher.builds[-1]['revision'] == 'r1'
+
+
+def test_failed_build_is_retried_after_another_quiet_period(watch):
+    watcher, source, gen, clock = watch
+    watcher.step()
+    source.rev, source.tokens['Remark'] = 'r2', 't2'
+    clock.now = 10; watcher.step()
+    gen.fail, clock.now = True, 70
+    with pytest.raises(RuntimeError):
+        watcher.step()
+    gen.fail, clock.now = False, 100
+    assert watcher.step() is None
+    clock.now = 130
+    assert watcher.step()['changed'] == ['Remark']
+
+
+def test_changed_sheets_come_from_the_token_read():
+    values = {'Master': [['SKU', 'Price'], ['A1', '12'], ['A2', '']],
+              'Master_Resolved': [['SKU'], ['A1']], 'Master_With_Images': [['SKU']], 'Remark': []}
+    reads = []
+
+    class Book:
+        def values_batch_get(self, ranges):
+            reads.append(ranges)
+            return {'valueRanges': [{'values': values[r.strip("'")]} for r in ranges]}
+
+    class Client:
+        def open_by_key(self, key):
+            return Book()
+
+    gen = FakeGenerator()
+    gen.gs_client, gen.spreadsheet_id = Client(), 'sheet-id'
+    source = DriveRevisionSource(gen)
+    source.revision = lambda: 'r1'
+    watcher = CatalogWatcher(gen, source, debounce_s=0, clock=Clock(), sleep=lambda s: None)
+    watcher.step()
+    assert len(reads) == 1
+    assert gen.fetched == [['Master_With_Images', 'Remark']]   # sheets without rows: fetched as usual
+    master = gen._sheet_snapshot['Master']
+    assert master.to_dict('records') == [{'SKU': 'A1', 'Price': 12}, {'SKU': 'A2', 'Price': ''}]